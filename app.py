@@ -12,6 +12,7 @@ from routes import assignments as assignment_routes
 from routes import auth as auth_routes
 from routes import scenarios as scenario_routes
 from routes import theory as theory_routes
+from services import batch_generator, evaluation_queue
 
 
 def create_app() -> Flask:
@@ -19,9 +20,20 @@ def create_app() -> Flask:
     load_dotenv()
     database.init_database()
     database.seed_default_levels(CHAPTERS)
+    evaluation_queue.start_workers()
+    batch_generator.resume_stale_items()
 
     app = Flask(__name__, static_folder="static")
 
+    # 单次请求内的所有数据库访问共用一个连接
+    @app.before_request
+    def open_database_scope() -> None:
+        database.begin_request_scope()
+
+    @app.teardown_request
+    def close_database_scope(exc: BaseException | None) -> None:
+        database.end_request_scope()
+
     # 注册拆分后的业务蓝图，保持模块清晰职责
     app.register_blueprint(auth_routes.bp)
     app.register_blueprint(scenario_routes.bp)
@@ -29,6 +41,12 @@ def create_app() -> Flask:
     app.register_blueprint(admin_routes.bp)
     app.register_blueprint(theory_routes.bp)
 
+    @app.cli.command("rebuild-weekly-stats")
+    def rebuild_weekly_stats() -> None:
+        """按全部历史评估重建班级周趋势汇总表。"""
+        rows = database.rebuild_weekly_section_stats()
+        print(f"weekly_section_stats rebuilt: {rows} rows")
+
     @app.route("/")
     def index() -> str:
         """前端入口文件，由静态资源目录托管。"""
@@ -0,0 +1,84 @@
+"""对比逐字符循环与预编译正则两种中日韩字符检测实现的耗时。
+
+用法：
+
+    python benchmarks/cjk_detection.py --rounds 2000
+
+样本为 2–8 KB 的英文谈判回复：纯英文（需完整扫描，最常见也最慢）、末尾
+夹带一句中文、开头即出现中文三种情况，分别统计旧实现与
+``utils.language.contains_cjk`` 每次调用的平均微秒数。
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from typing import Callable, Dict, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.language import contains_cjk  # noqa: E402
+
+REPLY_SENTENCE = (
+    "Thank you for the revised quotation. We can accept USD 12.80 per unit FOB Ningbo for 2,000 units, "
+    "provided that shipment is made before 15 May and payment is by irrevocable L/C at sight. "
+)
+CJK_SENTENCE = "我们希望贵方在价格上再让步百分之三。"
+
+
+def legacy_contains_cjk(text: Optional[str]) -> bool:
+    """改造前的逐字符实现，仅用于对照。"""
+    if not isinstance(text, str):
+        return False
+    for char in text:
+        codepoint = ord(char)
+        if 0x3400 <= codepoint <= 0x4DBF:
+            return True
+        if 0x4E00 <= codepoint <= 0x9FFF:
+            return True
+        if 0x20000 <= codepoint <= 0x2A6DF:
+            return True
+    return False
+
+
+def build_samples() -> Dict[str, str]:
+    samples: Dict[str, str] = {}
+    for size_kb in (2, 4, 8):
+        body = (REPLY_SENTENCE * (size_kb * 1024 // len(REPLY_SENTENCE) + 1))[: size_kb * 1024]
+        samples[f"english-{size_kb}k"] = body
+        samples[f"cjk-tail-{size_kb}k"] = body + CJK_SENTENCE
+        samples[f"cjk-head-{size_kb}k"] = CJK_SENTENCE + body
+    return samples
+
+
+def time_per_call(func: Callable[[str], bool], text: str, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        func(text)
+    return (time.perf_counter() - started) / rounds * 1_000_000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    samples = build_samples()
+    for name, text in samples.items():
+        if legacy_contains_cjk(text) != contains_cjk(text):
+            raise SystemExit(f"Implementations disagree on sample {name}")
+
+    print(f"{'sample':<16}{'bytes':>8}{'legacy us':>12}{'regex us':>12}{'speedup':>10}")
+    for name, text in samples.items():
+        legacy = time_per_call(legacy_contains_cjk, text, args.rounds)
+        compiled = time_per_call(contains_cjk, text, args.rounds)
+        speedup = legacy / compiled if compiled else 0.0
+        print(
+            f"{name:<16}{len(text.encode('utf-8')):>8}{legacy:>12.2f}{compiled:>12.2f}{speedup:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
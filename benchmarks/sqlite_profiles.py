@@ -0,0 +1,111 @@
+"""对比不同 DATABASE_PROFILE 下聊天消息写入吞吐量的基准脚本。
+
+用法：
+
+    python benchmarks/sqlite_profiles.py --messages 2000 --threads 8
+
+脚本在临时目录中为每个存储画像建立独立数据库，模拟多名学生并发调用
+``database.add_message``，输出每秒写入条数与 p95 单条延迟。
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+def _prepare_sessions(count: int) -> List[str]:
+    session_ids: List[str] = []
+    with database.get_connection() as conn:
+        student_id = conn.execute("SELECT id FROM users WHERE username = '0000'").fetchone()["id"]
+    for _ in range(count):
+        session_id = uuid.uuid4().hex
+        database.create_session(
+            session_id=session_id,
+            user_id=student_id,
+            chapter_id="chapter-bench",
+            section_id="section-bench",
+            system_prompt="benchmark system prompt",
+            evaluation_prompt="benchmark evaluation prompt",
+            scenario={"scenario_title": "Benchmark", "scenario_summary": "Write throughput"},
+            expects_bargaining=False,
+            difficulty="balanced",
+        )
+        session_ids.append(session_id)
+    return session_ids
+
+
+def run_profile(profile: str, messages: int, threads: int) -> Dict[str, float]:
+    workdir = tempfile.mkdtemp(prefix=f"bench-{profile}-")
+    database.DATABASE_PATH = os.path.join(workdir, "bench.db")
+    database.DATABASE_PROFILE = profile
+    database.close_thread_connection()
+    database.init_database()
+    session_ids = _prepare_sessions(threads)
+
+    per_thread = max(messages // threads, 1)
+    latencies: List[float] = []
+    latencies_lock = threading.Lock()
+    content = "Could you confirm the FOB price for 2,000 units and the earliest shipment date? " * 4
+
+    def _worker(session_id: str) -> None:
+        local: List[float] = []
+        for index in range(per_thread):
+            started = time.perf_counter()
+            database.add_message(session_id, "user" if index % 2 == 0 else "assistant", content)
+            local.append(time.perf_counter() - started)
+        database.close_thread_connection()
+        with latencies_lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=_worker, args=(session_id,)) for session_id in session_ids]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    database.close_thread_connection()
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0
+    return {
+        "messages": float(len(latencies)),
+        "seconds": elapsed,
+        "per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p95_ms": p95 * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument(
+        "--profiles", nargs="*", default=sorted(database.STORAGE_PROFILES), help="要对比的存储画像"
+    )
+    args = parser.parse_args()
+
+    print(f"{'profile':<12}{'messages':>10}{'msg/s':>12}{'p50 ms':>10}{'p95 ms':>10}")
+    for profile in args.profiles:
+        result = run_profile(profile, args.messages, args.threads)
+        print(
+            f"{profile:<12}{int(result['messages']):>10}{result['per_second']:>12.1f}"
+            f"{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
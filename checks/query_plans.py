@@ -0,0 +1,199 @@
+"""检查 database.py 中读取函数的查询计划，发现全表扫描时以非零状态退出。
+
+用法：
+
+    python checks/query_plans.py
+
+脚本在临时数据库中写入少量样例数据，依次调用各读取函数并记录实际执行的
+SQL，再对每条语句执行 ``EXPLAIN QUERY PLAN``。除少量配置类小表外，
+出现 ``SCAN <table>``（未走索引）即视为回归。
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import sys
+import tempfile
+from typing import Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from levels import CHAPTERS  # noqa: E402
+
+# 关卡与理论配置表只有几十行，且层级接口本身就需要整表读取
+ALLOWED_SCAN_TABLES = {
+    "level_chapters",
+    "level_sections",
+    "theory_topics",
+    "theory_lessons",
+}
+
+SCAN_PATTERN = re.compile(r"\bSCAN (?:TABLE )?(\w+)(?: AS \w+)?(.*)$")
+
+
+def _seed() -> Dict[str, object]:
+    database.init_database()
+    database.seed_default_levels(CHAPTERS)
+    student = database.authenticate_user("0000", "0000")
+    teacher = database.authenticate_user("0001", "0001")
+    assert student and teacher
+    token = database.issue_auth_token(int(student["id"]))
+    chapter = CHAPTERS[1]
+    section = chapter.sections[0]
+    database.create_session(
+        session_id="plan-session",
+        user_id=int(student["id"]),
+        chapter_id=chapter.id,
+        section_id=section.id,
+        system_prompt="system",
+        evaluation_prompt="evaluation",
+        scenario={"scenario_title": "Plan", "scenario_summary": "Summary"},
+        expects_bargaining=True,
+        difficulty="balanced",
+    )
+    message_id = database.add_message("plan-session", "user", "hello")
+    database.save_evaluation(
+        "plan-session",
+        {"score": 80, "scoreLabel": "Good", "knowledgePoints": ["kp"], "actionItems": ["act"]},
+    )
+    database.enqueue_evaluation_job("plan-session", message_id)
+    blueprint = database.create_blueprint(int(teacher["id"]), "Plan", {"scenario_title": "Plan"})
+    generation_job = database.create_generation_job(
+        int(teacher["id"]),
+        [{"chapterId": chapter.id, "sectionId": section.id, "difficulty": "balanced"}],
+    )
+    database.create_assignment(
+        assignment_id="plan-assignment",
+        owner_id=int(teacher["id"]),
+        title="Plan",
+        scenario={"scenario_title": "Plan"},
+        conversation_prompt="c",
+        evaluation_prompt="e",
+        student_ids=[int(student["id"])],
+    )
+    return {
+        "student_id": int(student["id"]),
+        "teacher_id": int(teacher["id"]),
+        "token": token,
+        "chapter_id": chapter.id,
+        "section_id": section.id,
+        "blueprint_id": blueprint["id"],
+        "message_id": message_id,
+        "generation_job_id": generation_job["id"],
+        # 翻页语句与首页不同，单独检查带游标的查询计划
+        "time_cursor": database._encode_cursor("2999-01-01 00:00:00", "~"),
+        "name_cursor": database._encode_cursor(""),
+    }
+
+
+def _read_calls(ctx: Dict[str, object]) -> List[Tuple[str, Callable[[], object]]]:
+    return [
+        ("get_user_by_token", lambda: database.get_user_by_token(str(ctx["token"]))),
+        ("get_user", lambda: database.get_user(int(ctx["student_id"]))),
+        ("authenticate_user", lambda: database.authenticate_user("0000", "0000")),
+        ("get_session", lambda: database.get_session("plan-session")),
+        ("get_messages", lambda: database.get_messages("plan-session")),
+        ("get_messages_after", lambda: database.get_messages_after("plan-session", 0)),
+        ("get_latest_evaluation", lambda: database.get_latest_evaluation("plan-session")),
+        ("list_sessions_for_user", lambda: database.list_sessions_for_user(int(ctx["student_id"]))),
+        (
+            "list_sessions_for_user",
+            lambda: database.list_sessions_for_user(
+                int(ctx["student_id"]), cursor=ctx["time_cursor"], status="evaluated"
+            ),
+        ),
+        ("list_students_progress", database.list_students_progress),
+        (
+            "list_students_progress",
+            lambda: database.list_students_progress(cursor=ctx["name_cursor"], search="00"),
+        ),
+        ("get_student_detail", lambda: database.get_student_detail(int(ctx["student_id"]))),
+        ("list_level_victories", lambda: database.list_level_victories(int(ctx["student_id"]))),
+        ("get_student_dashboard", lambda: database.get_student_dashboard(int(ctx["student_id"]))),
+        ("list_blueprints", lambda: database.list_blueprints(int(ctx["teacher_id"]))),
+        ("get_blueprint", lambda: database.get_blueprint(str(ctx["blueprint_id"]))),
+        ("get_assignment", lambda: database.get_assignment("plan-assignment")),
+        (
+            "list_assignments_by_teacher",
+            lambda: database.list_assignments_by_teacher(int(ctx["teacher_id"])),
+        ),
+        (
+            "list_assignments_by_teacher",
+            lambda: database.list_assignments_by_teacher(
+                int(ctx["teacher_id"]), cursor=ctx["time_cursor"], date_from="2000-01-01"
+            ),
+        ),
+        (
+            "list_assignments_for_student",
+            lambda: database.list_assignments_for_student(int(ctx["student_id"])),
+        ),
+        (
+            "list_assignments_for_student",
+            lambda: database.list_assignments_for_student(
+                int(ctx["student_id"]), cursor=ctx["time_cursor"], status="pending"
+            ),
+        ),
+        (
+            "get_assignment_for_student",
+            lambda: database.get_assignment_for_student("plan-assignment", int(ctx["student_id"])),
+        ),
+        (
+            "get_evaluation_job",
+            lambda: database.get_evaluation_job("plan-session", int(ctx["message_id"])),
+        ),
+        (
+            "get_section_template",
+            lambda: database.get_section_template(str(ctx["chapter_id"]), str(ctx["section_id"])),
+        ),
+        (
+            "count_pooled_scenarios",
+            lambda: database.count_pooled_scenarios(str(ctx["section_id"]), "balanced", "hash"),
+        ),
+        ("get_generation_job", lambda: database.get_generation_job(str(ctx["generation_job_id"]))),
+        ("get_class_analytics", database.get_class_analytics),
+    ]
+
+
+def find_full_scans() -> List[Tuple[str, str, str]]:
+    """返回 (函数名, 表名, SQL) 列表，表示未命中索引的扫描。"""
+    ctx = _seed()
+    violations: List[Tuple[str, str, str]] = []
+    for name, call in _read_calls(ctx):
+        statements: List[str] = []
+        with database.get_connection() as conn:
+            conn.set_trace_callback(statements.append)
+            try:
+                call()
+            finally:
+                conn.set_trace_callback(None)
+            for sql in statements:
+                if not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+                    continue
+                for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall():
+                    match = SCAN_PATTERN.search(row["detail"])
+                    if not match:
+                        continue
+                    table, rest = match.group(1), match.group(2)
+                    if "INDEX" in rest or table in ALLOWED_SCAN_TABLES:
+                        continue
+                    violations.append((name, table, " ".join(sql.split())))
+    return violations
+
+
+def main() -> int:
+    workdir = tempfile.mkdtemp(prefix="query-plans-")
+    database.DATABASE_PATH = os.path.join(workdir, "plans.db")
+    database.close_thread_connection()
+    violations = find_full_scans()
+    if not violations:
+        print("OK: no full table scans in database read paths")
+        return 0
+    for name, table, sql in violations:
+        print(f"FULL SCAN in {name}: {table}\n    {sql[:200]}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
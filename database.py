@@ -2,278 +2,1021 @@
 
 from __future__ import annotations
 
+import base64
+import hashlib
 import json
 import os
 import secrets
 import sqlite3
+import threading
 import uuid
-from collections import defaultdict
+import zlib
+from collections import OrderedDict
 from contextlib import contextmanager
-from typing import Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
+from dataclasses import asdict
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
 
 if TYPE_CHECKING:  # pragma: no cover - typing only
     from levels import ChapterConfig
 
 from werkzeug.security import check_password_hash, generate_password_hash
 
+from utils.token_cache import token_cache
+
 
 DATABASE_PATH = os.getenv("DATABASE_PATH", os.path.join(os.path.dirname(__file__), "app.db"))
+DATABASE_CACHED_STATEMENTS = int(os.getenv("DATABASE_CACHED_STATEMENTS", "256"))
+DATABASE_REUSE_CONNECTIONS = os.getenv("DATABASE_REUSE_CONNECTIONS", "1").strip().lower() not in {
+    "0",
+    "false",
+    "no",
+    "off",
+}
+DATABASE_PROFILE = os.getenv("DATABASE_PROFILE", "durable").strip().lower()
+DATABASE_BUSY_TIMEOUT_MS = int(os.getenv("DATABASE_BUSY_TIMEOUT_MS", "5000"))
+PROMPT_BLOB_COMPRESSION = os.getenv("PROMPT_BLOB_COMPRESSION", "zlib").strip().lower()
+PROMPT_BLOB_MIN_COMPRESS_BYTES = int(os.getenv("PROMPT_BLOB_MIN_COMPRESS_BYTES", "512"))
+PROMPT_BLOB_CACHE_SIZE = int(os.getenv("PROMPT_BLOB_CACHE_SIZE", "512"))
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "50"))
+LIST_PAGE_SIZE_MAX = int(os.getenv("LIST_PAGE_SIZE_MAX", "200"))
 UNSET = object()
 
+# 每个连接建立时应用的 PRAGMA 组合；WAL 模式在首次迁移时一次性写入文件头
+STORAGE_PROFILES: Dict[str, Dict[str, object]] = {
+    "durable": {
+        "synchronous": "FULL",
+        "cache_size": -8000,
+        "temp_store": "DEFAULT",
+        "mmap_size": 0,
+    },
+    "throughput": {
+        "synchronous": "NORMAL",
+        "cache_size": -64000,
+        "temp_store": "MEMORY",
+        "mmap_size": 268435456,
+    },
+}
+
+_local = threading.local()
+# 提示词块按内容哈希寻址、写入后不再修改，解码结果可以在进程内安全复用
+_blob_cache: "OrderedDict[str, str]" = OrderedDict()
+_blob_cache_lock = threading.Lock()
+
+
+def get_storage_profile() -> Dict[str, object]:
+    return STORAGE_PROFILES.get(DATABASE_PROFILE) or STORAGE_PROFILES["durable"]
+
+
+def _open_connection() -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        DATABASE_PATH,
+        timeout=DATABASE_BUSY_TIMEOUT_MS / 1000,
+        cached_statements=DATABASE_CACHED_STATEMENTS,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute(f"PRAGMA busy_timeout = {int(DATABASE_BUSY_TIMEOUT_MS)}")
+    for pragma, value in get_storage_profile().items():
+        conn.execute(f"PRAGMA {pragma} = {value}")
+    return conn
+
+
+def _thread_connection() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.path == DATABASE_PATH and _local.pid == os.getpid():
+        return conn
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+    # fork 后继承的连接不可再用，直接丢弃并重新建立
+    conn = _open_connection()
+    _local.conn = conn
+    _local.path = DATABASE_PATH
+    _local.pid = os.getpid()
+    _local.depth = 0
+    return conn
+
+
+def close_thread_connection() -> None:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        return
+    if _local.pid == os.getpid():
+        conn.close()
+    _local.conn = None
+    _local.depth = 0
+
 
 @contextmanager
 def get_connection() -> Iterator[sqlite3.Connection]:
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON")
+    """获取当前线程复用的连接；嵌套调用共享同一连接，最外层退出时清理残留事务。"""
+    conn = _thread_connection()
+    depth = _local.depth
+    _local.depth = depth + 1
     try:
         yield conn
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
     finally:
-        conn.close()
+        _local.depth = depth
+        if depth == 0:
+            if conn.in_transaction:
+                conn.rollback()
+            if not DATABASE_REUSE_CONNECTIONS:
+                close_thread_connection()
 
 
-def init_database() -> None:
-    os.makedirs(os.path.dirname(DATABASE_PATH) or ".", exist_ok=True)
+@contextmanager
+def unit_of_work() -> Iterator[sqlite3.Connection]:
+    """请求级工作单元：块内调用的所有数据库函数共用一个连接。"""
     with get_connection() as conn:
-        conn.executescript(
-            """
-            PRAGMA journal_mode=WAL;
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL UNIQUE,
-                display_name TEXT,
-                password_hash TEXT NOT NULL,
-                role TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-
-            CREATE TABLE IF NOT EXISTS auth_tokens (
-                token TEXT PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
-            );
-
-            CREATE TABLE IF NOT EXISTS chat_sessions (
-                id TEXT PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                chapter_id TEXT NOT NULL,
-                section_id TEXT NOT NULL,
-                system_prompt TEXT NOT NULL,
-                evaluation_prompt TEXT NOT NULL,
-                scenario_json TEXT NOT NULL,
-                expects_bargaining INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
-            );
-
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id TEXT NOT NULL,
-                role TEXT NOT NULL,
-                content TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(session_id) REFERENCES chat_sessions(id) ON DELETE CASCADE
-            );
-
-            CREATE TABLE IF NOT EXISTS evaluations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id TEXT NOT NULL,
-                score REAL,
-                score_label TEXT,
-                commentary TEXT,
-                action_items_json TEXT,
-                knowledge_points_json TEXT,
-                bargaining_win_rate REAL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(session_id) REFERENCES chat_sessions(id) ON DELETE CASCADE
-            );
-
-            CREATE TABLE IF NOT EXISTS scenario_blueprints (
-                id TEXT PRIMARY KEY,
-                owner_id INTEGER NOT NULL,
-                title TEXT NOT NULL,
-                description TEXT,
-                difficulty TEXT DEFAULT 'balanced',
-                blueprint_json TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(owner_id) REFERENCES users(id) ON DELETE CASCADE
-            );
-
-            CREATE TABLE IF NOT EXISTS assignments (
-                id TEXT PRIMARY KEY,
-                owner_id INTEGER NOT NULL,
-                title TEXT NOT NULL,
-                description TEXT,
-                chapter_id TEXT,
-                section_id TEXT,
-                difficulty TEXT DEFAULT 'balanced',
-                scenario_json TEXT NOT NULL,
-                conversation_prompt TEXT NOT NULL,
-                evaluation_prompt TEXT NOT NULL,
-                blueprint_id TEXT,
-                due_at TIMESTAMP,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(owner_id) REFERENCES users(id) ON DELETE CASCADE,
-                FOREIGN KEY(chapter_id) REFERENCES level_chapters(id) ON DELETE SET NULL,
-                FOREIGN KEY(section_id) REFERENCES level_sections(id) ON DELETE SET NULL,
-                FOREIGN KEY(blueprint_id) REFERENCES scenario_blueprints(id) ON DELETE SET NULL
-            );
-
-            CREATE TABLE IF NOT EXISTS assignment_students (
-                assignment_id TEXT NOT NULL,
-                student_id INTEGER NOT NULL,
-                status TEXT DEFAULT 'pending',
-                session_id TEXT,
-                submitted_at TIMESTAMP,
-                PRIMARY KEY (assignment_id, student_id),
-                FOREIGN KEY(assignment_id) REFERENCES assignments(id) ON DELETE CASCADE,
-                FOREIGN KEY(student_id) REFERENCES users(id) ON DELETE CASCADE,
-                FOREIGN KEY(session_id) REFERENCES chat_sessions(id) ON DELETE SET NULL
-            );
-
-            CREATE TABLE IF NOT EXISTS level_chapters (
-                id TEXT PRIMARY KEY,
-                title TEXT NOT NULL,
-                description TEXT,
-                order_index INTEGER DEFAULT 0,
-                is_default INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-
-            CREATE TABLE IF NOT EXISTS level_sections (
-                id TEXT PRIMARY KEY,
-                chapter_id TEXT NOT NULL,
-                title TEXT NOT NULL,
-                description TEXT NOT NULL,
-                environment_prompt_template TEXT NOT NULL,
-                environment_user_message TEXT NOT NULL,
-                conversation_prompt_template TEXT NOT NULL,
-                evaluation_prompt_template TEXT NOT NULL,
-                expects_bargaining INTEGER DEFAULT 0,
-                order_index INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_default INTEGER DEFAULT 0,
-                FOREIGN KEY(chapter_id) REFERENCES level_chapters(id) ON DELETE CASCADE
-            );
-
-            CREATE TABLE IF NOT EXISTS theory_topics (
-                id TEXT PRIMARY KEY,
-                chapter_id TEXT NOT NULL,
-                code TEXT,
-                title TEXT NOT NULL,
-                summary TEXT,
-                order_index INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(chapter_id) REFERENCES level_chapters(id) ON DELETE CASCADE
-            );
-
-            CREATE TABLE IF NOT EXISTS theory_lessons (
-                id TEXT PRIMARY KEY,
-                topic_id TEXT NOT NULL,
-                code TEXT,
-                title TEXT NOT NULL,
-                content_html TEXT NOT NULL,
-                order_index INTEGER DEFAULT 0,
-                section_id TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(topic_id) REFERENCES theory_topics(id) ON DELETE CASCADE,
-                FOREIGN KEY(section_id) REFERENCES level_sections(id) ON DELETE SET NULL
-            );
-            """
+        yield conn
+
+
+def begin_request_scope() -> None:
+    _thread_connection()
+    _local.depth += 1
+
+
+def end_request_scope() -> None:
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid():
+        return
+    _local.depth = max(_local.depth - 1, 0)
+    if _local.depth == 0:
+        if conn.in_transaction:
+            conn.rollback()
+        if not DATABASE_REUSE_CONNECTIONS:
+            close_thread_connection()
+
+
+BASE_SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL UNIQUE,
+        display_name TEXT,
+        password_hash TEXT NOT NULL,
+        role TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS auth_tokens (
+        token TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+    );
+
+    CREATE TABLE IF NOT EXISTS chat_sessions (
+        id TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        chapter_id TEXT NOT NULL,
+        section_id TEXT NOT NULL,
+        system_prompt TEXT NOT NULL,
+        evaluation_prompt TEXT NOT NULL,
+        scenario_json TEXT NOT NULL,
+        expects_bargaining INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+    );
+
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(session_id) REFERENCES chat_sessions(id) ON DELETE CASCADE
+    );
+
+    CREATE TABLE IF NOT EXISTS evaluations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT NOT NULL,
+        score REAL,
+        score_label TEXT,
+        commentary TEXT,
+        action_items_json TEXT,
+        knowledge_points_json TEXT,
+        bargaining_win_rate REAL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(session_id) REFERENCES chat_sessions(id) ON DELETE CASCADE
+    );
+
+    CREATE TABLE IF NOT EXISTS scenario_blueprints (
+        id TEXT PRIMARY KEY,
+        owner_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        description TEXT,
+        difficulty TEXT DEFAULT 'balanced',
+        blueprint_json TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(owner_id) REFERENCES users(id) ON DELETE CASCADE
+    );
+
+    CREATE TABLE IF NOT EXISTS assignments (
+        id TEXT PRIMARY KEY,
+        owner_id INTEGER NOT NULL,
+        title TEXT NOT NULL,
+        description TEXT,
+        chapter_id TEXT,
+        section_id TEXT,
+        difficulty TEXT DEFAULT 'balanced',
+        scenario_json TEXT NOT NULL,
+        conversation_prompt TEXT NOT NULL,
+        evaluation_prompt TEXT NOT NULL,
+        blueprint_id TEXT,
+        due_at TIMESTAMP,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(owner_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY(chapter_id) REFERENCES level_chapters(id) ON DELETE SET NULL,
+        FOREIGN KEY(section_id) REFERENCES level_sections(id) ON DELETE SET NULL,
+        FOREIGN KEY(blueprint_id) REFERENCES scenario_blueprints(id) ON DELETE SET NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS assignment_students (
+        assignment_id TEXT NOT NULL,
+        student_id INTEGER NOT NULL,
+        status TEXT DEFAULT 'pending',
+        session_id TEXT,
+        submitted_at TIMESTAMP,
+        PRIMARY KEY (assignment_id, student_id),
+        FOREIGN KEY(assignment_id) REFERENCES assignments(id) ON DELETE CASCADE,
+        FOREIGN KEY(student_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY(session_id) REFERENCES chat_sessions(id) ON DELETE SET NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS level_chapters (
+        id TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        description TEXT,
+        order_index INTEGER DEFAULT 0,
+        is_default INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS level_sections (
+        id TEXT PRIMARY KEY,
+        chapter_id TEXT NOT NULL,
+        title TEXT NOT NULL,
+        description TEXT NOT NULL,
+        environment_prompt_template TEXT NOT NULL,
+        environment_user_message TEXT NOT NULL,
+        conversation_prompt_template TEXT NOT NULL,
+        evaluation_prompt_template TEXT NOT NULL,
+        expects_bargaining INTEGER DEFAULT 0,
+        order_index INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        is_default INTEGER DEFAULT 0,
+        FOREIGN KEY(chapter_id) REFERENCES level_chapters(id) ON DELETE CASCADE
+    );
+
+    CREATE TABLE IF NOT EXISTS theory_topics (
+        id TEXT PRIMARY KEY,
+        chapter_id TEXT NOT NULL,
+        code TEXT,
+        title TEXT NOT NULL,
+        summary TEXT,
+        order_index INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(chapter_id) REFERENCES level_chapters(id) ON DELETE CASCADE
+    );
+
+    CREATE TABLE IF NOT EXISTS theory_lessons (
+        id TEXT PRIMARY KEY,
+        topic_id TEXT NOT NULL,
+        code TEXT,
+        title TEXT NOT NULL,
+        content_html TEXT NOT NULL,
+        order_index INTEGER DEFAULT 0,
+        section_id TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(topic_id) REFERENCES theory_topics(id) ON DELETE CASCADE,
+        FOREIGN KEY(section_id) REFERENCES level_sections(id) ON DELETE SET NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS evaluation_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT NOT NULL,
+        message_id INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER DEFAULT 0,
+        result_json TEXT,
+        error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(session_id) REFERENCES chat_sessions(id) ON DELETE CASCADE
+    );
+"""
+
+
+def _table_columns(conn: sqlite3.Connection, table: str) -> set:
+    return {row["name"] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+
+
+def _migrate_base_tables(conn: sqlite3.Connection) -> None:
+    for statement in BASE_SCHEMA_SQL.split(";"):
+        if statement.strip():
+            conn.execute(statement)
+
+
+def _migrate_legacy_columns(conn: sqlite3.Connection) -> None:
+    # 兼容早期版本创建的数据库，这些列在最初的建表语句中并不存在
+    if "display_name" not in _table_columns(conn, "users"):
+        conn.execute("ALTER TABLE users ADD COLUMN display_name TEXT")
+
+    chat_columns = _table_columns(conn, "chat_sessions")
+    if "difficulty" not in chat_columns:
+        conn.execute(
+            "ALTER TABLE chat_sessions ADD COLUMN difficulty TEXT DEFAULT 'balanced'"
+        )
+    if "assignment_id" not in chat_columns:
+        conn.execute(
+            "ALTER TABLE chat_sessions ADD COLUMN assignment_id TEXT"
         )
-        conn.commit()
 
-    ensure_schema()
-    ensure_default_users()
+    chapter_columns = _table_columns(conn, "level_chapters")
+    if chapter_columns and "is_default" not in chapter_columns:
+        conn.execute(
+            "ALTER TABLE level_chapters ADD COLUMN is_default INTEGER DEFAULT 0"
+        )
+    if chapter_columns and "order_index" not in chapter_columns:
+        conn.execute(
+            "ALTER TABLE level_chapters ADD COLUMN order_index INTEGER DEFAULT 0"
+        )
+
+    section_columns = _table_columns(conn, "level_sections")
+    if section_columns and "is_default" not in section_columns:
+        conn.execute(
+            "ALTER TABLE level_sections ADD COLUMN is_default INTEGER DEFAULT 0"
+        )
+    if section_columns and "order_index" not in section_columns:
+        conn.execute(
+            "ALTER TABLE level_sections ADD COLUMN order_index INTEGER DEFAULT 0"
+        )
+
+
+def _migrate_base_indexes(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_level_chapters_order ON level_chapters(order_index, title)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_level_sections_chapter_order ON level_sections(chapter_id, order_index)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_assignments_owner ON assignments(owner_id, created_at)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_assignment_students_lookup ON assignment_students(assignment_id, student_id)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_assignment_students_session ON assignment_students(session_id)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_evaluation_jobs_status ON evaluation_jobs(status, id)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_evaluation_jobs_session ON evaluation_jobs(session_id, message_id)"
+    )
+
+
+def _migrate_latest_evaluation_columns(conn: sqlite3.Connection) -> None:
+    if "evaluation_count" in _table_columns(conn, "chat_sessions"):
+        return
+    # 最新评估结果冗余到会话行，列表查询无需再对 evaluations 做相关子查询
+    conn.execute("ALTER TABLE chat_sessions ADD COLUMN latest_score REAL")
+    conn.execute("ALTER TABLE chat_sessions ADD COLUMN latest_score_label TEXT")
+    conn.execute("ALTER TABLE chat_sessions ADD COLUMN latest_bargaining_win_rate REAL")
+    conn.execute("ALTER TABLE chat_sessions ADD COLUMN latest_evaluation_at TIMESTAMP")
+    conn.execute(
+        "ALTER TABLE chat_sessions ADD COLUMN evaluation_count INTEGER DEFAULT 0"
+    )
+    latest_clause = (
+        "SELECT {column} FROM evaluations e WHERE e.session_id = chat_sessions.id "
+        "ORDER BY e.created_at DESC, e.id DESC LIMIT 1"
+    )
+    conn.execute(
+        f"""
+        UPDATE chat_sessions
+        SET latest_score = ({latest_clause.format(column="e.score")}),
+            latest_score_label = ({latest_clause.format(column="e.score_label")}),
+            latest_bargaining_win_rate = (
+                {latest_clause.format(column="e.bargaining_win_rate")}
+            ),
+            latest_evaluation_at = ({latest_clause.format(column="e.created_at")}),
+            evaluation_count = (
+                SELECT COUNT(*) FROM evaluations e WHERE e.session_id = chat_sessions.id
+            )
+        WHERE EXISTS (SELECT 1 FROM evaluations e WHERE e.session_id = chat_sessions.id)
+        """
+    )
+
+
+def _migrate_hot_path_indexes(conn: sqlite3.Connection) -> None:
+    for statement in (
+        "CREATE INDEX IF NOT EXISTS idx_messages_session ON messages(session_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_evaluations_session_created ON evaluations(session_id, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_updated ON chat_sessions(user_id, updated_at)",
+        "CREATE INDEX IF NOT EXISTS idx_auth_tokens_user ON auth_tokens(user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_users_role_username ON users(role, username)",
+        "CREATE INDEX IF NOT EXISTS idx_blueprints_owner_updated ON scenario_blueprints(owner_id, updated_at)",
+        "CREATE INDEX IF NOT EXISTS idx_assignment_students_student ON assignment_students(student_id, assignment_id)",
+    ):
+        conn.execute(statement)
+
+
+def _migrate_app_meta(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS app_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
 
 
-def ensure_default_users() -> None:
+def _migrate_default_users(conn: sqlite3.Connection) -> None:
     defaults = [
         ("0000", "0000", "student"),
         ("0001", "0001", "teacher"),
     ]
-    with get_connection() as conn:
-        for username, password, role in defaults:
-            row = conn.execute(
-                "SELECT id FROM users WHERE username = ?", (username,)
-            ).fetchone()
-            if row:
-                continue
-            conn.execute(
-                "INSERT INTO users (username, display_name, password_hash, role) VALUES (?, ?, ?, ?)",
-                (username, username, generate_password_hash(password), role),
-            )
-        conn.commit()
+    for username, password, role in defaults:
+        row = conn.execute(
+            "SELECT id FROM users WHERE username = ?", (username,)
+        ).fetchone()
+        if row:
+            continue
+        conn.execute(
+            "INSERT INTO users (username, display_name, password_hash, role) VALUES (?, ?, ?, ?)",
+            (username, username, generate_password_hash(password), role),
+        )
 
 
-def ensure_schema() -> None:
-    with get_connection() as conn:
-        user_columns = {
-            row["name"] for row in conn.execute("PRAGMA table_info(users)").fetchall()
-        }
-        if "display_name" not in user_columns:
-            conn.execute("ALTER TABLE users ADD COLUMN display_name TEXT")
+def _migrate_scenario_pool(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS scenario_pool (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            section_id TEXT NOT NULL,
+            difficulty TEXT NOT NULL,
+            template_hash TEXT NOT NULL,
+            scenario_json TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(section_id) REFERENCES level_sections(id) ON DELETE CASCADE
+        )
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_scenario_pool_lookup ON scenario_pool(section_id, difficulty, template_hash, id)"
+    )
 
-        chat_columns = {
-            row["name"] for row in conn.execute("PRAGMA table_info(chat_sessions)").fetchall()
-        }
-        if "difficulty" not in chat_columns:
-            conn.execute(
-                "ALTER TABLE chat_sessions ADD COLUMN difficulty TEXT DEFAULT 'balanced'"
-            )
-        if "assignment_id" not in chat_columns:
-            conn.execute(
-                "ALTER TABLE chat_sessions ADD COLUMN assignment_id TEXT"
-            )
 
-        chapter_columns = {
-            row["name"] for row in conn.execute("PRAGMA table_info(level_chapters)").fetchall()
-        }
-        if chapter_columns and "is_default" not in chapter_columns:
-            conn.execute(
-                "ALTER TABLE level_chapters ADD COLUMN is_default INTEGER DEFAULT 0"
-            )
-        if chapter_columns and "order_index" not in chapter_columns:
-            conn.execute(
-                "ALTER TABLE level_chapters ADD COLUMN order_index INTEGER DEFAULT 0"
-            )
+def _migrate_evaluation_fingerprint(conn: sqlite3.Connection) -> None:
+    columns = _table_columns(conn, "evaluations")
+    if "last_message_id" not in columns:
+        conn.execute("ALTER TABLE evaluations ADD COLUMN last_message_id INTEGER")
+    if "transcript_hash" not in columns:
+        conn.execute("ALTER TABLE evaluations ADD COLUMN transcript_hash TEXT")
 
-        section_columns = {
-            row["name"] for row in conn.execute("PRAGMA table_info(level_sections)").fetchall()
-        }
-        if section_columns and "is_default" not in section_columns:
-            conn.execute(
-                "ALTER TABLE level_sections ADD COLUMN is_default INTEGER DEFAULT 0"
-            )
-        if section_columns and "order_index" not in section_columns:
-            conn.execute(
-                "ALTER TABLE level_sections ADD COLUMN order_index INTEGER DEFAULT 0"
-            )
+
+def _migrate_context_summary(conn: sqlite3.Connection) -> None:
+    columns = _table_columns(conn, "chat_sessions")
+    if "context_summary" not in columns:
+        conn.execute("ALTER TABLE chat_sessions ADD COLUMN context_summary TEXT")
+    if "context_summary_upto" not in columns:
         conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_level_chapters_order ON level_chapters(order_index, title)"
+            "ALTER TABLE chat_sessions ADD COLUMN context_summary_upto INTEGER DEFAULT 0"
         )
-        conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_level_sections_chapter_order ON level_sections(chapter_id, order_index)"
+
+
+def _migrate_llm_usage(conn: sqlite3.Connection) -> None:
+    # 不对会话建外键：会话删除后成本记录仍需保留
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS llm_usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT,
+            purpose TEXT NOT NULL,
+            chapter_id TEXT,
+            section_id TEXT,
+            difficulty TEXT,
+            model TEXT NOT NULL,
+            prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            completion_tokens INTEGER NOT NULL DEFAULT 0,
+            estimated_prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            is_estimated INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-        conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_assignments_owner ON assignments(owner_id, created_at)"
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_llm_usage_created ON llm_usage(created_at)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_llm_usage_session ON llm_usage(session_id)"
+    )
+
+
+def _migrate_generation_jobs(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS generation_jobs (
+            id TEXT PRIMARY KEY,
+            owner_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            total INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(owner_id) REFERENCES users(id) ON DELETE CASCADE
         )
-        conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_assignment_students_lookup ON assignment_students(assignment_id, student_id)"
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS generation_job_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id TEXT NOT NULL,
+            chapter_id TEXT NOT NULL,
+            section_id TEXT NOT NULL,
+            difficulty TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            blueprint_id TEXT,
+            error TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(job_id) REFERENCES generation_jobs(id) ON DELETE CASCADE
+        )
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_generation_job_items_job ON generation_job_items(job_id, id)"
+    )
+
+
+# 由明细行重新聚合汇总表的 SELECT，迁移回填与删除会话后的局部重算共用
+_STUDENT_KNOWLEDGE_ROLLUP_SQL = """
+    SELECT f.user_id, f.knowledge_point, COUNT(*), COALESCE(SUM(f.score_value), 0),
+           COUNT(f.score_value),
+           (
+               SELECT latest.score_value FROM evaluation_knowledge_points latest
+               WHERE latest.user_id = f.user_id AND latest.knowledge_point = f.knowledge_point
+               ORDER BY latest.created_at DESC, latest.evaluation_id DESC
+               LIMIT 1
+           ),
+           MAX(f.created_at)
+    FROM evaluation_knowledge_points f
+"""
+_CLASS_KNOWLEDGE_ROLLUP_SQL = """
+    SELECT f.knowledge_point, COUNT(*), COALESCE(SUM(f.score_value), 0), COUNT(f.score_value)
+    FROM evaluation_knowledge_points f
+"""
+_CLASS_ACTION_ROLLUP_SQL = """
+    SELECT f.action_item, COUNT(*)
+    FROM evaluation_action_items f
+"""
+
+
+def _migrate_evaluation_facets(conn: sqlite3.Connection) -> None:
+    # 评估中的知识点与改进建议拆成明细行，并维护学生与班级两级汇总
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS evaluation_knowledge_points (
+            evaluation_id INTEGER NOT NULL,
+            session_id TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            knowledge_point TEXT NOT NULL,
+            score_value REAL,
+            created_at TIMESTAMP,
+            FOREIGN KEY(evaluation_id) REFERENCES evaluations(id) ON DELETE CASCADE
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS evaluation_action_items (
+            evaluation_id INTEGER NOT NULL,
+            session_id TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            action_item TEXT NOT NULL,
+            FOREIGN KEY(evaluation_id) REFERENCES evaluations(id) ON DELETE CASCADE
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS student_knowledge_stats (
+            user_id INTEGER NOT NULL,
+            knowledge_point TEXT NOT NULL,
+            evaluation_count INTEGER NOT NULL DEFAULT 0,
+            score_sum REAL NOT NULL DEFAULT 0,
+            score_count INTEGER NOT NULL DEFAULT 0,
+            latest_score REAL,
+            latest_at TIMESTAMP,
+            PRIMARY KEY(user_id, knowledge_point)
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS class_knowledge_stats (
+            knowledge_point TEXT PRIMARY KEY,
+            evaluation_count INTEGER NOT NULL DEFAULT 0,
+            score_sum REAL NOT NULL DEFAULT 0,
+            score_count INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS class_action_stats (
+            action_item TEXT PRIMARY KEY,
+            evaluation_count INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    for statement in (
+        "CREATE INDEX IF NOT EXISTS idx_eval_kp_evaluation ON evaluation_knowledge_points(evaluation_id)",
+        "CREATE INDEX IF NOT EXISTS idx_eval_kp_session ON evaluation_knowledge_points(session_id)",
+        "CREATE INDEX IF NOT EXISTS idx_eval_kp_user_point ON evaluation_knowledge_points(user_id, knowledge_point)",
+        "CREATE INDEX IF NOT EXISTS idx_eval_kp_point ON evaluation_knowledge_points(knowledge_point)",
+        "CREATE INDEX IF NOT EXISTS idx_eval_action_evaluation ON evaluation_action_items(evaluation_id)",
+        "CREATE INDEX IF NOT EXISTS idx_eval_action_session ON evaluation_action_items(session_id)",
+        "CREATE INDEX IF NOT EXISTS idx_eval_action_item ON evaluation_action_items(action_item)",
+    ):
+        conn.execute(statement)
+
+    # 回填历史评估：一次性展开 JSON，之后由 save_evaluation 增量维护
+    conn.execute(
+        """
+        INSERT INTO evaluation_knowledge_points (
+            evaluation_id, session_id, user_id, knowledge_point, score_value, created_at
+        )
+        SELECT e.id, e.session_id, s.user_id, CAST(kp.value AS TEXT),
+               COALESCE(e.score, e.bargaining_win_rate), e.created_at
+        FROM evaluations e
+        JOIN chat_sessions s ON s.id = e.session_id
+        JOIN json_each(e.knowledge_points_json) AS kp
+        WHERE kp.value IS NOT NULL AND kp.value != ''
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO evaluation_action_items (evaluation_id, session_id, user_id, action_item)
+        SELECT e.id, e.session_id, s.user_id, CAST(item.value AS TEXT)
+        FROM evaluations e
+        JOIN chat_sessions s ON s.id = e.session_id
+        JOIN json_each(e.action_items_json) AS item
+        WHERE item.value IS NOT NULL AND item.value != ''
+        """
+    )
+    conn.execute(
+        f"""
+        INSERT INTO student_knowledge_stats (
+            user_id, knowledge_point, evaluation_count, score_sum, score_count, latest_score, latest_at
+        )
+        {_STUDENT_KNOWLEDGE_ROLLUP_SQL}
+        GROUP BY f.user_id, f.knowledge_point
+        """
+    )
+    conn.execute(
+        f"""
+        INSERT INTO class_knowledge_stats (knowledge_point, evaluation_count, score_sum, score_count)
+        {_CLASS_KNOWLEDGE_ROLLUP_SQL}
+        GROUP BY f.knowledge_point
+        """
+    )
+    conn.execute(
+        f"""
+        INSERT INTO class_action_stats (action_item, evaluation_count)
+        {_CLASS_ACTION_ROLLUP_SQL}
+        GROUP BY f.action_item
+        """
+    )
+
+
+# 迁移 14 早于标题列（迁移 15）执行，回填时只能从场景 JSON 中读取标题
+_LEGACY_SCENARIO_TITLE_SQL = "json_extract(s.scenario_json, '$.scenario_title')"
+
+_WEEKLY_SECTION_ROLLUP_SQL = """
+    SELECT s.chapter_id, s.section_id, strftime('%Y-%W', e.created_at) AS week,
+           {title},
+           COUNT(*), COALESCE(SUM(e.score), 0), COUNT(e.score),
+           COALESCE(SUM(e.bargaining_win_rate), 0), COUNT(e.bargaining_win_rate)
+    FROM evaluations e
+    JOIN chat_sessions s ON s.id = e.session_id
+"""
+
+
+def _migrate_weekly_section_stats(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS weekly_section_stats (
+            chapter_id TEXT NOT NULL,
+            section_id TEXT NOT NULL,
+            week TEXT NOT NULL,
+            section_title TEXT,
+            sample_size INTEGER NOT NULL DEFAULT 0,
+            score_sum REAL NOT NULL DEFAULT 0,
+            score_count INTEGER NOT NULL DEFAULT 0,
+            bargaining_sum REAL NOT NULL DEFAULT 0,
+            bargaining_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY(chapter_id, section_id, week)
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_weekly_section_stats_week
+        ON weekly_section_stats(week DESC, chapter_id, section_id)
+        """
+    )
+    _fill_weekly_section_stats(conn, _LEGACY_SCENARIO_TITLE_SQL)
+
+
+def _weekly_section_rollup_sql(title_sql: str = "s.scenario_title") -> str:
+    return _WEEKLY_SECTION_ROLLUP_SQL.format(title=title_sql)
+
+
+def _fill_weekly_section_stats(
+    conn: sqlite3.Connection, title_sql: str = "s.scenario_title"
+) -> None:
+    conn.execute("DELETE FROM weekly_section_stats")
+    conn.execute(
+        f"""
+        INSERT INTO weekly_section_stats (
+            chapter_id, section_id, week, section_title, sample_size,
+            score_sum, score_count, bargaining_sum, bargaining_count
+        )
+        {_weekly_section_rollup_sql(title_sql)}
+        GROUP BY s.chapter_id, s.section_id, week
+        """
+    )
+
+
+def _migrate_scenario_list_columns(conn: sqlite3.Connection) -> None:
+    # 列表页只需要标题与摘要，单独存列后无需再解析整段场景 JSON
+    columns = _table_columns(conn, "chat_sessions")
+    if "scenario_title" not in columns:
+        conn.execute("ALTER TABLE chat_sessions ADD COLUMN scenario_title TEXT")
+    if "scenario_summary" not in columns:
+        conn.execute("ALTER TABLE chat_sessions ADD COLUMN scenario_summary TEXT")
+    conn.execute(
+        """
+        UPDATE chat_sessions
+        SET scenario_title = json_extract(scenario_json, '$.scenario_title'),
+            scenario_summary = json_extract(scenario_json, '$.scenario_summary')
+        WHERE json_valid(scenario_json)
+        """
+    )
+
+
+def _encode_blob(text: str) -> Tuple[str, bytes]:
+    raw = text.encode("utf-8")
+    if PROMPT_BLOB_COMPRESSION == "zlib" and len(raw) >= PROMPT_BLOB_MIN_COMPRESS_BYTES:
+        packed = zlib.compress(raw, 6)
+        if len(packed) < len(raw):
+            return "zlib", packed
+    return "plain", raw
+
+
+def _decode_blob(encoding: str, content: bytes) -> str:
+    if encoding == "zlib":
+        return zlib.decompress(content).decode("utf-8")
+    return bytes(content).decode("utf-8")
+
+
+def _store_blob(conn: sqlite3.Connection, text: str) -> str:
+    """写入提示词块并返回其哈希，相同内容只保存一份。"""
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    encoding, content = _encode_blob(text)
+    conn.execute(
+        "INSERT OR IGNORE INTO prompt_blobs (hash, encoding, content, size) VALUES (?, ?, ?, ?)",
+        (digest, encoding, sqlite3.Binary(content), len(text)),
+    )
+    return digest
+
+
+def _load_blobs(conn: sqlite3.Connection, digests: List[str]) -> Dict[str, str]:
+    found: Dict[str, str] = {}
+    missing: List[str] = []
+    with _blob_cache_lock:
+        for digest in dict.fromkeys(digests):
+            text = _blob_cache.get(digest)
+            if text is None:
+                missing.append(digest)
+            else:
+                _blob_cache.move_to_end(digest)
+                found[digest] = text
+    if missing:
+        placeholders = ", ".join("?" for _ in missing)
+        rows = conn.execute(
+            f"SELECT hash, encoding, content FROM prompt_blobs WHERE hash IN ({placeholders})",
+            missing,
+        ).fetchall()
+        loaded = {row["hash"]: _decode_blob(row["encoding"], row["content"]) for row in rows}
+        found.update(loaded)
+        if PROMPT_BLOB_CACHE_SIZE > 0:
+            with _blob_cache_lock:
+                _blob_cache.update(loaded)
+                while len(_blob_cache) > PROMPT_BLOB_CACHE_SIZE:
+                    _blob_cache.popitem(last=False)
+    return found
+
+
+def _migrate_prompt_blobs(conn: sqlite3.Connection) -> None:
+    # 会话的提示词与场景改为引用去重后的内容块，原列清空但保留以兼容旧表结构
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS prompt_blobs (
+            hash TEXT PRIMARY KEY,
+            encoding TEXT NOT NULL DEFAULT 'plain',
+            content BLOB NOT NULL,
+            size INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    columns = _table_columns(conn, "chat_sessions")
+    for column in ("system_prompt_hash", "evaluation_prompt_hash", "scenario_hash"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE chat_sessions ADD COLUMN {column} TEXT")
+
+    # 先取出 ID 再分批搬运，避免边遍历边更新同一张表
+    session_ids = [
+        row["id"]
+        for row in conn.execute("SELECT id FROM chat_sessions WHERE scenario_hash IS NULL")
+    ]
+    for start in range(0, len(session_ids), 500):
+        batch = session_ids[start : start + 500]
+        placeholders = ", ".join("?" for _ in batch)
+        rows = conn.execute(
+            f"""
+            SELECT id, system_prompt, evaluation_prompt, scenario_json
+            FROM chat_sessions WHERE id IN ({placeholders})
+            """,
+            batch,
+        ).fetchall()
+        conn.executemany(
+            """
+            UPDATE chat_sessions
+            SET system_prompt_hash = ?, evaluation_prompt_hash = ?, scenario_hash = ?,
+                system_prompt = '', evaluation_prompt = '', scenario_json = ''
+            WHERE id = ?
+            """,
+            [
+                (
+                    _store_blob(conn, row["system_prompt"] or ""),
+                    _store_blob(conn, row["evaluation_prompt"] or ""),
+                    _store_blob(conn, row["scenario_json"] or "{}"),
+                    row["id"],
+                )
+                for row in rows
+            ],
+        )
+
+
+def _migrate_keyset_indexes(conn: sqlite3.Connection) -> None:
+    # 列表按 (时间, id) 翻页，索引需带上 id 作为同一时间戳内的次序；旧索引是其前缀，直接替换
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_updated_id "
+        "ON chat_sessions(user_id, updated_at, id)"
+    )
+    conn.execute("DROP INDEX IF EXISTS idx_chat_sessions_user_updated")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_assignments_owner_created_id "
+        "ON assignments(owner_id, created_at, id)"
+    )
+    conn.execute("DROP INDEX IF EXISTS idx_assignments_owner")
+
+
+def _migrate_scenario_pool_reservations(conn: sqlite3.Connection) -> None:
+    # 补货任务先在库中登记预留，多个进程按同一份“库存 + 预留”计算缺口
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS scenario_pool_reservations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            section_id TEXT NOT NULL,
+            difficulty TEXT NOT NULL,
+            template_hash TEXT NOT NULL,
+            reserved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_scenario_pool_reservations_lookup "
+        "ON scenario_pool_reservations(section_id, difficulty, template_hash, reserved_at)"
+    )
+
+
+def _migrate_class_stats_rank_indexes(conn: sqlite3.Connection) -> None:
+    # 班级分析按出现次数取前 N 项，索引顺序与 ORDER BY 一致即可按索引读取前几行，无需整表排序
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_class_knowledge_stats_rank "
+        "ON class_knowledge_stats(evaluation_count DESC, knowledge_point)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_class_action_stats_rank "
+        "ON class_action_stats(evaluation_count DESC, action_item)"
+    )
+
+
+# 有序迁移登记表：只追加、不修改已发布的步骤，启动时仅执行尚未应用的版本
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "base_tables", _migrate_base_tables),
+    (2, "legacy_columns", _migrate_legacy_columns),
+    (3, "base_indexes", _migrate_base_indexes),
+    (4, "latest_evaluation_columns", _migrate_latest_evaluation_columns),
+    (5, "hot_path_indexes", _migrate_hot_path_indexes),
+    (6, "app_meta", _migrate_app_meta),
+    (7, "default_users", _migrate_default_users),
+    (8, "scenario_pool", _migrate_scenario_pool),
+    (9, "evaluation_fingerprint", _migrate_evaluation_fingerprint),
+    (10, "context_summary", _migrate_context_summary),
+    (11, "llm_usage", _migrate_llm_usage),
+    (12, "generation_jobs", _migrate_generation_jobs),
+    (13, "evaluation_facets", _migrate_evaluation_facets),
+    (14, "weekly_section_stats", _migrate_weekly_section_stats),
+    (15, "scenario_list_columns", _migrate_scenario_list_columns),
+    (16, "prompt_blobs", _migrate_prompt_blobs),
+    (17, "keyset_indexes", _migrate_keyset_indexes),
+    (18, "scenario_pool_reservations", _migrate_scenario_pool_reservations),
+    (19, "class_stats_rank_indexes", _migrate_class_stats_rank_indexes),
+]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    try:
+        row = conn.execute("SELECT MAX(version) AS version FROM schema_version").fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return int(row["version"] or 0)
+
+
+def init_database() -> None:
+    os.makedirs(os.path.dirname(DATABASE_PATH) or ".", exist_ok=True)
+    ensure_schema()
+
+
+def ensure_schema() -> None:
+    with get_connection() as conn:
+        if get_schema_version(conn) >= MIGRATIONS[-1][0]:
+            return
+
+        conn.execute("PRAGMA journal_mode=WAL")
         conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_assignment_students_session ON assignment_students(session_id)"
+            """
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
         )
         conn.commit()
 
+        for version, name, migrate in MIGRATIONS:
+            # 写锁内复查版本，多个 worker 同时启动时每个步骤只会执行一次
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if get_schema_version(conn) >= version:
+                    conn.rollback()
+                    continue
+                migrate(conn)
+                conn.execute(
+                    "INSERT INTO schema_version (version, name) VALUES (?, ?)",
+                    (version, name),
+                )
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+
+def _get_meta(conn: sqlite3.Connection, key: str) -> Optional[str]:
+    row = conn.execute("SELECT value FROM app_meta WHERE key = ?", (key,)).fetchone()
+    return row["value"] if row else None
+
+
+def _set_meta(conn: sqlite3.Connection, key: str, value: str) -> None:
+    conn.execute(
+        """
+        INSERT INTO app_meta (key, value) VALUES (?, ?)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP
+        """,
+        (key, value),
+    )
+
 
 def _next_order_index(
     conn: sqlite3.Connection, table: str, where_clause: str = "", params: Tuple[object, ...] = ()
@@ -286,8 +1029,37 @@ def _next_order_index(
     return int(max_value) + 1
 
 
+def _levels_content_hash(chapters: "List[ChapterConfig]") -> str:
+    payload = json.dumps([asdict(chapter) for chapter in chapters], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _default_levels_present(conn: sqlite3.Connection, chapters: "List[ChapterConfig]") -> bool:
+    chapter_ids = [chapter.id for chapter in chapters]
+    section_ids = [section.id for chapter in chapters for section in chapter.sections]
+    chapter_count = 0
+    if chapter_ids:
+        chapter_count = conn.execute(
+            f"SELECT COUNT(*) FROM level_chapters WHERE id IN ({', '.join('?' * len(chapter_ids))})",
+            chapter_ids,
+        ).fetchone()[0]
+    section_count = 0
+    if section_ids:
+        section_count = conn.execute(
+            f"SELECT COUNT(*) FROM level_sections WHERE id IN ({', '.join('?' * len(section_ids))})",
+            section_ids,
+        ).fetchone()[0]
+    return chapter_count == len(chapter_ids) and section_count == len(section_ids)
+
+
 def seed_default_levels(chapters: "List[ChapterConfig]") -> None:
+    content_hash = _levels_content_hash(chapters)
     with get_connection() as conn:
+        # 预置关卡内容未变化且各行仍在时跳过逐条比对；教师删除过的预置关卡照常在启动时补回
+        if _get_meta(conn, "default_levels_hash") == content_hash and _default_levels_present(
+            conn, chapters
+        ):
+            return
         for chapter_order, chapter in enumerate(chapters, start=1):
             chapter_row = conn.execute(
                 "SELECT id, order_index FROM level_chapters WHERE id = ?", (chapter.id,)
@@ -349,6 +1121,7 @@ def seed_default_levels(chapters: "List[ChapterConfig]") -> None:
                             "UPDATE level_sections SET order_index = ? WHERE id = ?",
                             (section_order, section.id),
                         )
+        _set_meta(conn, "default_levels_hash", content_hash)
         conn.commit()
 
 
@@ -668,6 +1441,9 @@ def update_section(
                 f"UPDATE level_sections SET {', '.join(updates)}, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
                 tuple(params),
             )
+            if environment_prompt_template is not None or environment_user_message is not None:
+                # 生成模板变化后，预生成的场景不再代表当前配置
+                conn.execute("DELETE FROM scenario_pool WHERE section_id = ?", (section_id,))
             conn.commit()
 
     return get_section(section_id)
@@ -1159,6 +1935,7 @@ def issue_auth_token(user_id: int) -> str:
             "INSERT INTO auth_tokens (token, user_id) VALUES (?, ?)", (token, user_id)
         )
         conn.commit()
+    token_cache.invalidate_user(user_id)
     return token
 
 
@@ -1201,6 +1978,11 @@ def get_user(user_id: int) -> Optional[Dict[str, object]]:
         }
 
 
+def _scenario_text(scenario: Dict[str, object], key: str) -> Optional[str]:
+    value = scenario.get(key)
+    return value if isinstance(value, str) else None
+
+
 def create_session(
     session_id: str,
     user_id: int,
@@ -1219,19 +2001,22 @@ def create_session(
             """
             INSERT INTO chat_sessions (
                 id, user_id, chapter_id, section_id, system_prompt,
-                evaluation_prompt, scenario_json, expects_bargaining, difficulty,
-                assignment_id
+                evaluation_prompt, scenario_json, system_prompt_hash,
+                evaluation_prompt_hash, scenario_hash, scenario_title, scenario_summary,
+                expects_bargaining, difficulty, assignment_id
             )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            VALUES (?, ?, ?, ?, '', '', '', ?, ?, ?, ?, ?, ?, ?, ?)
             """,
             (
                 session_id,
                 user_id,
                 chapter_id,
                 section_id,
-                system_prompt,
-                evaluation_prompt,
-                json.dumps(scenario, ensure_ascii=False),
+                _store_blob(conn, system_prompt or ""),
+                _store_blob(conn, evaluation_prompt or ""),
+                _store_blob(conn, json.dumps(scenario, ensure_ascii=False)),
+                _scenario_text(scenario, "scenario_title"),
+                _scenario_text(scenario, "scenario_summary"),
                 1 if expects_bargaining else 0,
                 difficulty,
                 assignment_id,
@@ -1240,9 +2025,9 @@ def create_session(
         conn.commit()
 
 
-def add_message(session_id: str, role: str, content: str) -> None:
+def add_message(session_id: str, role: str, content: str) -> int:
     with get_connection() as conn:
-        conn.execute(
+        cursor = conn.execute(
             "INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)",
             (session_id, role, content),
         )
@@ -1251,6 +2036,7 @@ def add_message(session_id: str, role: str, content: str) -> None:
             (session_id,),
         )
         conn.commit()
+        return int(cursor.lastrowid)
 
 
 def remove_last_message(session_id: str) -> None:
@@ -1269,12 +2055,35 @@ def remove_last_message(session_id: str) -> None:
         conn.commit()
 
 
+def message_exists(session_id: str, message_id: int) -> bool:
+    with get_connection() as conn:
+        row = conn.execute(
+            "SELECT 1 FROM messages WHERE session_id = ? AND id = ?",
+            (session_id, message_id),
+        ).fetchone()
+        return row is not None
+
+
 def reset_session(session_id: str) -> None:
     with get_connection() as conn:
+        _remove_session_evaluation_facets(conn, session_id)
+        _remove_session_weekly_stats(conn, session_id)
         conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
         conn.execute("DELETE FROM evaluations WHERE session_id = ?", (session_id,))
+        conn.execute("DELETE FROM evaluation_jobs WHERE session_id = ?", (session_id,))
         conn.execute(
-            "UPDATE chat_sessions SET updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            """
+            UPDATE chat_sessions
+            SET latest_score = NULL,
+                latest_score_label = NULL,
+                latest_bargaining_win_rate = NULL,
+                latest_evaluation_at = NULL,
+                evaluation_count = 0,
+                context_summary = NULL,
+                context_summary_upto = 0,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            """,
             (session_id,),
         )
         conn.commit()
@@ -1285,26 +2094,55 @@ def get_session(session_id: str) -> Optional[Dict[str, object]]:
         row = conn.execute(
             """
             SELECT id, user_id, chapter_id, section_id, system_prompt,
-                   evaluation_prompt, scenario_json, expects_bargaining, difficulty,
-                   assignment_id
+                   evaluation_prompt, scenario_json, system_prompt_hash,
+                   evaluation_prompt_hash, scenario_hash, expects_bargaining, difficulty,
+                   assignment_id, context_summary, context_summary_upto
             FROM chat_sessions WHERE id = ?
             """,
             (session_id,),
         ).fetchone()
         if not row:
             return None
-        return {
-            "id": row["id"],
-            "user_id": row["user_id"],
-            "chapter_id": row["chapter_id"],
-            "section_id": row["section_id"],
-            "system_prompt": row["system_prompt"],
-            "evaluation_prompt": row["evaluation_prompt"],
-            "scenario": json.loads(row["scenario_json"]),
-            "expects_bargaining": bool(row["expects_bargaining"]),
-            "difficulty": row["difficulty"],
-            "assignment_id": row["assignment_id"],
-        }
+        hashes = [
+            row[column]
+            for column in ("system_prompt_hash", "evaluation_prompt_hash", "scenario_hash")
+            if row[column]
+        ]
+        blobs = _load_blobs(conn, hashes) if hashes else {}
+
+    def _resolve(hash_column: str, legacy_column: str) -> str:
+        digest = row[hash_column]
+        return blobs[digest] if digest else row[legacy_column]
+
+    return {
+        "id": row["id"],
+        "user_id": row["user_id"],
+        "chapter_id": row["chapter_id"],
+        "section_id": row["section_id"],
+        "system_prompt": _resolve("system_prompt_hash", "system_prompt"),
+        "evaluation_prompt": _resolve("evaluation_prompt_hash", "evaluation_prompt"),
+        "scenario": json.loads(_resolve("scenario_hash", "scenario_json")),
+        "expects_bargaining": bool(row["expects_bargaining"]),
+        "difficulty": row["difficulty"],
+        "assignment_id": row["assignment_id"],
+        "context_summary": row["context_summary"],
+        "context_summary_upto": int(row["context_summary_upto"] or 0),
+    }
+
+
+def save_context_summary(session_id: str, summary: str, upto_message_id: int) -> bool:
+    with get_connection() as conn:
+        # 只允许向前推进，并发请求中较旧的摘要不会覆盖较新的摘要
+        cursor = conn.execute(
+            """
+            UPDATE chat_sessions
+            SET context_summary = ?, context_summary_upto = ?
+            WHERE id = ? AND COALESCE(context_summary_upto, 0) < ?
+            """,
+            (summary, upto_message_id, session_id, upto_message_id),
+        )
+        conn.commit()
+        return cursor.rowcount == 1
 
 
 def get_messages(session_id: str) -> List[Dict[str, object]]:
@@ -1319,59 +2157,189 @@ def get_messages(session_id: str) -> List[Dict[str, object]]:
         ]
 
 
-def list_sessions_for_user(user_id: int) -> List[Dict[str, object]]:
+def get_messages_after(session_id: str, after_id: int) -> Tuple[int, List[Dict[str, object]]]:
+    """返回 (id 不大于 after_id 的消息条数, 之后的新消息)，供增量拼接逐字稿校验前缀。"""
     with get_connection() as conn:
+        prefix = conn.execute(
+            "SELECT COUNT(*) AS total FROM messages WHERE session_id = ? AND id <= ?",
+            (session_id, after_id),
+        ).fetchone()
         rows = conn.execute(
-            """
-            SELECT s.id, s.chapter_id, s.section_id, s.updated_at, s.created_at,
-                   s.difficulty, s.assignment_id,
-                   json_extract(s.scenario_json, '$.scenario_title') AS scenario_title,
-                   json_extract(s.scenario_json, '$.scenario_summary') AS scenario_summary,
-                   (
-                       SELECT e.score
-                       FROM evaluations e
-                       WHERE e.session_id = s.id
-                       ORDER BY e.created_at DESC, e.id DESC
-                       LIMIT 1
-                   ) AS latest_score,
-                   (
-                       SELECT e.score_label
-                       FROM evaluations e
-                       WHERE e.session_id = s.id
-                       ORDER BY e.created_at DESC, e.id DESC
-                       LIMIT 1
-                   ) AS latest_score_label,
-                   (
-                       SELECT e.bargaining_win_rate
-                       FROM evaluations e
-                       WHERE e.session_id = s.id
-                       ORDER BY e.created_at DESC, e.id DESC
-                       LIMIT 1
-                   ) AS latest_bargaining_win_rate,
-                   (
-                       SELECT e.created_at
-                       FROM evaluations e
-                       WHERE e.session_id = s.id
-                       ORDER BY e.created_at DESC, e.id DESC
-                       LIMIT 1
-                   ) AS latest_evaluation_at
-            FROM chat_sessions s
-            WHERE s.user_id = ?
-            ORDER BY s.updated_at DESC
-            """,
-            (user_id,),
+            "SELECT id, role, content, created_at FROM messages WHERE session_id = ? AND id > ? ORDER BY id",
+            (session_id, after_id),
         ).fetchall()
-        sessions: List[Dict[str, object]] = []
-        for row in rows:
-            latest_evaluation = None
-            if (
-                row["latest_score"] is not None
-                or row["latest_bargaining_win_rate"] is not None
-                or row["latest_score_label"] is not None
-            ):
-                latest_evaluation = {
-                    "score": row["latest_score"],
-                    "scoreLabel": row["latest_score_label"],
+        return int(prefix["total"] or 0), [
+            {
+                "id": row["id"],
+                "role": row["role"],
+                "content": row["content"],
+                "createdAt": row["created_at"],
+            }
+            for row in rows
+        ]
+
+
+def _page_limit(limit: Optional[int]) -> int:
+    if limit is None:
+        return LIST_PAGE_SIZE
+    return max(1, min(int(limit), LIST_PAGE_SIZE_MAX))
+
+
+def _encode_cursor(*values: object) -> str:
+    raw = json.dumps(list(values), ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: Optional[str], size: int) -> Optional[List[object]]:
+    """游标对前端不透明，内容是上一页最后一行的排序键。"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid cursor") from None
+    if (
+        not isinstance(values, list)
+        or len(values) != size
+        or not all(isinstance(value, (str, int, float)) for value in values)
+    ):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def _parse_timestamp(value: object) -> str:
+    text = str(value).strip()
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"Invalid date: {text}") from None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    # 与 CURRENT_TIMESTAMP 写入的 UTC 文本格式一致，才能直接按字符串比较并走索引
+    return parsed.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _append_date_range(
+    column: str,
+    date_from: Optional[str],
+    date_to: Optional[str],
+    clauses: List[str],
+    params: List[object],
+) -> None:
+    if date_from:
+        clauses.append(f"{column} >= ?")
+        params.append(_parse_timestamp(date_from))
+    if date_to:
+        # 只给日期时包含当天全天
+        if len(str(date_to).strip()) == 10:
+            clauses.append(f"{column} < datetime(?, '+1 day')")
+        else:
+            clauses.append(f"{column} <= ?")
+        params.append(_parse_timestamp(date_to))
+
+
+def _append_filters(
+    alias: str,
+    clauses: List[str],
+    params: List[object],
+    *,
+    chapter_id: Optional[str] = None,
+    section_id: Optional[str] = None,
+    difficulty: Optional[str] = None,
+) -> None:
+    for column, value in (
+        ("chapter_id", chapter_id),
+        ("section_id", section_id),
+        ("difficulty", difficulty),
+    ):
+        if value:
+            clauses.append(f"{alias}.{column} = ?")
+            params.append(value)
+
+
+def _page_result(
+    items: List[Dict[str, object]],
+    has_more: bool,
+    cursor_values: Callable[[Dict[str, object]], Tuple[object, ...]],
+    total: Optional[int],
+) -> Dict[str, object]:
+    return {
+        "items": items,
+        "nextCursor": _encode_cursor(*cursor_values(items[-1])) if has_more and items else None,
+        "total": total,
+    }
+
+
+_SESSION_STATUS_FILTERS = {
+    "evaluated": "s.evaluation_count > 0",
+    "unevaluated": "COALESCE(s.evaluation_count, 0) = 0",
+}
+
+
+def list_sessions_for_user(
+    user_id: int,
+    *,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    chapter_id: Optional[str] = None,
+    section_id: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    status: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> Dict[str, object]:
+    """按 (updated_at, id) 倒序分页返回会话；总数只在首页计算一次。"""
+    page_size = _page_limit(limit)
+    after = _decode_cursor(cursor, 2)
+    clauses = ["s.user_id = ?"]
+    params: List[object] = [user_id]
+    _append_filters(
+        "s", clauses, params, chapter_id=chapter_id, section_id=section_id, difficulty=difficulty
+    )
+    if status:
+        if status not in _SESSION_STATUS_FILTERS:
+            raise ValueError(f"Unknown session status: {status}")
+        clauses.append(_SESSION_STATUS_FILTERS[status])
+    _append_date_range("s.updated_at", date_from, date_to, clauses, params)
+
+    with get_connection() as conn:
+        total = None
+        if after is None:
+            total = conn.execute(
+                f"SELECT COUNT(*) FROM chat_sessions s WHERE {' AND '.join(clauses)}",
+                params,
+            ).fetchone()[0]
+        page_clauses = list(clauses)
+        page_params = list(params)
+        if after is not None:
+            page_clauses.append("(s.updated_at < ? OR (s.updated_at = ? AND s.id < ?))")
+            page_params.extend([after[0], after[0], after[1]])
+        rows = conn.execute(
+            f"""
+            SELECT s.id, s.chapter_id, s.section_id, s.updated_at, s.created_at,
+                   s.difficulty, s.assignment_id,
+                   s.scenario_title, s.scenario_summary,
+                   s.latest_score, s.latest_score_label,
+                   s.latest_bargaining_win_rate, s.latest_evaluation_at
+            FROM chat_sessions s
+            WHERE {' AND '.join(page_clauses)}
+            ORDER BY s.updated_at DESC, s.id DESC
+            LIMIT ?
+            """,
+            (*page_params, page_size + 1),
+        ).fetchall()
+        sessions: List[Dict[str, object]] = []
+        for row in rows[:page_size]:
+            latest_evaluation = None
+            if (
+                row["latest_score"] is not None
+                or row["latest_bargaining_win_rate"] is not None
+                or row["latest_score_label"] is not None
+            ):
+                latest_evaluation = {
+                    "score": row["latest_score"],
+                    "scoreLabel": row["latest_score_label"],
                     "bargainingWinRate": row["latest_bargaining_win_rate"],
                     "createdAt": row["latest_evaluation_at"],
                 }
@@ -1391,19 +2359,227 @@ def list_sessions_for_user(user_id: int) -> List[Dict[str, object]]:
                 }
             )
 
-        return sessions
+    return _page_result(
+        sessions,
+        len(rows) > page_size,
+        lambda item: (item["updatedAt"], item["id"]),
+        total,
+    )
 
 
-def save_evaluation(session_id: str, evaluation: Dict[str, object]) -> None:
+def _record_weekly_section_stats(conn: sqlite3.Connection, evaluation_id: int) -> None:
+    conn.execute(
+        f"""
+        INSERT INTO weekly_section_stats (
+            chapter_id, section_id, week, section_title, sample_size,
+            score_sum, score_count, bargaining_sum, bargaining_count
+        )
+        {_weekly_section_rollup_sql()}
+        WHERE e.id = ?
+        ON CONFLICT(chapter_id, section_id, week) DO UPDATE SET
+            section_title = COALESCE(excluded.section_title, section_title),
+            sample_size = sample_size + excluded.sample_size,
+            score_sum = score_sum + excluded.score_sum,
+            score_count = score_count + excluded.score_count,
+            bargaining_sum = bargaining_sum + excluded.bargaining_sum,
+            bargaining_count = bargaining_count + excluded.bargaining_count
+        """,
+        (evaluation_id,),
+    )
+
+
+def _remove_session_weekly_stats(conn: sqlite3.Connection, session_id: str) -> None:
+    """从周汇总中扣除会话的全部评估，样本归零的行直接删除。"""
+    rows = conn.execute(
+        f"""
+        {_weekly_section_rollup_sql()}
+        WHERE e.session_id = ?
+        GROUP BY s.chapter_id, s.section_id, week
+        """,
+        (session_id,),
+    ).fetchall()
+    for row in rows:
+        key = (row[0], row[1], row[2])
+        conn.execute(
+            """
+            UPDATE weekly_section_stats
+            SET sample_size = sample_size - ?,
+                score_sum = score_sum - ?,
+                score_count = score_count - ?,
+                bargaining_sum = bargaining_sum - ?,
+                bargaining_count = bargaining_count - ?
+            WHERE chapter_id = ? AND section_id = ? AND week = ?
+            """,
+            (row[4], row[5], row[6], row[7], row[8], *key),
+        )
+        conn.execute(
+            """
+            DELETE FROM weekly_section_stats
+            WHERE chapter_id = ? AND section_id = ? AND week = ? AND sample_size <= 0
+            """,
+            key,
+        )
+
+
+def rebuild_weekly_section_stats() -> int:
+    """按全部评估重建周汇总，用于回填或修复，返回重建后的行数。"""
+    with get_connection() as conn:
+        _fill_weekly_section_stats(conn)
+        conn.commit()
+        return int(conn.execute("SELECT COUNT(*) FROM weekly_section_stats").fetchone()[0])
+
+
+def _facet_values(values: object) -> List[str]:
+    if not isinstance(values, list):
+        return []
+    return [str(value) for value in values if value is not None and value != ""]
+
+
+def _record_evaluation_facets(
+    conn: sqlite3.Connection,
+    evaluation_id: int,
+    session_id: str,
+    knowledge_points: List[str],
+    action_items: List[str],
+    score_value: Optional[float],
+    created_at: str,
+) -> None:
+    """写入评估明细并增量累加汇总表，与评估本身处于同一事务。"""
+    owner = conn.execute("SELECT user_id FROM chat_sessions WHERE id = ?", (session_id,)).fetchone()
+    if not owner:
+        return
+    user_id = owner["user_id"]
+    score_sum = float(score_value) if score_value is not None else 0.0
+    score_count = 1 if score_value is not None else 0
+
+    conn.executemany(
+        """
+        INSERT INTO evaluation_knowledge_points (
+            evaluation_id, session_id, user_id, knowledge_point, score_value, created_at
+        ) VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        [(evaluation_id, session_id, user_id, kp, score_value, created_at) for kp in knowledge_points],
+    )
+    conn.executemany(
+        """
+        INSERT INTO evaluation_action_items (evaluation_id, session_id, user_id, action_item)
+        VALUES (?, ?, ?, ?)
+        """,
+        [(evaluation_id, session_id, user_id, item) for item in action_items],
+    )
+    conn.executemany(
+        """
+        INSERT INTO student_knowledge_stats (
+            user_id, knowledge_point, evaluation_count, score_sum, score_count, latest_score, latest_at
+        ) VALUES (?, ?, 1, ?, ?, ?, ?)
+        ON CONFLICT(user_id, knowledge_point) DO UPDATE SET
+            evaluation_count = evaluation_count + 1,
+            score_sum = score_sum + excluded.score_sum,
+            score_count = score_count + excluded.score_count,
+            latest_score = CASE WHEN latest_at IS NULL OR excluded.latest_at >= latest_at
+                                THEN excluded.latest_score ELSE latest_score END,
+            latest_at = CASE WHEN latest_at IS NULL OR excluded.latest_at >= latest_at
+                             THEN excluded.latest_at ELSE latest_at END
+        """,
+        [(user_id, kp, score_sum, score_count, score_value, created_at) for kp in knowledge_points],
+    )
+    conn.executemany(
+        """
+        INSERT INTO class_knowledge_stats (knowledge_point, evaluation_count, score_sum, score_count)
+        VALUES (?, 1, ?, ?)
+        ON CONFLICT(knowledge_point) DO UPDATE SET
+            evaluation_count = evaluation_count + 1,
+            score_sum = score_sum + excluded.score_sum,
+            score_count = score_count + excluded.score_count
+        """,
+        [(kp, score_sum, score_count) for kp in knowledge_points],
+    )
+    conn.executemany(
+        """
+        INSERT INTO class_action_stats (action_item, evaluation_count) VALUES (?, 1)
+        ON CONFLICT(action_item) DO UPDATE SET evaluation_count = evaluation_count + 1
+        """,
+        [(item,) for item in action_items],
+    )
+
+
+def _remove_session_evaluation_facets(conn: sqlite3.Connection, session_id: str) -> None:
+    """删除会话的评估明细，并只重算受影响的汇总行。"""
+    points = conn.execute(
+        """
+        SELECT DISTINCT user_id, knowledge_point
+        FROM evaluation_knowledge_points WHERE session_id = ?
+        """,
+        (session_id,),
+    ).fetchall()
+    actions = conn.execute(
+        "SELECT DISTINCT action_item FROM evaluation_action_items WHERE session_id = ?",
+        (session_id,),
+    ).fetchall()
+    if not points and not actions:
+        return
+    conn.execute("DELETE FROM evaluation_knowledge_points WHERE session_id = ?", (session_id,))
+    conn.execute("DELETE FROM evaluation_action_items WHERE session_id = ?", (session_id,))
+
+    for row in points:
+        conn.execute(
+            "DELETE FROM student_knowledge_stats WHERE user_id = ? AND knowledge_point = ?",
+            (row["user_id"], row["knowledge_point"]),
+        )
+        conn.execute(
+            f"""
+            INSERT INTO student_knowledge_stats (
+                user_id, knowledge_point, evaluation_count, score_sum, score_count, latest_score, latest_at
+            )
+            {_STUDENT_KNOWLEDGE_ROLLUP_SQL}
+            WHERE f.user_id = ? AND f.knowledge_point = ?
+            GROUP BY f.user_id, f.knowledge_point
+            """,
+            (row["user_id"], row["knowledge_point"]),
+        )
+    for knowledge_point in {row["knowledge_point"] for row in points}:
+        conn.execute(
+            "DELETE FROM class_knowledge_stats WHERE knowledge_point = ?", (knowledge_point,)
+        )
+        conn.execute(
+            f"""
+            INSERT INTO class_knowledge_stats (knowledge_point, evaluation_count, score_sum, score_count)
+            {_CLASS_KNOWLEDGE_ROLLUP_SQL}
+            WHERE f.knowledge_point = ?
+            GROUP BY f.knowledge_point
+            """,
+            (knowledge_point,),
+        )
+    for row in actions:
+        conn.execute("DELETE FROM class_action_stats WHERE action_item = ?", (row["action_item"],))
+        conn.execute(
+            f"""
+            INSERT INTO class_action_stats (action_item, evaluation_count)
+            {_CLASS_ACTION_ROLLUP_SQL}
+            WHERE f.action_item = ?
+            GROUP BY f.action_item
+            """,
+            (row["action_item"],),
+        )
+
+
+def save_evaluation(
+    session_id: str,
+    evaluation: Dict[str, object],
+    *,
+    last_message_id: Optional[int] = None,
+    transcript_hash: Optional[str] = None,
+) -> None:
     action_items = evaluation.get("actionItems", [])
     knowledge_points = evaluation.get("knowledgePoints", [])
     with get_connection() as conn:
-        conn.execute(
+        cursor = conn.execute(
             """
             INSERT INTO evaluations (
                 session_id, score, score_label, commentary,
-                action_items_json, knowledge_points_json, bargaining_win_rate
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                action_items_json, knowledge_points_json, bargaining_win_rate,
+                last_message_id, transcript_hash
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
             (
                 session_id,
@@ -1413,12 +2589,66 @@ def save_evaluation(session_id: str, evaluation: Dict[str, object]) -> None:
                 json.dumps(action_items, ensure_ascii=False),
                 json.dumps(knowledge_points, ensure_ascii=False),
                 evaluation.get("bargainingWinRate"),
+                last_message_id,
+                transcript_hash,
             ),
         )
-        conn.execute(
-            "UPDATE chat_sessions SET updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-            (session_id,),
+        stored = conn.execute(
+            """
+            SELECT created_at, COALESCE(score, bargaining_win_rate) AS score_value
+            FROM evaluations WHERE id = ?
+            """,
+            (cursor.lastrowid,),
+        ).fetchone()
+        created_at = stored["created_at"]
+        _record_weekly_section_stats(conn, int(cursor.lastrowid))
+        _record_evaluation_facets(
+            conn,
+            int(cursor.lastrowid),
+            session_id,
+            _facet_values(knowledge_points),
+            _facet_values(action_items),
+            stored["score_value"],
+            created_at,
         )
+        # 评估的逐字稿早于已入库的评估时（慢任务晚完成），只计数，不覆盖会话的最新成绩
+        superseded = last_message_id is not None and conn.execute(
+            """
+            SELECT 1 FROM evaluations
+            WHERE session_id = ? AND last_message_id > ?
+            LIMIT 1
+            """,
+            (session_id, last_message_id),
+        ).fetchone()
+        if superseded:
+            conn.execute(
+                """
+                UPDATE chat_sessions
+                SET evaluation_count = COALESCE(evaluation_count, 0) + 1
+                WHERE id = ?
+                """,
+                (session_id,),
+            )
+        else:
+            conn.execute(
+                """
+                UPDATE chat_sessions
+                SET latest_score = ?,
+                    latest_score_label = ?,
+                    latest_bargaining_win_rate = ?,
+                    latest_evaluation_at = ?,
+                    evaluation_count = COALESCE(evaluation_count, 0) + 1,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+                """,
+                (
+                    evaluation.get("score"),
+                    evaluation.get("scoreLabel"),
+                    evaluation.get("bargainingWinRate"),
+                    created_at,
+                    session_id,
+                ),
+            )
         conn.commit()
 
 
@@ -1427,10 +2657,11 @@ def get_latest_evaluation(session_id: str) -> Optional[Dict[str, object]]:
         row = conn.execute(
             """
             SELECT score, score_label, commentary, action_items_json,
-                   knowledge_points_json, bargaining_win_rate, created_at
+                   knowledge_points_json, bargaining_win_rate, created_at,
+                   last_message_id, transcript_hash
             FROM evaluations
             WHERE session_id = ?
-            ORDER BY created_at DESC, id DESC
+            ORDER BY last_message_id DESC, created_at DESC, id DESC
             LIMIT 1
             """,
             (session_id,),
@@ -1447,36 +2678,378 @@ def get_latest_evaluation(session_id: str) -> Optional[Dict[str, object]]:
             else [],
             "bargainingWinRate": row["bargaining_win_rate"],
             "createdAt": row["created_at"],
+            "lastMessageId": row["last_message_id"],
+            "transcriptHash": row["transcript_hash"],
         }
 
 
-def list_students_progress() -> List[Dict[str, object]]:
+def _parse_evaluation_job_row(row: sqlite3.Row) -> Dict[str, object]:
+    return {
+        "id": row["id"],
+        "sessionId": row["session_id"],
+        "messageId": row["message_id"],
+        "status": row["status"],
+        "attempts": row["attempts"],
+        "evaluation": json.loads(row["result_json"]) if row["result_json"] else None,
+        "error": row["error"],
+        "createdAt": row["created_at"],
+        "updatedAt": row["updated_at"],
+    }
+
+
+def enqueue_evaluation_job(session_id: str, message_id: int) -> Dict[str, object]:
     with get_connection() as conn:
-        rows = conn.execute(
+        # 同一会话仅需评估最新逐字稿，旧的待处理任务直接标记为已被取代
+        conn.execute(
+            """
+            UPDATE evaluation_jobs
+            SET status = 'superseded', updated_at = CURRENT_TIMESTAMP
+            WHERE session_id = ? AND status = 'pending'
+            """,
+            (session_id,),
+        )
+        cursor = conn.execute(
+            "INSERT INTO evaluation_jobs (session_id, message_id) VALUES (?, ?)",
+            (session_id, message_id),
+        )
+        conn.commit()
+        row = conn.execute(
+            "SELECT * FROM evaluation_jobs WHERE id = ?", (cursor.lastrowid,)
+        ).fetchone()
+    return _parse_evaluation_job_row(row)
+
+
+def claim_next_evaluation_job() -> Optional[Dict[str, object]]:
+    with get_connection() as conn:
+        for _ in range(5):
+            # 同一会话同一时间只允许一个任务运行，避免旧任务晚于新任务完成
+            row = conn.execute(
+                """
+                SELECT id FROM evaluation_jobs
+                WHERE status = 'pending'
+                  AND NOT EXISTS (
+                      SELECT 1 FROM evaluation_jobs running
+                      WHERE running.session_id = evaluation_jobs.session_id
+                        AND running.status = 'running'
+                  )
+                ORDER BY id
+                LIMIT 1
+                """
+            ).fetchone()
+            if not row:
+                return None
+            cursor = conn.execute(
+                """
+                UPDATE evaluation_jobs
+                SET status = 'running', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'pending'
+                  AND NOT EXISTS (
+                      SELECT 1 FROM evaluation_jobs running
+                      WHERE running.session_id = evaluation_jobs.session_id
+                        AND running.status = 'running'
+                  )
+                """,
+                (row["id"],),
+            )
+            conn.commit()
+            if cursor.rowcount == 1:
+                claimed = conn.execute(
+                    "SELECT * FROM evaluation_jobs WHERE id = ?", (row["id"],)
+                ).fetchone()
+                return _parse_evaluation_job_row(claimed)
+    return None
+
+
+def complete_evaluation_job(job_id: int, evaluation: Dict[str, object]) -> None:
+    with get_connection() as conn:
+        conn.execute(
+            """
+            UPDATE evaluation_jobs
+            SET status = 'done', result_json = ?, error = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'running'
+            """,
+            (json.dumps(evaluation, ensure_ascii=False), job_id),
+        )
+        conn.commit()
+
+
+def fail_evaluation_job(job_id: int, error: str, *, retry: bool) -> None:
+    with get_connection() as conn:
+        conn.execute(
+            """
+            UPDATE evaluation_jobs
+            SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'running'
+            """,
+            ("pending" if retry else "failed", error, job_id),
+        )
+        conn.commit()
+
+
+def cancel_evaluation_job(job_id: int) -> None:
+    # 运行中的任务同样标记为已取代，工作线程随后的完成或失败写入不会再改动状态
+    with get_connection() as conn:
+        conn.execute(
+            """
+            UPDATE evaluation_jobs
+            SET status = 'superseded', updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status IN ('pending', 'running')
+            """,
+            (job_id,),
+        )
+        conn.commit()
+
+
+def requeue_stale_evaluation_jobs(stale_after_seconds: int) -> int:
+    with get_connection() as conn:
+        cursor = conn.execute(
+            """
+            UPDATE evaluation_jobs
+            SET status = 'pending', updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'running' AND updated_at < datetime('now', ?)
+            """,
+            (f"-{int(stale_after_seconds)} seconds",),
+        )
+        conn.commit()
+        return cursor.rowcount
+
+
+def get_evaluation_job(session_id: str, message_id: Optional[int] = None) -> Optional[Dict[str, object]]:
+    with get_connection() as conn:
+        if message_id is None:
+            row = conn.execute(
+                "SELECT * FROM evaluation_jobs WHERE session_id = ? ORDER BY id DESC LIMIT 1",
+                (session_id,),
+            ).fetchone()
+        else:
+            row = conn.execute(
+                """
+                SELECT * FROM evaluation_jobs
+                WHERE session_id = ? AND message_id = ?
+                ORDER BY id DESC
+                LIMIT 1
+                """,
+                (session_id, message_id),
+            ).fetchone()
+    if not row:
+        return None
+    return _parse_evaluation_job_row(row)
+
+
+def add_pooled_scenario(
+    section_id: str,
+    difficulty: str,
+    template_hash: str,
+    scenario: Dict[str, object],
+    *,
+    reservation_id: Optional[int] = None,
+) -> int:
+    with get_connection() as conn:
+        cursor = conn.execute(
+            """
+            INSERT INTO scenario_pool (section_id, difficulty, template_hash, scenario_json)
+            VALUES (?, ?, ?, ?)
+            """,
+            (section_id, difficulty, template_hash, json.dumps(scenario, ensure_ascii=False)),
+        )
+        # 入库与释放预留放在同一事务，其他进程不会在两者之间看到重复的缺口
+        if reservation_id is not None:
+            conn.execute(
+                "DELETE FROM scenario_pool_reservations WHERE id = ?", (reservation_id,)
+            )
+        conn.commit()
+        return int(cursor.lastrowid)
+
+
+def _pool_shortfall(
+    conn: sqlite3.Connection,
+    section_id: str,
+    difficulty: str,
+    template_hash: str,
+    target: int,
+    ttl_seconds: int,
+) -> int:
+    key = (section_id, difficulty, template_hash)
+    stocked = conn.execute(
+        """
+        SELECT COUNT(*) FROM scenario_pool
+        WHERE section_id = ? AND difficulty = ? AND template_hash = ?
+        """,
+        key,
+    ).fetchone()[0]
+    reserved = conn.execute(
+        """
+        SELECT COUNT(*) FROM scenario_pool_reservations
+        WHERE section_id = ? AND difficulty = ? AND template_hash = ?
+          AND reserved_at >= datetime('now', ?)
+        """,
+        (*key, f"-{int(ttl_seconds)} seconds"),
+    ).fetchone()[0]
+    return target - int(stocked) - int(reserved)
+
+
+def reserve_pool_refills(
+    section_id: str, difficulty: str, template_hash: str, target: int, ttl_seconds: int
+) -> List[int]:
+    """按库存与未过期的预留计算缺口并登记预留，返回预留 ID；进程中途退出留下的预留在 TTL 后失效。"""
+    with get_connection() as conn:
+        # 库存已满是常见情况，先用只读查询判断，避免每次开始练习都争抢写锁
+        if _pool_shortfall(conn, section_id, difficulty, template_hash, target, ttl_seconds) <= 0:
+            return []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "DELETE FROM scenario_pool_reservations WHERE reserved_at < datetime('now', ?)",
+                (f"-{int(ttl_seconds)} seconds",),
+            )
+            missing = _pool_shortfall(
+                conn, section_id, difficulty, template_hash, target, ttl_seconds
+            )
+            reservation_ids: List[int] = []
+            for _ in range(max(0, missing)):
+                cursor = conn.execute(
+                    """
+                    INSERT INTO scenario_pool_reservations (section_id, difficulty, template_hash)
+                    VALUES (?, ?, ?)
+                    """,
+                    (section_id, difficulty, template_hash),
+                )
+                reservation_ids.append(int(cursor.lastrowid))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    return reservation_ids
+
+
+def release_pool_reservation(reservation_id: int) -> None:
+    with get_connection() as conn:
+        conn.execute("DELETE FROM scenario_pool_reservations WHERE id = ?", (reservation_id,))
+        conn.commit()
+
+
+def count_pooled_scenarios(section_id: str, difficulty: str, template_hash: str) -> int:
+    with get_connection() as conn:
+        row = conn.execute(
             """
-            SELECT u.id, u.username, u.display_name,
-                   COUNT(DISTINCT s.id) AS session_count,
-                   COUNT(DISTINCT e.id) AS evaluation_count,
-                   MAX(s.updated_at) AS last_active
+            SELECT COUNT(*) AS total FROM scenario_pool
+            WHERE section_id = ? AND difficulty = ? AND template_hash = ?
+            """,
+            (section_id, difficulty, template_hash),
+        ).fetchone()
+        return int(row["total"] or 0)
+
+
+def claim_pooled_scenario(
+    section_id: str, difficulty: str, template_hash: str
+) -> Optional[Dict[str, object]]:
+    with get_connection() as conn:
+        for _ in range(5):
+            row = conn.execute(
+                """
+                SELECT id, scenario_json FROM scenario_pool
+                WHERE section_id = ? AND difficulty = ? AND template_hash = ?
+                ORDER BY id LIMIT 1
+                """,
+                (section_id, difficulty, template_hash),
+            ).fetchone()
+            if not row:
+                return None
+            # 删除成功才算领取，保证同一场景不会分配给两名学生
+            cursor = conn.execute("DELETE FROM scenario_pool WHERE id = ?", (row["id"],))
+            conn.commit()
+            if cursor.rowcount == 1:
+                return json.loads(row["scenario_json"])
+    return None
+
+
+def purge_scenario_pool(section_id: str, keep_template_hash: Optional[str] = None) -> int:
+    with get_connection() as conn:
+        if keep_template_hash is None:
+            cursor = conn.execute("DELETE FROM scenario_pool WHERE section_id = ?", (section_id,))
+        else:
+            cursor = conn.execute(
+                "DELETE FROM scenario_pool WHERE section_id = ? AND template_hash != ?",
+                (section_id, keep_template_hash),
+            )
+        conn.commit()
+        return cursor.rowcount
+
+
+def list_students_progress(
+    *,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    search: Optional[str] = None,
+) -> Dict[str, object]:
+    """按账号分页返回学生；先取一页学生，再只对这一页聚合会话统计。"""
+    page_size = _page_limit(limit)
+    after = _decode_cursor(cursor, 1)
+    clauses = ["u.role = 'student'"]
+    params: List[object] = []
+    if search:
+        pattern = "%" + search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        clauses.append("(u.username LIKE ? ESCAPE '\\' OR u.display_name LIKE ? ESCAPE '\\')")
+        params.extend([pattern, pattern])
+
+    with get_connection() as conn:
+        total = None
+        if after is None:
+            total = conn.execute(
+                f"SELECT COUNT(*) FROM users u WHERE {' AND '.join(clauses)}", params
+            ).fetchone()[0]
+        page_clauses = list(clauses)
+        page_params = list(params)
+        if after is not None:
+            # 账号唯一，单列即可作为游标
+            page_clauses.append("u.username > ?")
+            page_params.append(after[0])
+        rows = conn.execute(
+            f"""
+            SELECT u.id, u.username, u.display_name
             FROM users u
-            LEFT JOIN chat_sessions s ON s.user_id = u.id
-            LEFT JOIN evaluations e ON e.session_id = s.id
-            WHERE u.role = 'student'
-            GROUP BY u.id, u.username
+            WHERE {' AND '.join(page_clauses)}
             ORDER BY u.username
-            """
+            LIMIT ?
+            """,
+            (*page_params, page_size + 1),
         ).fetchall()
-        return [
+        page_rows = rows[:page_size]
+        stats: Dict[int, sqlite3.Row] = {}
+        if page_rows:
+            placeholders = ", ".join("?" for _ in page_rows)
+            stats = {
+                row["user_id"]: row
+                for row in conn.execute(
+                    f"""
+                    SELECT user_id,
+                           COUNT(*) AS session_count,
+                           COALESCE(SUM(evaluation_count), 0) AS evaluation_count,
+                           MAX(updated_at) AS last_active
+                    FROM chat_sessions
+                    WHERE user_id IN ({placeholders})
+                    GROUP BY user_id
+                    """,
+                    [row["id"] for row in page_rows],
+                )
+            }
+
+    students: List[Dict[str, object]] = []
+    for row in page_rows:
+        stat = stats.get(row["id"])
+        students.append(
             {
                 "id": row["id"],
                 "username": row["username"],
                 "displayName": row["display_name"] or row["username"],
-                "sessionCount": row["session_count"],
-                "evaluationCount": row["evaluation_count"],
-                "lastActive": row["last_active"],
+                "sessionCount": stat["session_count"] if stat else 0,
+                "evaluationCount": stat["evaluation_count"] if stat else 0,
+                "lastActive": stat["last_active"] if stat else None,
             }
-            for row in rows
-        ]
+        )
+    return _page_result(
+        students, len(rows) > page_size, lambda item: (item["username"],), total
+    )
 
 
 def get_student_detail(student_id: int) -> Optional[Dict[str, object]]:
@@ -1492,8 +3065,10 @@ def get_student_detail(student_id: int) -> Optional[Dict[str, object]]:
             """
             SELECT s.id, s.chapter_id, s.section_id, s.updated_at, s.created_at,
                    s.difficulty, s.assignment_id,
-                   json_extract(s.scenario_json, '$.scenario_title') AS title,
-                   json_extract(s.scenario_json, '$.scenario_summary') AS summary
+                   s.scenario_title AS title, s.scenario_summary AS summary,
+                   s.latest_score, s.latest_score_label,
+                   s.latest_bargaining_win_rate, s.latest_evaluation_at,
+                   s.evaluation_count
             FROM chat_sessions s
             WHERE s.user_id = ?
             ORDER BY s.updated_at DESC
@@ -1503,16 +3078,7 @@ def get_student_detail(student_id: int) -> Optional[Dict[str, object]]:
 
         result_sessions: List[Dict[str, object]] = []
         for session in sessions:
-            eval_row = conn.execute(
-                """
-                SELECT score, score_label, bargaining_win_rate, created_at
-                FROM evaluations
-                WHERE session_id = ?
-                ORDER BY created_at DESC, id DESC
-                LIMIT 1
-                """,
-                (session["id"],),
-            ).fetchone()
+            has_evaluation = bool(session["evaluation_count"])
             result_sessions.append(
                 {
                     "id": session["id"],
@@ -1525,12 +3091,12 @@ def get_student_detail(student_id: int) -> Optional[Dict[str, object]]:
                     "difficulty": session["difficulty"],
                     "assignmentId": session["assignment_id"],
                     "latestEvaluation": {
-                        "score": eval_row["score"] if eval_row else None,
-                        "scoreLabel": eval_row["score_label"] if eval_row else None,
-                        "bargainingWinRate": eval_row["bargaining_win_rate"] if eval_row else None,
-                        "createdAt": eval_row["created_at"] if eval_row else None,
+                        "score": session["latest_score"],
+                        "scoreLabel": session["latest_score_label"],
+                        "bargainingWinRate": session["latest_bargaining_win_rate"],
+                        "createdAt": session["latest_evaluation_at"],
                     }
-                    if eval_row
+                    if has_evaluation
                     else None,
                 }
             )
@@ -1545,6 +3111,25 @@ def get_student_detail(student_id: int) -> Optional[Dict[str, object]]:
         }
 
 
+# 与前端 hasVictoryScore 保持一致：最新评分高于该值视为通关
+LEVEL_VICTORY_SCORE = 80
+
+
+def list_level_victories(user_id: int) -> List[Dict[str, str]]:
+    """返回学生已通关的小节，直接按会话的最新评分聚合，不依赖分页的会话列表。"""
+    with get_connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT DISTINCT chapter_id, section_id
+            FROM chat_sessions
+            WHERE user_id = ? AND latest_score > ?
+              AND chapter_id IS NOT NULL AND section_id IS NOT NULL
+            """,
+            (user_id, LEVEL_VICTORY_SCORE),
+        ).fetchall()
+    return [{"chapterId": row["chapter_id"], "sectionId": row["section_id"]} for row in rows]
+
+
 def get_student_dashboard(user_id: int) -> Dict[str, object]:
     with get_connection() as conn:
         rows = conn.execute(
@@ -1553,7 +3138,7 @@ def get_student_dashboard(user_id: int) -> Dict[str, object]:
                    e.action_items_json, e.knowledge_points_json, e.bargaining_win_rate,
                    e.created_at,
                    s.chapter_id, s.section_id, s.difficulty,
-                   json_extract(s.scenario_json, '$.scenario_title') AS title
+                   s.scenario_title AS title
             FROM evaluations e
             JOIN chat_sessions s ON s.id = e.session_id
             WHERE s.user_id = ?
@@ -1561,13 +3146,17 @@ def get_student_dashboard(user_id: int) -> Dict[str, object]:
             """,
             (user_id,),
         ).fetchall()
+        knowledge_rows = conn.execute(
+            """
+            SELECT knowledge_point, evaluation_count, score_sum, score_count, latest_score
+            FROM student_knowledge_stats
+            WHERE user_id = ?
+            ORDER BY evaluation_count DESC, knowledge_point
+            """,
+            (user_id,),
+        ).fetchall()
 
     timeline: List[Dict[str, object]] = []
-    knowledge_totals: Dict[str, Dict[str, float]] = defaultdict(
-        lambda: {"score_sum": 0.0, "score_count": 0, "count": 0}
-    )
-    knowledge_latest: Dict[str, Dict[str, object]] = {}
-
     for row in rows:
         knowledge = []
         if row["knowledge_points_json"]:
@@ -1576,14 +3165,6 @@ def get_student_dashboard(user_id: int) -> Dict[str, object]:
             except json.JSONDecodeError:
                 knowledge = []
 
-        score = row["score"]
-        bargaining = row["bargaining_win_rate"]
-        score_for_skill: Optional[float] = None
-        if score is not None:
-            score_for_skill = float(score)
-        elif bargaining is not None:
-            score_for_skill = float(bargaining)
-
         timeline.append(
             {
                 "sessionId": row["session_id"],
@@ -1592,56 +3173,34 @@ def get_student_dashboard(user_id: int) -> Dict[str, object]:
                 "sectionId": row["section_id"],
                 "score": row["score"],
                 "scoreLabel": row["score_label"],
-                "bargainingWinRate": bargaining,
+                "bargainingWinRate": row["bargaining_win_rate"],
                 "createdAt": row["created_at"],
                 "knowledgePoints": knowledge,
                 "difficulty": row["difficulty"],
             }
         )
 
-        for kp in knowledge:
-            stats = knowledge_totals[kp]
-            stats["count"] += 1
-            if score_for_skill is not None:
-                stats["score_sum"] += score_for_skill
-                stats["score_count"] += 1
-
-            latest = knowledge_latest.get(kp)
-            if not latest or row["created_at"] >= latest.get("created_at", ""):
-                knowledge_latest[kp] = {
-                    "latest_score": score_for_skill,
-                    "created_at": row["created_at"],
-                }
-
+    # 知识点汇总由 save_evaluation 增量维护，这里只做格式转换
     knowledge_radar: List[Dict[str, object]] = []
-    for kp, stats in knowledge_totals.items():
-        average = None
-        if stats["score_count"]:
-            average = stats["score_sum"] / stats["score_count"]
+    recent_knowledge: List[Dict[str, object]] = []
+    for row in knowledge_rows:
+        average = row["score_sum"] / row["score_count"] if row["score_count"] else None
         knowledge_radar.append(
             {
-                "label": kp,
+                "label": row["knowledge_point"],
                 "averageScore": average,
-                "count": stats["count"],
+                "count": row["evaluation_count"],
             }
         )
-
-    knowledge_radar.sort(key=lambda item: (-item["count"], item["label"]))
-
-    recent_knowledge: List[Dict[str, object]] = []
-    for kp, latest in knowledge_latest.items():
-        stats = knowledge_totals[kp]
         entry = {
-            "label": kp,
-            "count": stats["count"],
-            "latestScore": latest.get("latest_score"),
+            "label": row["knowledge_point"],
+            "count": row["evaluation_count"],
+            "latestScore": row["latest_score"],
         }
-        if stats["score_count"]:
-            entry["averageScore"] = stats["score_sum"] / stats["score_count"]
+        if average is not None:
+            entry["averageScore"] = average
         recent_knowledge.append(entry)
 
-    recent_knowledge.sort(key=lambda item: (-item["count"], item["label"]))
-
     return {
         "timeline": timeline,
         "knowledgeRadar": knowledge_radar[:10],
@@ -1682,6 +3241,161 @@ def create_blueprint(
     return result
 
 
+def create_generation_job(owner_id: int, items: List[Dict[str, str]]) -> Dict[str, object]:
+    """登记批量生成任务，items 为展开后的 (chapterId, sectionId, difficulty) 列表。"""
+    job_id = f"batch-{uuid.uuid4().hex[:12]}"
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT INTO generation_jobs (id, owner_id, total) VALUES (?, ?, ?)",
+            (job_id, owner_id, len(items)),
+        )
+        conn.executemany(
+            """
+            INSERT INTO generation_job_items (job_id, chapter_id, section_id, difficulty)
+            VALUES (?, ?, ?, ?)
+            """,
+            [(job_id, item["chapterId"], item["sectionId"], item["difficulty"]) for item in items],
+        )
+        conn.commit()
+    result = get_generation_job(job_id)
+    if not result:
+        raise RuntimeError("Failed to create generation job")
+    return result
+
+
+def start_generation_item(item_id: int) -> bool:
+    """领取一项待生成条目；同一条目被重复提交时只有一次领取成功。"""
+    with get_connection() as conn:
+        cursor = conn.execute(
+            """
+            UPDATE generation_job_items
+            SET status = 'running', updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'pending'
+            """,
+            (item_id,),
+        )
+        conn.commit()
+        return cursor.rowcount == 1
+
+
+def requeue_stale_generation_items(stale_after_seconds: int) -> List[Dict[str, object]]:
+    """把长时间停留在 pending/running 的条目（进程重启后遗留）重置为 pending 并返回，供重新提交。"""
+    stale_window = f"-{int(stale_after_seconds)} seconds"
+    with get_connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT i.id, i.chapter_id, i.section_id, i.difficulty, j.owner_id
+            FROM generation_job_items i
+            JOIN generation_jobs j ON j.id = i.job_id
+            WHERE i.status IN ('pending', 'running') AND i.updated_at < datetime('now', ?)
+            """,
+            (stale_window,),
+        ).fetchall()
+        requeued: List[Dict[str, object]] = []
+        for row in rows:
+            # 逐条带条件更新，多个进程同时恢复时每个条目只会被其中一个重新提交
+            cursor = conn.execute(
+                """
+                UPDATE generation_job_items
+                SET status = 'pending', updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status IN ('pending', 'running')
+                  AND updated_at < datetime('now', ?)
+                """,
+                (row["id"], stale_window),
+            )
+            if cursor.rowcount == 1:
+                requeued.append(
+                    {
+                        "id": row["id"],
+                        "ownerId": row["owner_id"],
+                        "chapterId": row["chapter_id"],
+                        "sectionId": row["section_id"],
+                        "difficulty": row["difficulty"],
+                    }
+                )
+        conn.commit()
+    return requeued
+
+
+def finish_generation_item(
+    item_id: int, *, blueprint_id: Optional[str] = None, error: Optional[str] = None
+) -> None:
+    """记录单项结果并累加任务进度，全部结束后任务状态置为 done。"""
+    succeeded = blueprint_id is not None
+    with get_connection() as conn:
+        row = conn.execute(
+            "SELECT job_id FROM generation_job_items WHERE id = ?", (item_id,)
+        ).fetchone()
+        if not row:
+            return
+        cursor = conn.execute(
+            """
+            UPDATE generation_job_items
+            SET status = ?, blueprint_id = ?, error = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'running'
+            """,
+            ("done" if succeeded else "failed", blueprint_id, error, item_id),
+        )
+        # 条目已被重新排队或已由其他线程结束时不再重复计数
+        if cursor.rowcount != 1:
+            conn.commit()
+            return
+        conn.execute(
+            """
+            UPDATE generation_jobs
+            SET completed = completed + ?,
+                failed = failed + ?,
+                status = CASE WHEN completed + failed + 1 >= total THEN 'done' ELSE status END,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            """,
+            (1 if succeeded else 0, 0 if succeeded else 1, row["job_id"]),
+        )
+        conn.commit()
+
+
+def get_generation_job(job_id: str) -> Optional[Dict[str, object]]:
+    with get_connection() as conn:
+        job = conn.execute("SELECT * FROM generation_jobs WHERE id = ?", (job_id,)).fetchone()
+        if not job:
+            return None
+        items = conn.execute(
+            """
+            SELECT i.id, i.chapter_id, i.section_id, i.difficulty, i.status, i.blueprint_id,
+                   i.error, i.updated_at, b.title AS blueprint_title
+            FROM generation_job_items i
+            LEFT JOIN scenario_blueprints b ON b.id = i.blueprint_id
+            WHERE i.job_id = ?
+            ORDER BY i.id
+            """,
+            (job_id,),
+        ).fetchall()
+    return {
+        "id": job["id"],
+        "ownerId": job["owner_id"],
+        "status": job["status"],
+        "total": job["total"],
+        "completed": job["completed"],
+        "failed": job["failed"],
+        "createdAt": job["created_at"],
+        "updatedAt": job["updated_at"],
+        "items": [
+            {
+                "id": item["id"],
+                "chapterId": item["chapter_id"],
+                "sectionId": item["section_id"],
+                "difficulty": item["difficulty"],
+                "status": item["status"],
+                "blueprintId": item["blueprint_id"],
+                "blueprintTitle": item["blueprint_title"],
+                "error": item["error"],
+                "updatedAt": item["updated_at"],
+            }
+            for item in items
+        ],
+    }
+
+
 def list_blueprints(owner_id: int) -> List[Dict[str, object]]:
     with get_connection() as conn:
         rows = conn.execute(
@@ -1865,65 +3579,167 @@ def get_assignment(assignment_id: str) -> Optional[Dict[str, object]]:
     return _parse_assignment_row(row)
 
 
-def list_assignments_by_teacher(owner_id: int) -> List[Dict[str, object]]:
+_ASSIGNMENT_STATUS_FILTERS = {"pending", "in_progress", "completed"}
+
+
+def list_assignments_by_teacher(
+    owner_id: int,
+    *,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    chapter_id: Optional[str] = None,
+    section_id: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> Dict[str, object]:
+    """按 (created_at, id) 倒序分页返回教师布置的作业，完成情况只对当前页聚合。"""
+    page_size = _page_limit(limit)
+    after = _decode_cursor(cursor, 2)
+    clauses = ["a.owner_id = ?"]
+    params: List[object] = [owner_id]
+    _append_filters(
+        "a", clauses, params, chapter_id=chapter_id, section_id=section_id, difficulty=difficulty
+    )
+    _append_date_range("a.created_at", date_from, date_to, clauses, params)
+
     with get_connection() as conn:
+        total = None
+        if after is None:
+            total = conn.execute(
+                f"SELECT COUNT(*) FROM assignments a WHERE {' AND '.join(clauses)}", params
+            ).fetchone()[0]
+        page_clauses = list(clauses)
+        page_params = list(params)
+        if after is not None:
+            page_clauses.append("(a.created_at < ? OR (a.created_at = ? AND a.id < ?))")
+            page_params.extend([after[0], after[0], after[1]])
         rows = conn.execute(
-            """
-            SELECT a.*,
-                   COUNT(s.student_id) AS assigned_count,
-                   SUM(CASE WHEN s.status = 'completed' THEN 1 ELSE 0 END) AS completed_count,
-                   SUM(CASE WHEN s.status = 'in_progress' THEN 1 ELSE 0 END) AS in_progress_count,
-                   GROUP_CONCAT(DISTINCT s.student_id) AS student_ids
+            f"""
+            SELECT a.*
             FROM assignments a
-            LEFT JOIN assignment_students s ON s.assignment_id = a.id
-            WHERE a.owner_id = ?
-            GROUP BY a.id
-            ORDER BY a.created_at DESC
+            WHERE {' AND '.join(page_clauses)}
+            ORDER BY a.created_at DESC, a.id DESC
+            LIMIT ?
             """,
-            (owner_id,),
+            (*page_params, page_size + 1),
         ).fetchall()
+        page_rows = rows[:page_size]
+        stats: Dict[str, sqlite3.Row] = {}
+        if page_rows:
+            placeholders = ", ".join("?" for _ in page_rows)
+            stats = {
+                row["assignment_id"]: row
+                for row in conn.execute(
+                    f"""
+                    SELECT assignment_id,
+                           COUNT(student_id) AS assigned_count,
+                           SUM(CASE WHEN status = 'completed' THEN 1 ELSE 0 END) AS completed_count,
+                           SUM(CASE WHEN status = 'in_progress' THEN 1 ELSE 0 END) AS in_progress_count,
+                           GROUP_CONCAT(DISTINCT student_id) AS student_ids
+                    FROM assignment_students
+                    WHERE assignment_id IN ({placeholders})
+                    GROUP BY assignment_id
+                    """,
+                    [row["id"] for row in page_rows],
+                )
+            }
 
     results: List[Dict[str, object]] = []
-    for row in rows:
+    for row in page_rows:
+        stat = stats.get(row["id"])
         payload = _parse_assignment_row(row)
         payload.update(
             {
-                "assignedCount": row["assigned_count"],
-                "completedCount": row["completed_count"],
-                "inProgressCount": row["in_progress_count"],
+                "assignedCount": stat["assigned_count"] if stat else 0,
+                "completedCount": stat["completed_count"] if stat else 0,
+                "inProgressCount": stat["in_progress_count"] if stat else 0,
                 "studentIds": [
                     int(value)
-                    for value in (row["student_ids"] or "").split(",")
+                    for value in ((stat["student_ids"] if stat else None) or "").split(",")
                     if str(value).strip()
                 ],
             }
         )
         results.append(payload)
-    return results
+    return _page_result(
+        results,
+        len(rows) > page_size,
+        lambda item: (item["createdAt"], item["id"]),
+        total,
+    )
 
 
-def list_assignments_for_student(student_id: int) -> List[Dict[str, object]]:
+def list_assignments_for_student(
+    student_id: int,
+    *,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    chapter_id: Optional[str] = None,
+    section_id: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    status: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> Dict[str, object]:
+    page_size = _page_limit(limit)
+    after = _decode_cursor(cursor, 2)
+    clauses = ["s.student_id = ?"]
+    params: List[object] = [student_id]
+    _append_filters(
+        "a", clauses, params, chapter_id=chapter_id, section_id=section_id, difficulty=difficulty
+    )
+    if status:
+        if status not in _ASSIGNMENT_STATUS_FILTERS:
+            raise ValueError(f"Unknown assignment status: {status}")
+        clauses.append("s.status = ?")
+        params.append(status)
+    _append_date_range("a.created_at", date_from, date_to, clauses, params)
+
     with get_connection() as conn:
+        total = None
+        if after is None:
+            total = conn.execute(
+                f"""
+                SELECT COUNT(*)
+                FROM assignments a
+                JOIN assignment_students s ON s.assignment_id = a.id
+                WHERE {' AND '.join(clauses)}
+                """,
+                params,
+            ).fetchone()[0]
+        page_clauses = list(clauses)
+        page_params = list(params)
+        if after is not None:
+            page_clauses.append("(a.created_at < ? OR (a.created_at = ? AND a.id < ?))")
+            page_params.extend([after[0], after[0], after[1]])
         rows = conn.execute(
-            """
+            f"""
             SELECT a.*, s.status, s.session_id, s.submitted_at
             FROM assignments a
             JOIN assignment_students s ON s.assignment_id = a.id
-            WHERE s.student_id = ?
-            ORDER BY a.created_at DESC
+            WHERE {' AND '.join(page_clauses)}
+            ORDER BY a.created_at DESC, a.id DESC
+            LIMIT ?
             """,
-            (student_id,),
+            (*page_params, page_size + 1),
         ).fetchall()
 
-    return [
+    assignments = [
         {
             **_parse_assignment_row(row),
             "status": row["status"],
             "sessionId": row["session_id"],
             "submittedAt": row["submitted_at"],
         }
-        for row in rows
+        for row in rows[:page_size]
     ]
+    return _page_result(
+        assignments,
+        len(rows) > page_size,
+        lambda item: (item["createdAt"], item["id"]),
+        total,
+    )
 
 
 def get_assignment_for_student(
@@ -1998,6 +3814,7 @@ def mark_assignment_completed_by_session(session_id: str) -> None:
 def bulk_import_students(records: List[Dict[str, str]]) -> Dict[str, int]:
     created = 0
     updated = 0
+    updated_ids: List[int] = []
     with get_connection() as conn:
         for record in records:
             username = (record.get("id") or "").strip()
@@ -2017,6 +3834,7 @@ def bulk_import_students(records: List[Dict[str, str]]) -> Dict[str, int]:
                     "UPDATE users SET password_hash = ?, display_name = ? WHERE id = ?",
                     (password_hash, display_name, existing["id"]),
                 )
+                updated_ids.append(int(existing["id"]))
                 updated += 1
             else:
                 conn.execute(
@@ -2025,6 +3843,7 @@ def bulk_import_students(records: List[Dict[str, str]]) -> Dict[str, int]:
                 )
                 created += 1
         conn.commit()
+    token_cache.invalidate_users(updated_ids)
     return {"created": created, "updated": updated}
 
 
@@ -2036,6 +3855,7 @@ def update_user_password(user_id: int, new_password: str) -> None:
             (password_hash, user_id),
         )
         conn.commit()
+    token_cache.invalidate_user(user_id)
 
 
 def update_user_profile(user_id: int, display_name: str) -> None:
@@ -2045,6 +3865,7 @@ def update_user_profile(user_id: int, display_name: str) -> None:
             (display_name, user_id),
         )
         conn.commit()
+    token_cache.invalidate_user(user_id)
 
 
 def verify_user_password(user_id: int, password: str) -> bool:
@@ -2062,35 +3883,32 @@ def get_class_analytics() -> Dict[str, object]:
     with get_connection() as conn:
         trend_rows = conn.execute(
             """
-            SELECT s.chapter_id, s.section_id,
-                   json_extract(s.scenario_json, '$.scenario_title') AS title,
-                   strftime('%Y-%W', e.created_at) AS week,
-                   AVG(e.score) AS avg_score,
-                   AVG(e.bargaining_win_rate) AS avg_bargaining,
-                   COUNT(*) AS sample_size
-            FROM evaluations e
-            JOIN chat_sessions s ON s.id = e.session_id
-            GROUP BY s.chapter_id, s.section_id, week
-            ORDER BY week DESC, s.chapter_id, s.section_id
-            LIMIT 60
+            SELECT chapter_id, section_id, section_title AS title, week,
+                   CASE WHEN score_count > 0 THEN score_sum / score_count END AS avg_score,
+                   CASE WHEN bargaining_count > 0 THEN bargaining_sum / bargaining_count END
+                       AS avg_bargaining,
+                   sample_size
+            FROM weekly_section_stats
+            ORDER BY week DESC, chapter_id, section_id
+            LIMIT 20
             """
         ).fetchall()
 
         knowledge_rows = conn.execute(
             """
-            SELECT kp.value AS knowledge_point, e.score, e.bargaining_win_rate
-            FROM evaluations e
-            JOIN json_each(e.knowledge_points_json) AS kp
-            WHERE kp.value IS NOT NULL AND kp.value != ''
+            SELECT knowledge_point, evaluation_count, score_sum, score_count
+            FROM class_knowledge_stats
+            ORDER BY evaluation_count DESC, knowledge_point
+            LIMIT 15
             """
         ).fetchall()
 
         action_rows = conn.execute(
             """
-            SELECT kp.value AS action_item
-            FROM evaluations e
-            JOIN json_each(e.action_items_json) AS kp
-            WHERE kp.value IS NOT NULL AND kp.value != ''
+            SELECT action_item, evaluation_count
+            FROM class_action_stats
+            ORDER BY evaluation_count DESC, action_item
+            LIMIT 15
             """
         ).fetchall()
 
@@ -2113,50 +3931,158 @@ def get_class_analytics() -> Dict[str, object]:
             }
         )
 
-    knowledge_stats: Dict[str, Dict[str, float]] = defaultdict(
-        lambda: {"count": 0, "score_sum": 0.0, "score_count": 0}
-    )
-    for row in knowledge_rows:
-        kp = row["knowledge_point"]
-        stats = knowledge_stats[kp]
-        stats["count"] += 1
-        value = row["score"] if row["score"] is not None else row["bargaining_win_rate"]
-        if value is not None:
-            stats["score_sum"] += float(value)
-            stats["score_count"] += 1
-
     knowledge_weakness = []
-    for kp, stats in knowledge_stats.items():
+    for row in knowledge_rows:
         entry = {
-            "label": kp,
-            "knowledgePoint": kp,
-            "count": stats["count"],
+            "label": row["knowledge_point"],
+            "knowledgePoint": row["knowledge_point"],
+            "count": row["evaluation_count"],
         }
-        if stats["score_count"]:
-            entry["averageScore"] = stats["score_sum"] / stats["score_count"]
+        if row["score_count"]:
+            entry["averageScore"] = row["score_sum"] / row["score_count"]
         knowledge_weakness.append(entry)
 
-    knowledge_weakness.sort(key=lambda item: (-item["count"], item["label"]))
-
-    action_counts: Dict[str, int] = defaultdict(int)
-    for row in action_rows:
-        action_counts[row["action_item"]] += 1
-
     action_hotspots = [
-        {"label": label, "actionItem": label, "count": count}
-        for label, count in action_counts.items()
+        {"label": row["action_item"], "actionItem": row["action_item"], "count": row["evaluation_count"]}
+        for row in action_rows
     ]
-    action_hotspots.sort(key=lambda item: (-item["count"], item["label"]))
 
     return {
-        "weeklyTrends": weekly_trends[:20],
-        "knowledgeWeakness": knowledge_weakness[:15],
-        "actionHotspots": action_hotspots[:15],
+        "weeklyTrends": weekly_trends,
+        "knowledgeWeakness": knowledge_weakness,
+        "actionHotspots": action_hotspots,
+    }
+
+
+def record_llm_usage(
+    *,
+    purpose: str,
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    estimated_prompt_tokens: int,
+    is_estimated: bool,
+    session_id: Optional[str] = None,
+    chapter_id: Optional[str] = None,
+    section_id: Optional[str] = None,
+    difficulty: Optional[str] = None,
+) -> None:
+    with get_connection() as conn:
+        conn.execute(
+            """
+            INSERT INTO llm_usage (
+                session_id, purpose, chapter_id, section_id, difficulty, model,
+                prompt_tokens, completion_tokens, estimated_prompt_tokens, is_estimated
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                session_id,
+                purpose,
+                chapter_id,
+                section_id,
+                difficulty,
+                model,
+                prompt_tokens,
+                completion_tokens,
+                estimated_prompt_tokens,
+                1 if is_estimated else 0,
+            ),
+        )
+        conn.commit()
+
+
+def get_llm_usage_report(days: int = 30) -> Dict[str, object]:
+    since = f"-{max(int(days), 1)} days"
+    totals_columns = """
+        COUNT(*) AS calls,
+        COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens,
+        COALESCE(SUM(completion_tokens), 0) AS completion_tokens,
+        COALESCE(SUM(estimated_prompt_tokens), 0) AS estimated_prompt_tokens
+    """
+    with get_connection() as conn:
+        purpose_rows = conn.execute(
+            f"""
+            SELECT purpose, {totals_columns}
+            FROM llm_usage
+            WHERE created_at >= datetime('now', ?)
+            GROUP BY purpose
+            ORDER BY prompt_tokens + completion_tokens DESC
+            """,
+            (since,),
+        ).fetchall()
+        section_rows = conn.execute(
+            f"""
+            SELECT u.chapter_id, u.section_id, u.purpose, sec.title AS section_title,
+                   {totals_columns}
+            FROM llm_usage u
+            LEFT JOIN level_sections sec ON sec.id = u.section_id
+            WHERE u.created_at >= datetime('now', ?) AND u.section_id IS NOT NULL
+            GROUP BY u.chapter_id, u.section_id, u.purpose
+            ORDER BY prompt_tokens + completion_tokens DESC
+            LIMIT 30
+            """,
+            (since,),
+        ).fetchall()
+        difficulty_rows = conn.execute(
+            f"""
+            SELECT difficulty, {totals_columns},
+                   COUNT(DISTINCT session_id) AS sessions
+            FROM llm_usage
+            WHERE created_at >= datetime('now', ?) AND difficulty IS NOT NULL
+            GROUP BY difficulty
+            ORDER BY prompt_tokens + completion_tokens DESC
+            """,
+            (since,),
+        ).fetchall()
+        session_rows = conn.execute(
+            f"""
+            SELECT session_id, MAX(section_id) AS section_id, {totals_columns}
+            FROM llm_usage
+            WHERE created_at >= datetime('now', ?) AND session_id IS NOT NULL
+            GROUP BY session_id
+            ORDER BY prompt_tokens + completion_tokens DESC
+            LIMIT 10
+            """,
+            (since,),
+        ).fetchall()
+
+    def _totals(row: sqlite3.Row) -> Dict[str, object]:
+        return {
+            "calls": row["calls"],
+            "promptTokens": row["prompt_tokens"],
+            "completionTokens": row["completion_tokens"],
+            "totalTokens": row["prompt_tokens"] + row["completion_tokens"],
+            "estimatedPromptTokens": row["estimated_prompt_tokens"],
+        }
+
+    return {
+        "days": max(int(days), 1),
+        "byPurpose": [{"purpose": row["purpose"], **_totals(row)} for row in purpose_rows],
+        "bySection": [
+            {
+                "chapterId": row["chapter_id"],
+                "sectionId": row["section_id"],
+                "sectionTitle": row["section_title"],
+                "purpose": row["purpose"],
+                **_totals(row),
+            }
+            for row in section_rows
+        ],
+        "byDifficulty": [
+            {"difficulty": row["difficulty"], "sessions": row["sessions"], **_totals(row)}
+            for row in difficulty_rows
+        ],
+        "topSessions": [
+            {"sessionId": row["session_id"], "sectionId": row["section_id"], **_totals(row)}
+            for row in session_rows
+        ],
     }
 
 
 def delete_session(session_id: str) -> None:
     with get_connection() as conn:
+        _remove_session_evaluation_facets(conn, session_id)
+        _remove_session_weekly_stats(conn, session_id)
         conn.execute("DELETE FROM chat_sessions WHERE id = ?", (session_id,))
         conn.commit()
 
@@ -9,10 +9,16 @@ from flask import Blueprint, jsonify, request
 from openpyxl import load_workbook
 
 import database
+from services import scenario_pool
 from services.auth_service import require_role
-from services.scenario_generator import ensure_level_hierarchy, inject_difficulty_metadata
+from services.llm_service import get_response_cache
+from services.scenario_generator import (
+    DIFFICULTY_PROFILES,
+    ensure_level_hierarchy,
+    inject_difficulty_metadata,
+)
 from utils.normalizers import normalize_text
-from utils.validators import as_bool
+from utils.validators import as_bool, page_query_args
 
 bp = Blueprint("admin", __name__)
 
@@ -103,8 +109,15 @@ def reset_student_password(student_id: int):
 @bp.get("/api/admin/students")
 @require_role("teacher")
 def list_students_progress():
-    students = database.list_students_progress()
-    return jsonify({"students": students})
+    try:
+        page = database.list_students_progress(
+            **page_query_args(request.args), search=(request.args.get("q") or "").strip() or None
+        )
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    return jsonify(
+        {"students": page["items"], "nextCursor": page["nextCursor"], "total": page["total"]}
+    )
 
 
 @bp.get("/api/admin/students/<int:student_id>")
@@ -125,6 +138,47 @@ def get_admin_analytics():
     return jsonify(analytics)
 
 
+@bp.get("/api/admin/usage")
+@require_role("teacher")
+def get_admin_usage():
+    """按用途、小节与难度汇总大模型 token 用量，定位最耗 token 的 Prompt。"""
+    try:
+        days = int(request.args.get("days", 30))
+    except (TypeError, ValueError):
+        days = 30
+    return jsonify(database.get_llm_usage_report(days))
+
+
+@bp.get("/api/admin/llm-cache")
+@require_role("teacher")
+def get_llm_cache_stats():
+    cache = get_response_cache()
+    if cache is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **cache.stats()})
+
+
+@bp.post("/api/admin/scenario-pool/warm")
+@require_role("teacher")
+def warm_scenario_pool():
+    """课前为指定小节（默认全部）预生成场景库存。"""
+    data = request.get_json(silent=True) or {}
+    section_ids = data.get("sectionIds")
+    if not section_ids:
+        section_ids = [
+            section["id"]
+            for chapter in database.list_level_hierarchy()
+            for section in chapter.get("sections", [])
+        ]
+    difficulties = list(data.get("difficulties") or DIFFICULTY_PROFILES.keys())
+    unknown = [key for key in difficulties if key not in DIFFICULTY_PROFILES]
+    if unknown:
+        return jsonify({"error": f"Unknown difficulties: {', '.join(map(str, unknown))}"}), 400
+    sections = [section for section in map(database.get_section, section_ids) if section]
+    submitted = scenario_pool.warm_pool(sections, difficulties)
+    return jsonify({"submitted": submitted, "poolSize": scenario_pool.SCENARIO_POOL_SIZE})
+
+
 @bp.get("/api/admin/levels")
 @require_role("teacher")
 def get_admin_levels():
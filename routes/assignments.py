@@ -10,9 +10,19 @@ from typing import Dict, List, Optional
 from flask import Blueprint, Response, jsonify, request, stream_with_context
 
 import database
+from services import scenario_pool
 from services.auth_service import current_user, require_role
+from services.context_manager import build_chat_messages
 from services.document_composer import generate_opening_message
-from services.evaluation_service import evaluate_session
+from services.english_guard import EnglishStreamGuard, repair_reply, rewrite_span
+from services.evaluation_queue import (
+    EVALUATION_WAIT_SECONDS,
+    JobWatch,
+    enqueue_evaluation,
+    parallel_evaluation_enabled,
+    serialize_job,
+)
+from services.llm_gateway import GatewayBusyError, busy_response
 from services.llm_service import complete_chat, stream_chat
 from services.scenario_generator import (
     DIFFICULTY_PROFILES,
@@ -26,9 +36,16 @@ from services.scenario_generator import (
     prepare_scenario_payload,
     render_prompts_from_section,
 )
+from services.usage_ledger import UsageLabels
 from utils.normalizers import normalize_text
-from utils.language import contains_cjk, is_probably_english
-from utils.validators import MissingKeyError, as_bool, require_key
+from utils.language import is_probably_english
+from utils.validators import (
+    MissingKeyError,
+    as_bool,
+    list_filter_args,
+    page_query_args,
+    require_key,
+)
 
 bp = Blueprint("assignments", __name__)
 
@@ -37,41 +54,32 @@ ENGLISH_ONLY_SYSTEM_MESSAGE = (
     "even if the student uses another language unless they explicitly request a bilingual answer."
 )
 
-ENGLISH_REWRITE_SYSTEM_MESSAGE = (
-    "You are a bilingual trade negotiation editor. Rewrite assistant replies into natural, professional English only. "
-    "Preserve the factual content, numbers, and commitments, but remove any Chinese characters or bilingual phrasing."
+ENGLISH_FALLBACK_REPLY = (
+    "Apologies for the confusion. I will continue our negotiation entirely in English from this point forward. "
+    "Could you please restate your last question or proposal so that I can respond precisely?"
 )
 
 
-def _ensure_english_reply(collab_key: str, reply: str) -> str:
+def _ensure_english_reply(
+    collab_key: str, reply: str, usage: Optional[UsageLabels] = None
+) -> str:
     text = normalize_text(reply)
     if is_probably_english(text):
         return text
 
-    rewrite_messages = [
-        {"role": "system", "content": ENGLISH_REWRITE_SYSTEM_MESSAGE},
-        {
-            "role": "user",
-            "content": (
-                "Rewrite the following assistant reply so that it is entirely in English. "
-                "Keep negotiation details, numbers, and commitments accurate, and avoid apologies unless present.\n\n"
-                f"Reply: {text}"
-            ),
-        },
-    ]
+    # 只改写含中文的句子，英文部分原样保留
+    repaired = normalize_text(
+        repair_reply(text, lambda context, span: rewrite_span(collab_key, context, span, usage))
+    )
+    if is_probably_english(repaired):
+        return repaired
 
-    try:
-        rewritten = normalize_text(complete_chat(collab_key, rewrite_messages, temperature=0.2))
-    except Exception:
-        rewritten = ""
+    return ENGLISH_FALLBACK_REPLY
 
-    if is_probably_english(rewritten):
-        return rewritten
 
-    return (
-        "Apologies for the confusion. I will continue our negotiation entirely in English from this point forward. "
-        "Could you please restate your last question or proposal so that I can respond precisely?"
-    )
+def _evaluation_event(job: Dict[str, object]) -> str:
+    payload = json.dumps({"evaluation": job.get("evaluation"), "job": job}, ensure_ascii=False)
+    return f"event: evaluation\ndata: {payload}\n\n"
 
 
 def _serialize_assignment(record: Dict[str, object]) -> Dict[str, object]:
@@ -126,12 +134,18 @@ def start_level():
     if not section:
         return jsonify({"error": "Invalid chapterId or sectionId"}), 404
 
-    try:
-        scenario, difficulty_profile = generate_scenario_for_section(section, difficulty_key)
-    except MissingKeyError as exc:
-        return jsonify({"error": str(exc)}), 500
-    except Exception as exc:
-        return jsonify({"error": f"Failed to generate scenario: {exc}"}), 500
+    pooled = scenario_pool.take_scenario(section, difficulty_key)
+    if pooled:
+        scenario, difficulty_profile = pooled
+    else:
+        try:
+            scenario, difficulty_profile = generate_scenario_for_section(section, difficulty_key)
+        except MissingKeyError as exc:
+            return jsonify({"error": str(exc)}), 500
+        except GatewayBusyError as exc:
+            return busy_response(exc)
+        except Exception as exc:
+            return jsonify({"error": f"Failed to generate scenario: {exc}"}), 500
 
     conversation_prompt, evaluation_prompt = render_prompts_from_section(
         section, scenario, difficulty_key, difficulty_profile
@@ -255,18 +269,38 @@ def create_assignment():
 @require_role("teacher")
 def list_assignments():
     user = current_user()
-    records = database.list_assignments_by_teacher(user.id)
-    payload = [_serialize_assignment(record) for record in records]
-    return jsonify({"assignments": payload})
+    try:
+        page = database.list_assignments_by_teacher(
+            user.id,
+            **page_query_args(request.args),
+            **list_filter_args(request.args, ("chapterId", "sectionId", "difficulty", "from", "to")),
+        )
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    payload = [_serialize_assignment(record) for record in page["items"]]
+    return jsonify(
+        {"assignments": payload, "nextCursor": page["nextCursor"], "total": page["total"]}
+    )
 
 
 @bp.get("/api/student/assignments")
 @require_role("student")
 def list_student_assignments():
     user = current_user()
-    records = database.list_assignments_for_student(user.id)
-    payload = [_serialize_assignment(record) for record in records]
-    return jsonify({"assignments": payload})
+    try:
+        page = database.list_assignments_for_student(
+            user.id,
+            **page_query_args(request.args),
+            **list_filter_args(
+                request.args, ("chapterId", "sectionId", "difficulty", "status", "from", "to")
+            ),
+        )
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    payload = [_serialize_assignment(record) for record in page["items"]]
+    return jsonify(
+        {"assignments": payload, "nextCursor": page["nextCursor"], "total": page["total"]}
+    )
 
 
 @bp.post("/api/assignments/<assignment_id>/start")
@@ -362,58 +396,82 @@ def chat():
     if int(session["user_id"]) != user.id:
         return jsonify({"error": "Forbidden"}), 403
 
-    database.add_message(session_id, "user", user_message)
+    user_message_id = database.add_message(session_id, "user", user_message)
+    # 并行模式下评估只依赖学生本轮发言，立即入队，与对话模型的回复同时进行
+    early_job = enqueue_evaluation(session_id, user_message_id) if parallel_evaluation_enabled() else None
 
-    history_rows = database.get_messages(session_id)
-    history: List[Dict[str, str]] = [
-        {"role": row["role"], "content": row["content"]} for row in history_rows
+    system_messages = [
+        {"role": "system", "content": session["system_prompt"]},
+        {"role": "system", "content": ENGLISH_ONLY_SYSTEM_MESSAGE},
     ]
-
-    messages = [{"role": "system", "content": session["system_prompt"]}]
-    messages.append({"role": "system", "content": ENGLISH_ONLY_SYSTEM_MESSAGE})
-    messages.extend(history)
+    messages = build_chat_messages(session, system_messages, collab_key)
 
     stream_requested = as_bool(request.args.get("stream"))
 
     if stream_requested:
 
         def event_stream():
-            chunks: List[str] = []
-            stream_blocked = False
+            rewrite_usage = UsageLabels.for_session("rewrite", session)
+            # 干净的句子即时放行，只有夹带中文的片段会被单独改写后再推送
+            guard = EnglishStreamGuard(
+                lambda context, span: rewrite_span(collab_key, context, span, rewrite_usage)
+            )
+            received = False
+            watch = JobWatch(session_id, user_message_id) if early_job else None
+            if early_job:
+                job_payload = json.dumps({"job": early_job})
+                yield f"event: evaluation_pending\ndata: {job_payload}\n\n"
             try:
                 # 流式推送 AI 逐步回答，前端可即时渲染
-                for delta in stream_chat(collab_key, messages, temperature=0.7):
+                for delta in stream_chat(
+                    collab_key,
+                    messages,
+                    temperature=0.7,
+                    usage=UsageLabels.for_session("collab", session),
+                ):
                     if not isinstance(delta, str):
                         continue
-                    chunks.append(delta)
-                    if not stream_blocked and contains_cjk(delta):
-                        stream_blocked = True
-                    if stream_blocked:
-                        continue
-                    payload = json.dumps({"content": delta})
-                    yield f"event: chunk\ndata: {payload}\n\n"
+                    received = received or bool(delta.strip())
+                    for piece in guard.feed(delta):
+                        payload = json.dumps({"content": piece})
+                        yield f"event: chunk\ndata: {payload}\n\n"
+                    finished = watch.poll() if watch else None
+                    if finished:
+                        watch = None
+                        if finished["status"] == "done":
+                            yield _evaluation_event(finished)
+                pieces = guard.finish()
             except Exception as exc:
                 database.remove_last_message(session_id)
+                if early_job:
+                    database.cancel_evaluation_job(int(early_job["jobId"]))
                 error_payload = json.dumps({"error": str(exc)})
                 yield f"event: error\ndata: {error_payload}\n\n"
                 return
 
-            ai_reply_raw = "".join(chunks).strip()
-            ai_reply = _ensure_english_reply(
-                collab_key, ai_reply_raw or "(no valid reply received)"
-            )
-            database.add_message(session_id, "assistant", ai_reply)
+            for piece in pieces:
+                payload = json.dumps({"content": piece})
+                yield f"event: chunk\ndata: {payload}\n\n"
 
-            evaluation = evaluate_session(session_id, session)
-            latest_evaluation = database.get_latest_evaluation(session_id)
-            if latest_evaluation:
-                evaluation = latest_evaluation
+            if received:
+                ai_reply = _ensure_english_reply(collab_key, guard.text, rewrite_usage)
+            else:
+                ai_reply = "(no valid reply received)"
+            message_id = database.add_message(session_id, "assistant", ai_reply)
 
-            reply_payload = json.dumps({"reply": ai_reply})
+            reply_payload = json.dumps({"reply": ai_reply, "messageId": message_id})
             yield f"event: summary\ndata: {reply_payload}\n\n"
 
-            evaluation_payload = json.dumps({"evaluation": evaluation})
-            yield f"event: evaluation\ndata: {evaluation_payload}\n\n"
+            if watch:
+                # 回复已结束但评估尚未完成时短暂等待；超时后前端继续凭 messageId 轮询
+                finished = watch.wait(EVALUATION_WAIT_SECONDS)
+                if finished and finished["status"] == "done":
+                    yield _evaluation_event(finished)
+            elif not early_job:
+                # 评估在后台队列中完成，前端凭 messageId 轮询结果
+                job = enqueue_evaluation(session_id, message_id)
+                job_payload = json.dumps({"job": job})
+                yield f"event: evaluation_pending\ndata: {job_payload}\n\n"
 
             yield "event: done\ndata: {}\n\n"
 
@@ -422,20 +480,25 @@ def chat():
         return response
 
     try:
-        raw_reply = complete_chat(collab_key, messages, temperature=0.7).strip()
+        raw_reply = complete_chat(
+            collab_key,
+            messages,
+            temperature=0.7,
+            usage=UsageLabels.for_session("collab", session),
+        ).strip()
     except Exception as exc:
         database.remove_last_message(session_id)
+        if early_job:
+            database.cancel_evaluation_job(int(early_job["jobId"]))
         return jsonify({"error": f"Failed to fetch assistant reply: {exc}"}), 500
 
-    ai_reply = _ensure_english_reply(collab_key, raw_reply)
-    database.add_message(session_id, "assistant", ai_reply)
-
-    evaluation = evaluate_session(session_id, session)
-    latest_evaluation = database.get_latest_evaluation(session_id)
-    if latest_evaluation:
-        evaluation = latest_evaluation
+    ai_reply = _ensure_english_reply(
+        collab_key, raw_reply, UsageLabels.for_session("rewrite", session)
+    )
+    message_id = database.add_message(session_id, "assistant", ai_reply)
+    job = early_job or enqueue_evaluation(session_id, message_id)
 
-    return jsonify({"reply": ai_reply, "evaluation": evaluation})
+    return jsonify({"reply": ai_reply, "messageId": message_id, "evaluationJob": job})
 
 
 @bp.get("/api/sessions")
@@ -449,10 +512,28 @@ def list_sessions():
             return jsonify({"error": "userId is required for teacher queries"}), 400
         target_user_id = int(query_param)
 
-    sessions = database.list_sessions_for_user(target_user_id)
-    for session in sessions:
+    try:
+        page = database.list_sessions_for_user(
+            target_user_id,
+            **page_query_args(request.args),
+            **list_filter_args(
+                request.args, ("chapterId", "sectionId", "difficulty", "status", "from", "to")
+            ),
+        )
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    for session in page["items"]:
         inject_difficulty_metadata(session)
-    return jsonify({"sessions": sessions})
+    return jsonify(
+        {"sessions": page["items"], "nextCursor": page["nextCursor"], "total": page["total"]}
+    )
+
+
+@bp.get("/api/student/victories")
+@require_role("student")
+def list_level_victories():
+    user = current_user()
+    return jsonify({"victories": database.list_level_victories(user.id)})
 
 
 @bp.get("/api/student/dashboard")
@@ -495,6 +576,34 @@ def get_session_detail(session_id: str):
     return jsonify(payload)
 
 
+@bp.get("/api/sessions/<session_id>/evaluation")
+@require_role()
+def get_session_evaluation(session_id: str):
+    """轮询指定消息对应的评估任务，任务被新消息取代时返回最新任务。"""
+    user = current_user()
+    session = database.get_session(session_id)
+    if not session:
+        return jsonify({"error": "Session not found"}), 404
+
+    if user.role == "student" and int(session["user_id"]) != user.id:
+        return jsonify({"error": "Forbidden"}), 403
+
+    message_id: Optional[int] = None
+    raw_message_id = request.args.get("messageId")
+    if raw_message_id:
+        try:
+            message_id = int(raw_message_id)
+        except (TypeError, ValueError):
+            return jsonify({"error": "messageId must be an integer"}), 400
+
+    job = database.get_evaluation_job(session_id, message_id)
+    if job and job["status"] == "superseded":
+        job = database.get_evaluation_job(session_id)
+    if not job:
+        return jsonify({"error": "Evaluation job not found"}), 404
+    return jsonify({"job": serialize_job(job)})
+
+
 @bp.post("/api/sessions/<session_id>/reset")
 @require_role("student")
 def reset_session(session_id: str):
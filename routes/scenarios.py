@@ -2,24 +2,33 @@
 
 from __future__ import annotations
 
-from typing import Dict
+import json
+from typing import Dict, Iterator, Optional
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 
 import database
+from services import batch_generator
 from services.auth_service import current_user, require_role
+from services.llm_gateway import GatewayBusyError, busy_response, stream_chat_blocking
 from services.scenario_generator import (
     DIFFICULTY_PROFILES,
     DEFAULT_DIFFICULTY,
     assemble_scenario_from_blueprint,
+    build_generation_messages,
     ensure_level_hierarchy,
+    finalize_generated_scenario,
     generate_scenario_for_section,
     get_difficulty_profile,
     inject_difficulty_metadata,
+    is_static_section,
+    load_static_scenario,
     prepare_scenario_payload,
 )
+from services.usage_ledger import UsageLabels
+from utils.json_stream import JsonObjectStreamParser
 from utils.normalizers import normalize_text
-from utils.validators import MissingKeyError
+from utils.validators import MissingKeyError, as_bool, extract_json_block, require_key
 
 bp = Blueprint("scenarios", __name__)
 
@@ -140,6 +149,23 @@ def delete_blueprint(blueprint_id: str):
     return jsonify({"status": "deleted"})
 
 
+def _sse(event: str, payload: Dict[str, object]) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def _generated_payload(
+    scenario: Dict[str, object], profile: Dict[str, str], difficulty_key: str, chapter_id: str, section_id: str
+) -> Dict[str, object]:
+    return {
+        "scenario": scenario,
+        "difficulty": difficulty_key,
+        "difficultyLabel": profile.get("label"),
+        "difficultyDescription": profile.get("description"),
+        "chapterId": chapter_id,
+        "sectionId": section_id,
+    }
+
+
 @bp.post("/api/generator/scenario")
 @require_role()
 def generate_scenario():
@@ -158,20 +184,147 @@ def generate_scenario():
         return jsonify({"error": str(exc)}), 404
 
     try:
-        scenario, profile = generate_scenario_for_section(section, difficulty_key)
+        scenario, profile = generate_scenario_for_section(
+            section, difficulty_key, cache=as_bool(data.get("cache"))
+        )
     except MissingKeyError as exc:
         return jsonify({"error": str(exc)}), 500
+    except GatewayBusyError as exc:
+        return busy_response(exc)
     except RuntimeError as exc:
         return jsonify({"error": str(exc)}), 500
     except Exception as exc:  # pragma: no cover - 容忍上游异常
         return jsonify({"error": f"Failed to generate scenario: {exc}"}), 500
 
-    payload = {
-        "scenario": scenario,
-        "difficulty": difficulty_key,
-        "difficultyLabel": profile.get("label"),
-        "difficultyDescription": profile.get("description"),
-        "chapterId": chapter_id,
-        "sectionId": section_id,
-    }
-    return jsonify(payload)
+    return jsonify(_generated_payload(scenario, profile, difficulty_key, chapter_id, section_id))
+
+
+@bp.post("/api/generator/scenario/stream")
+@require_role()
+def stream_generated_scenario():
+    """流式生成场景：顶层字段一旦闭合即推送 field 事件，最后推送完整的 scenario 事件。"""
+    data = request.get_json(force=True)
+    chapter_id = data.get("chapterId")
+    section_id = data.get("sectionId")
+    difficulty_key = str(data.get("difficulty") or DEFAULT_DIFFICULTY).lower()
+
+    if not chapter_id or not section_id:
+        return jsonify({"error": "chapterId and sectionId are required"}), 400
+
+    section = database.get_section_template(chapter_id, section_id)
+    if not section:
+        return jsonify({"error": "Invalid chapterId or sectionId"}), 404
+
+    static_payload: Optional[Dict[str, object]] = None
+    deltas: Iterator[str] = iter(())
+    first_delta = None
+    try:
+        if is_static_section(section):
+            scenario, profile = load_static_scenario(section, difficulty_key)
+            static_payload = _generated_payload(scenario, profile, difficulty_key, chapter_id, section_id)
+        else:
+            generator_key = require_key("DEEPSEEK_GENERATOR_KEY")
+            messages = build_generation_messages(section)
+            deltas = stream_chat_blocking(
+                generator_key,
+                messages,
+                temperature=0.8,
+                usage=UsageLabels.for_section("generator", section, difficulty_key),
+            )
+            # 先取到首个片段再建立 SSE，排队繁忙等错误仍能以普通状态码返回
+            first_delta = next(deltas, None)
+    except MissingKeyError as exc:
+        return jsonify({"error": str(exc)}), 500
+    except GatewayBusyError as exc:
+        return busy_response(exc)
+    except Exception as exc:  # pragma: no cover - 容忍上游异常
+        return jsonify({"error": f"Failed to generate scenario: {exc}"}), 500
+
+    def event_stream():
+        if static_payload is not None:
+            yield _sse("scenario", static_payload)
+            yield "event: done\ndata: {}\n\n"
+            return
+
+        parser = JsonObjectStreamParser()
+        try:
+            if first_delta:
+                for key, value in parser.feed(first_delta):
+                    yield _sse("field", {"key": key, "value": value})
+            for delta in deltas:
+                for key, value in parser.feed(delta):
+                    yield _sse("field", {"key": key, "value": value})
+            raw_scenario = extract_json_block(parser.text)
+            final_scenario, final_profile = finalize_generated_scenario(
+                section, raw_scenario, difficulty_key
+            )
+        except Exception as exc:  # pragma: no cover - 容忍上游异常
+            yield _sse("error", {"error": f"Failed to generate scenario: {exc}"})
+            return
+        yield _sse(
+            "scenario",
+            _generated_payload(final_scenario, final_profile, difficulty_key, chapter_id, section_id),
+        )
+        yield "event: done\ndata: {}\n\n"
+
+    response = Response(stream_with_context(event_stream()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@bp.post("/api/generator/batch")
+@require_role("teacher")
+def submit_batch_generation():
+    """批量生成场景蓝图：items 为 (chapterId, sectionId, difficulty, count) 列表，返回任务 ID 供轮询。"""
+    user = current_user()
+    data = request.get_json(force=True)
+    raw_items = data.get("items")
+    if not isinstance(raw_items, list) or not raw_items:
+        return jsonify({"error": "items must be a non-empty list"}), 400
+
+    max_items = batch_generator.SCENARIO_BATCH_MAX_ITEMS
+    expanded = []
+    for entry in raw_items:
+        if not isinstance(entry, dict):
+            return jsonify({"error": "Each item must be an object"}), 400
+        chapter_id = entry.get("chapterId")
+        section_id = entry.get("sectionId")
+        if not chapter_id or not section_id:
+            return jsonify({"error": "chapterId and sectionId are required"}), 400
+        try:
+            count = int(entry.get("count") or 1)
+        except (TypeError, ValueError):
+            return jsonify({"error": "count must be an integer"}), 400
+        if count < 1:
+            return jsonify({"error": "count must be at least 1"}), 400
+        # 展开前先按上限校验，避免超大 count 在内存中构造巨型列表
+        if count > max_items - len(expanded):
+            return jsonify({"error": f"At most {max_items} scenarios per batch"}), 400
+        if not database.get_section_template(chapter_id, section_id):
+            return jsonify({"error": f"Invalid section {chapter_id}/{section_id}"}), 404
+        difficulty_key = str(entry.get("difficulty") or DEFAULT_DIFFICULTY).lower()
+        if difficulty_key not in DIFFICULTY_PROFILES:
+            message = f"Unknown difficulty '{difficulty_key}' for {chapter_id}/{section_id}"
+            return jsonify({"error": message}), 400
+        expanded.extend(
+            [{"chapterId": chapter_id, "sectionId": section_id, "difficulty": difficulty_key}] * count
+        )
+
+    try:
+        require_key("DEEPSEEK_GENERATOR_KEY")
+    except MissingKeyError as exc:
+        return jsonify({"error": str(exc)}), 500
+
+    job = batch_generator.submit_batch(user.id, expanded)
+    return jsonify({"job": job}), 202
+
+
+@bp.get("/api/generator/batch/<job_id>")
+@require_role("teacher")
+def get_batch_generation(job_id: str):
+    """查询批量生成进度，完成的条目附带蓝图 ID。"""
+    user = current_user()
+    job = database.get_generation_job(job_id)
+    if not job or int(job["ownerId"]) != user.id:
+        return jsonify({"error": "Generation job not found"}), 404
+    return jsonify({"job": job})
@@ -9,6 +9,7 @@ from flask import abort, g, jsonify, request
 
 import database
 from models.user import User
+from utils.token_cache import token_cache
 
 ErrorResponse = Tuple[Dict[str, str], int]
 
@@ -29,9 +30,12 @@ def resolve_user(required_role: Optional[str] = None) -> Tuple[Optional[User], O
     token = extract_token()
     if not token:
         return None, ({"error": "Authentication required"}, 401)
-    raw_user = database.get_user_by_token(token)
-    if not raw_user:
-        return None, ({"error": "Invalid or expired token"}, 401)
+    raw_user = token_cache.get(token)
+    if raw_user is None:
+        raw_user = database.get_user_by_token(token)
+        if not raw_user:
+            return None, ({"error": "Invalid or expired token"}, 401)
+        token_cache.put(token, raw_user)
     user = User.from_record(raw_user)
     if required_role and user.role != required_role:
         return None, ({"error": "Forbidden"}, 403)
@@ -0,0 +1,96 @@
+"""批量场景生成：教师一次提交多个小节，后台线程池并发生成并保存为场景蓝图。"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import database
+from services.llm_gateway import GatewayBusyError
+from services.scenario_generator import generate_scenario_for_section
+
+logger = logging.getLogger(__name__)
+
+SCENARIO_BATCH_WORKERS = int(os.getenv("SCENARIO_BATCH_WORKERS", "4"))
+SCENARIO_BATCH_MAX_ITEMS = int(os.getenv("SCENARIO_BATCH_MAX_ITEMS", "40"))
+SCENARIO_BATCH_BUSY_RETRIES = 3
+# 启动时条目停留在 pending/running 超过该秒数即视为提交它的进程已退出，由当前进程接手
+SCENARIO_BATCH_STALE_SECONDS = int(os.getenv("SCENARIO_BATCH_STALE_SECONDS", "600"))
+
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+
+
+def submit_batch(owner_id: int, items: List[Dict[str, str]]) -> Dict[str, object]:
+    """登记任务并把每一项交给线程池，立即返回任务信息供前端轮询。"""
+    job = database.create_generation_job(owner_id, items)
+    with _lock:
+        executor = _get_executor()
+    for item in job["items"]:
+        executor.submit(_generate_item, owner_id, dict(item))
+    return job
+
+
+def resume_stale_items() -> int:
+    """重新提交进程重启后遗留的未完成条目，使批量任务最终能够结束；只在进程启动时调用。"""
+    items = database.requeue_stale_generation_items(SCENARIO_BATCH_STALE_SECONDS)
+    if not items:
+        return 0
+    with _lock:
+        executor = _get_executor()
+    for item in items:
+        executor.submit(_generate_item, int(item["ownerId"]), item)
+    return len(items)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ThreadPoolExecutor(
+            max_workers=max(1, SCENARIO_BATCH_WORKERS), thread_name_prefix="scenario-batch"
+        )
+        _executor_pid = os.getpid()
+    return _executor
+
+
+def _generate_item(owner_id: int, item: Dict[str, object]) -> None:
+    item_id = int(item["id"])
+    difficulty_key = str(item["difficulty"])
+    if not database.start_generation_item(item_id):
+        return
+    try:
+        section = database.get_section_template(str(item["chapterId"]), str(item["sectionId"]))
+        if not section:
+            raise RuntimeError("Section not found")
+        scenario = _generate_with_backoff(section, difficulty_key)
+        record = database.create_blueprint(
+            owner_id=owner_id,
+            title=scenario.get("scenario_title") or section.get("title") or "未命名关卡",
+            description=scenario.get("scenario_summary", ""),
+            difficulty=difficulty_key,
+            blueprint=scenario,
+        )
+    except Exception as exc:  # pragma: no cover - 单项失败不影响同批其他小节
+        logger.exception("Batch generation failed for %s/%s", item.get("sectionId"), difficulty_key)
+        database.finish_generation_item(item_id, error=str(exc) or exc.__class__.__name__)
+        return
+    database.finish_generation_item(item_id, blueprint_id=str(record["id"]))
+
+
+def _generate_with_backoff(section: Dict[str, object], difficulty_key: str) -> Dict[str, object]:
+    # 网关积压时按其建议的间隔重试，避免整批因瞬时拥塞失败
+    attempts = 0
+    while True:
+        try:
+            scenario, _ = generate_scenario_for_section(section, difficulty_key)
+            return scenario
+        except GatewayBusyError as exc:
+            attempts += 1
+            if attempts > SCENARIO_BATCH_BUSY_RETRIES:
+                raise
+            time.sleep(max(exc.retry_after, 0.5))
@@ -0,0 +1,119 @@
+"""对话上下文管理：按 token 预算组装历史，较早的轮次滚动压缩为摘要。"""
+
+from __future__ import annotations
+
+import logging
+import os
+from typing import Dict, List, Optional
+
+import database
+from services.llm_service import MODEL, complete_chat
+from services.usage_ledger import UsageLabels
+from utils.tokens import estimate_message_tokens
+
+logger = logging.getLogger(__name__)
+
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "6000"))
+CHAT_CONTEXT_KEEP_TURNS = int(os.getenv("CHAT_CONTEXT_KEEP_TURNS", "4"))
+
+# 各模型可用于对话历史的 prompt 预算，未登记的模型使用默认值
+MODEL_CONTEXT_BUDGETS: Dict[str, int] = {
+    MODEL: CHAT_CONTEXT_TOKEN_BUDGET,
+}
+
+SUMMARY_SYSTEM_MESSAGE = (
+    "You maintain a running summary of a trade negotiation between a student and an AI counterpart. "
+    "Merge the previous summary with the new dialogue into concise English bullet points. Preserve every "
+    "price, quantity, date, term, concession and commitment exactly, and list the issues still open. "
+    "Keep it under 200 words and do not add information that is not in the dialogue."
+)
+
+
+def context_budget(model: str = MODEL) -> int:
+    return MODEL_CONTEXT_BUDGETS.get(model, CHAT_CONTEXT_TOKEN_BUDGET)
+
+
+def build_chat_messages(
+    session: Dict[str, object],
+    system_messages: List[Dict[str, str]],
+    api_key: str,
+    *,
+    model: str = MODEL,
+) -> List[Dict[str, str]]:
+    """返回发送给对话模型的完整消息列表。
+
+    未超预算时与原先一样携带全部历史；超出后把最近 K 轮之前的消息并入
+    会话摘要（持久化在 chat_sessions 上，后续轮次直接复用），仍超出时再
+    从最早的消息开始截断。
+    """
+    session_id = str(session["id"])
+    summary = str(session.get("context_summary") or "")
+    _, rows = database.get_messages_after(session_id, int(session.get("context_summary_upto") or 0))
+    history = [{"role": row["role"], "content": row["content"]} for row in rows]
+
+    budget = context_budget(model)
+    messages = _compose(system_messages, summary, history)
+    if budget <= 0 or estimate_message_tokens(messages) <= budget:
+        return messages
+
+    keep = max(CHAT_CONTEXT_KEEP_TURNS, 1) * 2
+    older, recent = rows[:-keep], rows[-keep:]
+    if older:
+        updated = _summarize(api_key, summary, older, UsageLabels.for_session("summary", session))
+        if updated:
+            summary = updated
+            database.save_context_summary(session_id, summary, int(older[-1]["id"]))
+            history = [{"role": row["role"], "content": row["content"]} for row in recent]
+    return _trim_to_budget(system_messages, summary, history, budget)
+
+
+def _compose(
+    system_messages: List[Dict[str, str]], summary: str, history: List[Dict[str, str]]
+) -> List[Dict[str, str]]:
+    messages = list(system_messages)
+    if summary:
+        messages.append(
+            {"role": "system", "content": f"[Summary of the earlier conversation]\n{summary}"}
+        )
+    messages.extend(history)
+    return messages
+
+
+def _trim_to_budget(
+    system_messages: List[Dict[str, str]],
+    summary: str,
+    history: List[Dict[str, str]],
+    budget: int,
+) -> List[Dict[str, str]]:
+    # 至少保留最后一条消息（学生本轮发言）
+    start = 0
+    messages = _compose(system_messages, summary, history)
+    while start < len(history) - 1 and estimate_message_tokens(messages) > budget:
+        start += 1
+        messages = _compose(system_messages, summary, history[start:])
+    return messages
+
+
+def _summarize(
+    api_key: str, previous: str, rows: List[Dict[str, object]], usage: UsageLabels
+) -> Optional[str]:
+    dialogue = "\n".join(
+        f"{'Student' if row['role'] == 'user' else 'Counterpart'}: {row['content']}" for row in rows
+    )
+    prompt = (
+        f"Previous summary:\n{previous or '(none)'}\n\nNew dialogue:\n{dialogue}\n\nUpdated summary:"
+    )
+    try:
+        summary = complete_chat(
+            api_key,
+            [
+                {"role": "system", "content": SUMMARY_SYSTEM_MESSAGE},
+                {"role": "user", "content": prompt},
+            ],
+            temperature=0.2,
+            usage=usage,
+        )
+    except Exception:  # pragma: no cover - 摘要失败时退回截断
+        logger.warning("Failed to summarize conversation history", exc_info=True)
+        return None
+    return summary.strip() or None
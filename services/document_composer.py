@@ -304,7 +304,7 @@ def generate_opening_message(section_id: Optional[str], scenario: Dict[str, obje
     return fallback or "Hello, this is your negotiation partner. Let's begin our discussion in English."
 
 
-def build_transcript(history: List[Dict[str, str]], scenario: Dict[str, object]) -> str:
+def build_transcript_header(scenario: Dict[str, object]) -> str:
     lines: List[str] = []
     lines.append(f"場景標題: {scenario.get('scenario_title', '')}")
     lines.append(f"場景摘要: {scenario.get('scenario_summary', '')}")
@@ -313,22 +313,33 @@ def build_transcript(history: List[Dict[str, str]], scenario: Dict[str, object])
     lines.append(f"產品資訊: {scenario.get('product', {})}")
     lines.append(f"市場與物流: {scenario.get('market_landscape', '')}；{scenario.get('logistics', '')}")
     lines.append("對話逐字稿：")
+    return "\n".join(lines)
 
+
+def resolve_transcript_speaker(scenario: Dict[str, object]) -> str:
     ai_name = "AI"
     ai_company = scenario.get("ai_company", {}) or {}
     if isinstance(ai_company, dict):
         ai_company_name = ai_company.get("name")
         if isinstance(ai_company_name, str) and ai_company_name:
             ai_name = ai_company_name
+    return ai_name
+
 
-    for message in history:
-        role = message.get("role")
-        content = message.get("content", "")
-        if role == "user":
-            speaker = "學生"
-        elif role == "assistant":
-            speaker = ai_name
-        else:
-            speaker = role or "系統"
-        lines.append(f"{speaker}: {content}")
+def format_transcript_line(message: Dict[str, object], ai_name: str) -> str:
+    role = message.get("role")
+    content = message.get("content", "")
+    if role == "user":
+        speaker = "學生"
+    elif role == "assistant":
+        speaker = ai_name
+    else:
+        speaker = role or "系統"
+    return f"{speaker}: {content}"
+
+
+def build_transcript(history: List[Dict[str, str]], scenario: Dict[str, object]) -> str:
+    ai_name = resolve_transcript_speaker(scenario)
+    lines = [build_transcript_header(scenario)]
+    lines.extend(format_transcript_line(message, ai_name) for message in history)
     return "\n".join(lines)
@@ -0,0 +1,129 @@
+"""对话回复的英文守卫：按句切分，干净的句子直接放行，只改写含中日韩字符的片段。"""
+
+from __future__ import annotations
+
+import logging
+import re
+from typing import Callable, List, Optional, Tuple
+
+from services.llm_service import complete_chat
+from services.usage_ledger import UsageLabels
+from utils.language import cjk_ratio, contains_cjk, is_probably_english
+
+logger = logging.getLogger(__name__)
+
+ENGLISH_REWRITE_SYSTEM_MESSAGE = (
+    "You are a bilingual trade negotiation editor. Rewrite assistant replies into natural, professional English only. "
+    "Preserve the factual content, numbers, and commitments, but remove any Chinese characters or bilingual phrasing."
+)
+
+# 英文句末标点需后跟空白才算断句，避免把 3.5 或 U.S. 中间切开；中文标点与换行直接断句
+_SENTENCE_BOUNDARY = re.compile(r"[.!?]+[\"'”’)\]]*\s+|[。！？；]+\s*|\n+")
+
+# 中文占比超过该值时整段改写一次，避免中英交替的回复逐句触发多次改写
+MOSTLY_CJK_RATIO = 0.5
+
+# 参数依次为已放行的上文与待修复的片段，返回英文片段，无法修复时返回空串
+SpanRepairer = Callable[[str, str], str]
+
+
+def split_sentences(text: str) -> Tuple[List[str], str]:
+    """切出已完整的句子（保留句末标点与空白），返回句子列表与未结束的尾部。"""
+    sentences: List[str] = []
+    start = 0
+    for match in _SENTENCE_BOUNDARY.finditer(text):
+        sentences.append(text[start : match.end()])
+        start = match.end()
+    return sentences, text[start:]
+
+
+class EnglishStreamGuard:
+    """逐段接收模型输出，返回可以立即推送给前端的文本片段。
+
+    只有未结束的句子会被暂存；遇到含 CJK 的句子时，与其后相邻的同类句子
+    合并为一个片段，等到下一句干净的句子或流结束时再整体修复，因此整段
+    中文回复只会触发一次改写。
+    """
+
+    def __init__(self, repair: SpanRepairer) -> None:
+        self._repair = repair
+        self._pending = ""
+        self._flagged: List[str] = []
+        self._emitted: List[str] = []
+
+    @property
+    def text(self) -> str:
+        return "".join(self._emitted)
+
+    def feed(self, delta: str) -> List[str]:
+        self._pending += delta
+        sentences, self._pending = split_sentences(self._pending)
+        return self._process(sentences)
+
+    def finish(self) -> List[str]:
+        sentences = [self._pending] if self._pending else []
+        self._pending = ""
+        output = self._process(sentences)
+        output.extend(self._flush_flagged())
+        return output
+
+    def _process(self, sentences: List[str]) -> List[str]:
+        output: List[str] = []
+        for sentence in sentences:
+            if contains_cjk(sentence) or (self._flagged and not sentence.strip()):
+                self._flagged.append(sentence)
+                continue
+            output.extend(self._flush_flagged(sentence))
+            self._emitted.append(sentence)
+            output.append(sentence)
+        return output
+
+    def _flush_flagged(self, following: str = "") -> List[str]:
+        if not self._flagged:
+            return []
+        span = "".join(self._flagged)
+        self._flagged = []
+        repaired = (self._repair(self.text, span) or "").strip()
+        if not repaired or not is_probably_english(repaired):
+            return []
+        # 保留原片段末尾的空白；中文句号后通常没有空格，需要补一个与下一句隔开
+        trailing = span[len(span.rstrip()) :]
+        if not trailing and following and not following[0].isspace():
+            trailing = " "
+        repaired += trailing
+        self._emitted.append(repaired)
+        return [repaired]
+
+
+def repair_reply(text: str, repair: SpanRepairer) -> str:
+    """对完整回复应用同样的逐句修复，供非流式接口使用。"""
+    if cjk_ratio(text) >= MOSTLY_CJK_RATIO:
+        return repair("", text) or ""
+    guard = EnglishStreamGuard(repair)
+    guard.feed(text)
+    guard.finish()
+    return guard.text
+
+
+def rewrite_span(
+    api_key: str, context: str, span: str, usage: Optional[UsageLabels] = None
+) -> str:
+    """只把含中文的片段改写为英文，上文仅作衔接参考。"""
+    messages = [
+        {"role": "system", "content": ENGLISH_REWRITE_SYSTEM_MESSAGE},
+        {
+            "role": "user",
+            "content": (
+                "An assistant reply drifted into Chinese. Rewrite only the fragment below into English so that it "
+                "continues the reply naturally. Keep negotiation details, numbers, and commitments accurate. "
+                "Return only the rewritten fragment.\n\n"
+                f"Reply so far: {context.strip() or '(start of reply)'}\n\n"
+                f"Fragment: {span.strip()}"
+            ),
+        },
+    ]
+    try:
+        return complete_chat(api_key, messages, temperature=0.2, cache=True, usage=usage)
+    except Exception:
+        logger.warning("Failed to rewrite non-English reply fragment", exc_info=True)
+        return ""
@@ -0,0 +1,160 @@
+"""评估任务队列：将批改模型调用移出聊天回复路径，由后台线程异步消费。"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import database
+from services.evaluation_service import evaluate_session
+
+logger = logging.getLogger(__name__)
+
+EVALUATION_WORKERS = int(os.getenv("EVALUATION_WORKERS", "4"))
+EVALUATION_POLL_INTERVAL = float(os.getenv("EVALUATION_POLL_INTERVAL", "1.0"))
+EVALUATION_MAX_ATTEMPTS = int(os.getenv("EVALUATION_MAX_ATTEMPTS", "3"))
+EVALUATION_STALE_SECONDS = int(os.getenv("EVALUATION_STALE_SECONDS", "300"))
+# queue：回复生成并入库后再评估；parallel：学生发言入库即开始评估，与回复生成并行
+EVALUATION_MODE = os.getenv("EVALUATION_MODE", "queue").strip().lower()
+# 回复结束后仍占用请求线程等待评估的上限，保持很短，超时后交给前端轮询
+EVALUATION_WAIT_SECONDS = float(os.getenv("EVALUATION_WAIT_SECONDS", "2"))
+
+FINAL_JOB_STATUSES = {"done", "failed", "superseded"}
+
+_wakeup = threading.Event()
+_lock = threading.Lock()
+_workers: List[threading.Thread] = []
+_started_pid: Optional[int] = None
+# 本进程内每完成一个任务计数加一，等待方据此决定何时重新查询数据库
+_job_finished = threading.Condition()
+_finished_count = 0
+
+
+def start_workers(count: Optional[int] = None) -> None:
+    """启动评估后台线程；在 fork 出的新进程中会自动重新拉起。"""
+    global _started_pid
+    with _lock:
+        if _started_pid == os.getpid() and any(worker.is_alive() for worker in _workers):
+            return
+        _workers.clear()
+        _started_pid = os.getpid()
+        database.requeue_stale_evaluation_jobs(EVALUATION_STALE_SECONDS)
+        for index in range(max(1, count or EVALUATION_WORKERS)):
+            worker = threading.Thread(
+                target=_worker_loop,
+                name=f"evaluation-worker-{index}",
+                daemon=True,
+            )
+            worker.start()
+            _workers.append(worker)
+
+
+def enqueue_evaluation(session_id: str, message_id: int) -> Dict[str, object]:
+    """登记一条评估任务并唤醒后台线程，立即返回任务信息。"""
+    job = database.enqueue_evaluation_job(session_id, message_id)
+    start_workers()
+    _wakeup.set()
+    return serialize_job(job)
+
+
+def parallel_evaluation_enabled() -> bool:
+    return EVALUATION_MODE == "parallel"
+
+
+class JobWatch:
+    """等待指定评估任务结束。
+
+    本进程的工作线程完成任务时会立即唤醒等待方；任务被其他进程领取时，
+    每隔 EVALUATION_POLL_INTERVAL 秒回查一次数据库。
+    """
+
+    def __init__(self, session_id: str, message_id: int) -> None:
+        self.session_id = session_id
+        self.message_id = message_id
+        self._seen: Optional[int] = None
+
+    def poll(self) -> Optional[Dict[str, object]]:
+        """非阻塞检查：本进程没有任务完成过时不访问数据库，适合在流式循环中调用。"""
+        with _job_finished:
+            current = _finished_count
+        if current == self._seen:
+            return None
+        self._seen = current
+        job = database.get_evaluation_job(self.session_id, self.message_id)
+        if job and job["status"] in FINAL_JOB_STATUSES:
+            return serialize_job(job)
+        return None
+
+    def wait(self, timeout: float) -> Optional[Dict[str, object]]:
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.poll()
+            if job:
+                return job
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            with _job_finished:
+                changed = _job_finished.wait_for(
+                    lambda: _finished_count != self._seen,
+                    timeout=min(remaining, EVALUATION_POLL_INTERVAL),
+                )
+            if not changed:
+                # 可能由其他进程完成，强制下一轮回查数据库
+                self._seen = None
+
+
+def serialize_job(job: Optional[Dict[str, object]]) -> Optional[Dict[str, object]]:
+    if not job:
+        return None
+    return {
+        "jobId": job["id"],
+        "sessionId": job["sessionId"],
+        "messageId": job["messageId"],
+        "status": job["status"],
+        "evaluation": job.get("evaluation"),
+    }
+
+
+def _worker_loop() -> None:
+    while True:
+        try:
+            job = database.claim_next_evaluation_job()
+        except Exception:  # pragma: no cover - 数据库暂不可用时稍后重试
+            logger.exception("Failed to claim evaluation job")
+            job = None
+        if not job:
+            _wakeup.wait(EVALUATION_POLL_INTERVAL)
+            _wakeup.clear()
+            continue
+        _run_job(job)
+
+
+def _run_job(job: Dict[str, object]) -> None:
+    job_id = int(job["id"])
+    session_id = str(job["sessionId"])
+    try:
+        session = database.get_session(session_id)
+        if not session:
+            database.fail_evaluation_job(job_id, "Session not found", retry=False)
+            return
+        evaluation = evaluate_session(
+            session_id, session, upto_message_id=int(job["messageId"])
+        )
+        database.complete_evaluation_job(job_id, evaluation)
+    except Exception as exc:  # pragma: no cover - 容忍评估失败
+        logger.exception("Evaluation job %s failed", job_id)
+        retry = int(job.get("attempts") or 0) < EVALUATION_MAX_ATTEMPTS
+        database.fail_evaluation_job(job_id, str(exc), retry=retry)
+    finally:
+        _notify_finished()
+
+
+def _notify_finished() -> None:
+    global _finished_count
+    with _job_finished:
+        _finished_count += 1
+        _job_finished.notify_all()
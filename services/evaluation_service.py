@@ -2,15 +2,23 @@
 
 from __future__ import annotations
 
-from typing import Dict
+import hashlib
+from typing import Dict, Optional
 
 import database
-from services.document_composer import build_transcript
-from services.llm_service import complete_chat
+from services.llm_service import complete_chat, forget_cached_response
+from services.transcript_cache import snapshot_session_transcript
+from services.usage_ledger import UsageLabels
 from utils.validators import MissingKeyError, extract_json_block, require_key
 
 
-def evaluate_session(session_id: str, session: Dict[str, object]) -> Dict[str, object]:
+def evaluate_session(
+    session_id: str,
+    session: Dict[str, object],
+    *,
+    upto_message_id: Optional[int] = None,
+) -> Dict[str, object]:
+    """评估会话表现；指定 upto_message_id 时只评估截至该条消息的逐字稿。"""
     try:
         critic_key = require_key("DEEPSEEK_CRITIC_KEY")
     except MissingKeyError:
@@ -26,12 +34,24 @@ def evaluate_session(session_id: str, session: Dict[str, object]) -> Dict[str, o
 
     scenario = session.get("scenario", {})
     scenario_knowledge = scenario.get("knowledge_points", []) or []
-    history_rows = database.get_messages(session_id)
-    transcript_history = [
-        {"role": row["role"], "content": row["content"]} for row in history_rows
-    ]
-    transcript = build_transcript(transcript_history, scenario)
+    snapshot = snapshot_session_transcript(session_id, scenario, upto_message_id)
+    transcript = snapshot.text
     evaluation_prompt = session.get("evaluation_prompt", "")
+    transcript_hash = hashlib.sha256(
+        f"{evaluation_prompt}\x1f{transcript}".encode("utf-8")
+    ).hexdigest()
+
+    # 逐字稿与评估提示均未变化时直接沿用上一次的评估结果
+    latest = database.get_latest_evaluation(session_id)
+    if latest and latest.get("transcriptHash") == transcript_hash:
+        return {
+            "score": latest["score"],
+            "scoreLabel": latest["scoreLabel"],
+            "commentary": latest["commentary"],
+            "actionItems": latest["actionItems"],
+            "knowledgePoints": latest["knowledgePoints"],
+            "bargainingWinRate": latest["bargainingWinRate"],
+        }
 
     messages = [
         {"role": "system", "content": str(evaluation_prompt)},
@@ -42,9 +62,17 @@ def evaluate_session(session_id: str, session: Dict[str, object]) -> Dict[str, o
     ]
 
     try:
-        raw = complete_chat(critic_key, messages, temperature=0.2)
+        raw = complete_chat(
+            critic_key,
+            messages,
+            temperature=0.2,
+            cache=True,
+            usage=UsageLabels.for_session("critic", session),
+        )
         data = extract_json_block(raw)
     except Exception:  # pragma: no cover - 容忍评估失败
+        # 无法解析的回复不能留在缓存里，否则重试会一直命中同一结果
+        forget_cached_response(messages, 0.2)
         return {
             "score": None,
             "scoreLabel": None,
@@ -73,7 +101,16 @@ def evaluate_session(session_id: str, session: Dict[str, object]) -> Dict[str, o
         "bargainingWinRate": bargaining_win_rate,
     }
 
-    database.save_evaluation(session_id, result)
+    # 截止消息已被撤回（如回复生成失败），这份评估对应的逐字稿不再存在，不予保存
+    if upto_message_id is not None and not database.message_exists(session_id, upto_message_id):
+        return result
+
+    database.save_evaluation(
+        session_id,
+        result,
+        last_message_id=snapshot.last_message_id or None,
+        transcript_hash=transcript_hash,
+    )
     if session.get("assignment_id"):
         database.mark_assignment_completed_by_session(session_id)
     return result
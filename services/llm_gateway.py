@@ -0,0 +1,408 @@
+"""异步大模型网关：按 Key 限制并发与速率，自动抖动重试，并在上游饱和时给出明确的繁忙信号。"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import os
+import queue
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+import httpx
+from flask import Response, jsonify
+from openai import APIConnectionError, APIStatusError, APITimeoutError, AsyncOpenAI
+
+from services.llm_service import (
+    DEEPSEEK_BASE,
+    LLM_CONNECT_TIMEOUT,
+    LLM_KEEPALIVE_EXPIRY,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE_CONNECTIONS,
+    LLM_TIMEOUT,
+    MODEL,
+    complete_with_cache,
+)
+from services.usage_ledger import UsageLabels, record_usage
+
+GATEWAY_CONCURRENCY = int(os.getenv("LLM_GATEWAY_CONCURRENCY", "8"))
+GATEWAY_RATE_PER_SECOND = float(os.getenv("LLM_GATEWAY_RATE", "5"))
+GATEWAY_BURST = int(os.getenv("LLM_GATEWAY_BURST", "10"))
+GATEWAY_MAX_QUEUE = int(os.getenv("LLM_GATEWAY_MAX_QUEUE", "64"))
+GATEWAY_QUEUE_TIMEOUT = float(os.getenv("LLM_GATEWAY_QUEUE_TIMEOUT", "30"))
+GATEWAY_MAX_ATTEMPTS = int(os.getenv("LLM_GATEWAY_MAX_ATTEMPTS", "4"))
+GATEWAY_BACKOFF_BASE = float(os.getenv("LLM_GATEWAY_BACKOFF_BASE", "0.5"))
+GATEWAY_BACKOFF_CAP = float(os.getenv("LLM_GATEWAY_BACKOFF_CAP", "8"))
+
+_STREAM_END = object()
+
+
+class GatewayBusyError(RuntimeError):
+    """排队已满或等待超时时抛出，调用方应提示用户稍后重试。"""
+
+    def __init__(self, message: str, retry_after: float = 5.0) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def busy_response(exc: GatewayBusyError) -> Response:
+    """把 GatewayBusyError 转换为带 Retry-After 的 503 响应，供各蓝图共用。"""
+    response = jsonify({"error": str(exc), "busy": True})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(int(round(exc.retry_after)))
+    return response
+
+
+class TokenBucket:
+    """令牌桶限流：平均速率为 rate，允许 capacity 的突发。"""
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        self.rate = max(rate, 0.001)
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, deadline: float) -> bool:
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            wait = (1 - self.tokens) / self.rate
+            if time.monotonic() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+
+@dataclass
+class _KeyLane:
+    semaphore: asyncio.Semaphore
+    bucket: TokenBucket
+    waiting: int = 0
+    clients: Dict[str, AsyncOpenAI] = field(default_factory=dict)
+
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, (APIConnectionError, APITimeoutError)):
+        return True
+    if isinstance(exc, APIStatusError):
+        return exc.status_code == 429 or exc.status_code >= 500
+    return False
+
+
+def _record_in_background(
+    labels: Optional[UsageLabels],
+    messages: List[Dict[str, str]],
+    completion: str,
+    reported: object,
+) -> None:
+    """记账写库放到默认线程池，避免阻塞网关事件循环。"""
+    if labels is None:
+        return
+    asyncio.get_running_loop().run_in_executor(
+        None,
+        functools.partial(
+            record_usage, labels, model=MODEL, messages=messages, completion=completion, reported=reported
+        ),
+    )
+
+
+def _retry_delay(exc: Exception, attempt: int) -> float:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    retry_after = headers.get("retry-after") if hasattr(headers, "get") else None
+    if retry_after:
+        try:
+            return min(float(retry_after), GATEWAY_BACKOFF_CAP)
+        except ValueError:
+            pass
+    # Full jitter，避免同一时刻被限流的请求同时重试
+    return random.uniform(0, min(GATEWAY_BACKOFF_CAP, GATEWAY_BACKOFF_BASE * (2 ** attempt)))
+
+
+class LLMGateway:
+    """在单一事件循环中调度所有上游调用，每个 API Key 独立排队。"""
+
+    def __init__(
+        self,
+        *,
+        concurrency: int = GATEWAY_CONCURRENCY,
+        rate_per_second: float = GATEWAY_RATE_PER_SECOND,
+        burst: int = GATEWAY_BURST,
+        max_queue: int = GATEWAY_MAX_QUEUE,
+        queue_timeout: float = GATEWAY_QUEUE_TIMEOUT,
+        max_attempts: int = GATEWAY_MAX_ATTEMPTS,
+    ) -> None:
+        self.concurrency = max(concurrency, 1)
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_attempts = max(max_attempts, 1)
+        self._lanes: Dict[str, _KeyLane] = {}
+
+    def _lane(self, api_key: str) -> _KeyLane:
+        lane = self._lanes.get(api_key)
+        if lane is None:
+            lane = _KeyLane(
+                semaphore=asyncio.Semaphore(self.concurrency),
+                bucket=TokenBucket(self.rate_per_second, self.burst),
+            )
+            self._lanes[api_key] = lane
+        return lane
+
+    def _client(self, lane: _KeyLane, api_key: str, base_url: str) -> AsyncOpenAI:
+        client = lane.clients.get(base_url)
+        if client is None:
+            client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                max_retries=0,
+                http_client=httpx.AsyncClient(
+                    timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+                    limits=httpx.Limits(
+                        max_connections=LLM_MAX_CONNECTIONS,
+                        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+                    ),
+                ),
+            )
+            lane.clients[base_url] = client
+        return client
+
+    async def _admit(self, lane: _KeyLane) -> None:
+        if lane.waiting >= self.max_queue:
+            raise GatewayBusyError("LLM gateway queue is full, please retry shortly")
+        deadline = time.monotonic() + self.queue_timeout
+        lane.waiting += 1
+        try:
+            try:
+                await asyncio.wait_for(lane.semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError as exc:
+                raise GatewayBusyError("LLM gateway is saturated, please retry shortly") from exc
+            if not await lane.bucket.acquire(deadline):
+                lane.semaphore.release()
+                raise GatewayBusyError("LLM gateway rate limit reached, please retry shortly")
+        finally:
+            lane.waiting -= 1
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """各 Key 的排队与占用情况，Key 仅保留末尾四位。"""
+        return {
+            f"...{api_key[-4:]}": {
+                "waiting": lane.waiting,
+                "available": lane.semaphore._value,  # noqa: SLF001 - 仅用于观测
+            }
+            for api_key, lane in self._lanes.items()
+        }
+
+    async def complete_chat(
+        self,
+        api_key: str,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        *,
+        base_url: str = DEEPSEEK_BASE,
+        usage: Optional[UsageLabels] = None,
+    ) -> str:
+        lane = self._lane(api_key)
+        client = self._client(lane, api_key, base_url)
+        for attempt in range(self.max_attempts):
+            await self._admit(lane)
+            try:
+                response = await client.chat.completions.create(
+                    model=MODEL,
+                    messages=messages,
+                    temperature=temperature,
+                )
+            except Exception as exc:
+                if attempt + 1 >= self.max_attempts or not _is_retryable(exc):
+                    raise
+                delay = _retry_delay(exc, attempt)
+            else:
+                if not response.choices:
+                    raise RuntimeError("Empty response from chat completion API")
+                content = response.choices[0].message.content or ""
+                _record_in_background(usage, messages, content, getattr(response, "usage", None))
+                return content
+            finally:
+                lane.semaphore.release()
+            await asyncio.sleep(delay)
+        raise RuntimeError("LLM gateway exhausted retries")  # pragma: no cover - 循环内已返回或抛出
+
+    async def stream_chat(
+        self,
+        api_key: str,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        *,
+        base_url: str = DEEPSEEK_BASE,
+        usage: Optional[UsageLabels] = None,
+    ) -> AsyncIterator[str]:
+        lane = self._lane(api_key)
+        client = self._client(lane, api_key, base_url)
+        extra = {"stream_options": {"include_usage": True}} if usage is not None else {}
+        for attempt in range(self.max_attempts):
+            await self._admit(lane)
+            emitted = False
+            parts: List[str] = []
+            reported = None
+            try:
+                stream = await client.chat.completions.create(
+                    model=MODEL,
+                    messages=messages,
+                    temperature=temperature,
+                    stream=True,
+                    **extra,
+                )
+                async for chunk in stream:
+                    if getattr(chunk, "usage", None) is not None:
+                        reported = chunk.usage
+                    for choice in chunk.choices or []:
+                        delta = getattr(choice, "delta", None)
+                        if delta and getattr(delta, "content", None):
+                            emitted = True
+                            parts.append(delta.content)
+                            yield delta.content
+                _record_in_background(usage, messages, "".join(parts), reported)
+                return
+            except Exception as exc:
+                # 已向调用方输出内容后不再重试，避免回复重复
+                if emitted or attempt + 1 >= self.max_attempts or not _is_retryable(exc):
+                    raise
+                delay = _retry_delay(exc, attempt)
+            finally:
+                lane.semaphore.release()
+            await asyncio.sleep(delay)
+
+
+_gateway: Optional[LLMGateway] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+_loop_pid: Optional[int] = None
+
+
+def _ensure_loop() -> asyncio.AbstractEventLoop:
+    """网关运行在独立的后台事件循环线程中，供同步的 Flask 视图共享。"""
+    global _gateway, _loop, _loop_pid
+    with _loop_lock:
+        if _loop is not None and _loop_pid == os.getpid() and _loop.is_running():
+            return _loop
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def _run() -> None:
+            asyncio.set_event_loop(loop)
+            loop.call_soon(ready.set)
+            loop.run_forever()
+
+        threading.Thread(target=_run, name="llm-gateway-loop", daemon=True).start()
+        ready.wait()
+        _loop = loop
+        _loop_pid = os.getpid()
+        _gateway = LLMGateway()
+        return loop
+
+
+def get_gateway() -> LLMGateway:
+    _ensure_loop()
+    assert _gateway is not None
+    return _gateway
+
+
+async def complete_chat(
+    api_key: str,
+    messages: List[Dict[str, str]],
+    temperature: float = 0.7,
+    *,
+    usage: Optional[UsageLabels] = None,
+) -> str:
+    loop = _ensure_loop()
+    future = asyncio.run_coroutine_threadsafe(
+        get_gateway().complete_chat(api_key, messages, temperature, usage=usage), loop
+    )
+    return await asyncio.wrap_future(future)
+
+
+async def stream_chat(
+    api_key: str,
+    messages: List[Dict[str, str]],
+    temperature: float = 0.7,
+    *,
+    usage: Optional[UsageLabels] = None,
+) -> AsyncIterator[str]:
+    iterator = stream_chat_blocking(api_key, messages, temperature, usage=usage)
+    while True:
+        item = await asyncio.to_thread(next, iterator, _STREAM_END)
+        if item is _STREAM_END:
+            return
+        yield item
+
+
+def complete_chat_blocking(
+    api_key: str,
+    messages: List[Dict[str, str]],
+    temperature: float = 0.7,
+    *,
+    cache: bool = False,
+    usage: Optional[UsageLabels] = None,
+) -> str:
+    """同步调用入口，阻塞直至网关返回结果或抛出 GatewayBusyError。"""
+    if cache:
+        return complete_with_cache(
+            messages,
+            temperature,
+            lambda: complete_chat_blocking(api_key, messages, temperature, usage=usage),
+        )
+    loop = _ensure_loop()
+    future = asyncio.run_coroutine_threadsafe(
+        get_gateway().complete_chat(api_key, messages, temperature, usage=usage), loop
+    )
+    return future.result()
+
+
+def stream_chat_blocking(
+    api_key: str,
+    messages: List[Dict[str, str]],
+    temperature: float = 0.7,
+    *,
+    usage: Optional[UsageLabels] = None,
+) -> Iterator[str]:
+    """同步流式入口，逐块产出增量文本。"""
+    loop = _ensure_loop()
+    buffer: "queue.Queue[object]" = queue.Queue()
+
+    async def _pump() -> None:
+        try:
+            async for delta in get_gateway().stream_chat(
+                api_key, messages, temperature, usage=usage
+            ):
+                buffer.put(delta)
+        except BaseException as exc:  # noqa: BLE001 - 转交给消费线程抛出
+            buffer.put(exc)
+        finally:
+            buffer.put(_STREAM_END)
+
+    future = asyncio.run_coroutine_threadsafe(_pump(), loop)
+
+    def _iterate() -> Iterator[str]:
+        try:
+            while True:
+                item = buffer.get()
+                if item is _STREAM_END:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item  # type: ignore[misc]
+        finally:
+            future.cancel()
+
+    return _iterate()
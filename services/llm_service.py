@@ -2,20 +2,287 @@
 
 from __future__ import annotations
 
-from typing import Dict, List
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
 
+import httpx
 from openai import OpenAI
 
+from services.usage_ledger import UsageLabels, record_usage
+
 DEEPSEEK_BASE = "https://api.deepseek.com"
 MODEL = "deepseek-chat"
 
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "off").strip().lower()
+LLM_CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH", os.path.join(os.path.dirname(os.path.dirname(__file__)), "llm_cache.db")
+)
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+
+_clients: Dict[Tuple[str, str], OpenAI] = {}
+_clients_lock = threading.Lock()
+
+
+def create_client(api_key: str, base_url: str = DEEPSEEK_BASE) -> OpenAI:
+    """构建带连接池的客户端；一般应通过 get_client 复用。"""
+    http_client = httpx.Client(
+        timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+    )
+    return OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        max_retries=LLM_MAX_RETRIES,
+        http_client=http_client,
+    )
+
+
+def get_client(api_key: str, base_url: str = DEEPSEEK_BASE) -> OpenAI:
+    """按 (api_key, base_url) 复用进程级客户端，保持长连接并可跨线程共享。"""
+    cache_key = (api_key, base_url)
+    client = _clients.get(cache_key)
+    if client is not None:
+        return client
+    with _clients_lock:
+        client = _clients.get(cache_key)
+        if client is None:
+            client = create_client(api_key, base_url)
+            _clients[cache_key] = client
+        return client
+
+
+def close_clients() -> None:
+    """关闭所有缓存的客户端连接池，主要用于测试或进程退出。"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+class MemoryResponseStore:
+    """进程内 LRU 存储，重启后失效。"""
+
+    def __init__(self, max_entries: int, ttl: float) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] + self.ttl <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteResponseStore:
+    """本地 SQLite 文件存储，多个进程可共享命中结果。"""
+
+    def __init__(self, path: str, max_entries: int, ttl: float) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache(last_used_at)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] + self.ttl <= now:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_used_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO llm_cache (key, response, created_at, last_used_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    response = excluded.response,
+                    created_at = excluded.created_at,
+                    last_used_at = excluded.last_used_at
+                """,
+                (key, value, now, now),
+            )
+            self._conn.execute(
+                """
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+
+class ResponseCache:
+    """以 (model, messages, temperature) 的哈希为键缓存确定性调用的回复。"""
+
+    def __init__(self, store) -> None:
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(model: str, messages: List[Dict[str, str]], temperature: float) -> str:
+        payload = json.dumps(
+            {"model": model, "messages": messages, "temperature": temperature},
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def fetch(self, key: str, compute: Callable[[], str]) -> str:
+        cached = self.store.get(key)
+        with self._lock:
+            if cached is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if cached is not None:
+            return cached
+        value = compute()
+        if value:
+            self.store.set(key, value)
+        return value
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "backend": type(self.store).__name__,
+            "hits": hits,
+            "misses": misses,
+            "hitRate": round(hits / total, 4) if total else None,
+        }
+
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """按 LLM_CACHE_BACKEND 构建缓存；默认关闭时返回 None。"""
+    global _response_cache
+    if LLM_CACHE_BACKEND not in {"memory", "sqlite"}:
+        return None
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                if LLM_CACHE_BACKEND == "sqlite":
+                    store = SQLiteResponseStore(LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL)
+                else:
+                    store = MemoryResponseStore(LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL)
+                _response_cache = ResponseCache(store)
+    return _response_cache
+
+
+def complete_with_cache(
+    messages: List[Dict[str, str]], temperature: float, compute: Callable[[], str]
+) -> str:
+    """缓存启用时先查缓存，未命中再调用 compute 并写回。"""
+    cache = get_response_cache()
+    if cache is None:
+        return compute()
+    return cache.fetch(ResponseCache.key_for(MODEL, messages, temperature), compute)
+
 
-def create_client(api_key: str) -> OpenAI:
-    return OpenAI(api_key=api_key, base_url=DEEPSEEK_BASE)
+def forget_cached_response(messages: List[Dict[str, str]], temperature: float) -> None:
+    """调用方发现缓存的回复不可用（例如无法解析）时将其剔除。"""
+    cache = get_response_cache()
+    if cache is not None:
+        cache.store.delete(ResponseCache.key_for(MODEL, messages, temperature))
 
 
-def complete_chat(api_key: str, messages: List[Dict[str, str]], temperature: float = 0.7) -> str:
-    client = create_client(api_key)
+def complete_chat(
+    api_key: str,
+    messages: List[Dict[str, str]],
+    temperature: float = 0.7,
+    *,
+    cache: bool = False,
+    usage: Optional[UsageLabels] = None,
+) -> str:
+    """usage 指定时记录本次调用的 token 用量；命中缓存的调用不计费也不记录。"""
+    if cache:
+        return complete_with_cache(
+            messages,
+            temperature,
+            lambda: complete_chat(api_key, messages, temperature, usage=usage),
+        )
+    client = get_client(api_key)
     response = client.chat.completions.create(
         model=MODEL,
         messages=messages,
@@ -23,19 +290,48 @@ def complete_chat(api_key: str, messages: List[Dict[str, str]], temperature: flo
     )
     if not response.choices:
         raise RuntimeError("Empty response from chat completion API")
-    return response.choices[0].message.content or ""
+    content = response.choices[0].message.content or ""
+    if usage is not None:
+        record_usage(
+            usage,
+            model=MODEL,
+            messages=messages,
+            completion=content,
+            reported=getattr(response, "usage", None),
+        )
+    return content
 
 
-def stream_chat(api_key: str, messages: List[Dict[str, str]], temperature: float = 0.7):
-    client = create_client(api_key)
+def stream_chat(
+    api_key: str,
+    messages: List[Dict[str, str]],
+    temperature: float = 0.7,
+    *,
+    usage: Optional[UsageLabels] = None,
+):
+    client = get_client(api_key)
+    extra = {"stream_options": {"include_usage": True}} if usage is not None else {}
     stream = client.chat.completions.create(
         model=MODEL,
         messages=messages,
         temperature=temperature,
         stream=True,
+        **extra,
     )
-    for chunk in stream:
-        for choice in chunk.choices or []:
-            delta = getattr(choice, "delta", None)
-            if delta and getattr(delta, "content", None):
-                yield delta.content
+    parts: List[str] = []
+    reported = None
+    try:
+        for chunk in stream:
+            # 开启 include_usage 后，最后一个分块只携带 usage，choices 为空
+            if getattr(chunk, "usage", None) is not None:
+                reported = chunk.usage
+            for choice in chunk.choices or []:
+                delta = getattr(choice, "delta", None)
+                if delta and getattr(delta, "content", None):
+                    parts.append(delta.content)
+                    yield delta.content
+    finally:
+        if usage is not None:
+            record_usage(
+                usage, model=MODEL, messages=messages, completion="".join(parts), reported=reported
+            )
@@ -11,7 +11,9 @@ from models.scenario import Scenario
 from utils.normalizers import normalize_company, normalize_product, normalize_text_list
 from utils.validators import MissingKeyError, extract_json_block, first_non_empty, require_key
 
-from services.llm_service import complete_chat
+from services.llm_gateway import complete_chat_blocking
+from services.llm_service import forget_cached_response
+from services.usage_ledger import UsageLabels
 
 DEFAULT_DIFFICULTY = "balanced"
 DIFFICULTY_PROFILES: Dict[str, Dict[str, str]] = {
@@ -509,28 +511,35 @@ def assemble_scenario_from_blueprint(
     return scenario, profile
 
 
-def generate_scenario_for_section(section: Dict[str, object], difficulty_key: str) -> Tuple[Dict[str, object], Dict[str, str]]:
+def is_static_section(section: Dict[str, object]) -> bool:
     marker = str(section.get("environment_prompt_template") or "").strip()
-    if marker == STATIC_SCENARIO_MARKER:
-        raw_payload = section.get("environment_user_message")
-        if not isinstance(raw_payload, str) or not raw_payload.strip():
-            raise MissingKeyError("Static scenario JSON is missing")
-        try:
-            scenario_raw = json.loads(raw_payload)
-        except json.JSONDecodeError as exc:  # pragma: no cover - defensive
-            raise MissingKeyError(f"Invalid static scenario JSON: {exc}") from exc
-        scenario_obj = Scenario.from_dict(scenario_raw)
-        scenario_dict = scenario_obj.to_dict()
-        scenario_dict, profile = apply_difficulty_profile(scenario_dict, difficulty_key)
-        return scenario_dict, profile
+    return marker == STATIC_SCENARIO_MARKER
 
-    generator_key = require_key("DEEPSEEK_GENERATOR_KEY")
+
+def load_static_scenario(
+    section: Dict[str, object], difficulty_key: str
+) -> Tuple[Dict[str, object], Dict[str, str]]:
+    raw_payload = section.get("environment_user_message")
+    if not isinstance(raw_payload, str) or not raw_payload.strip():
+        raise MissingKeyError("Static scenario JSON is missing")
+    try:
+        scenario_raw = json.loads(raw_payload)
+    except json.JSONDecodeError as exc:  # pragma: no cover - defensive
+        raise MissingKeyError(f"Invalid static scenario JSON: {exc}") from exc
+    scenario_obj = Scenario.from_dict(scenario_raw)
+    scenario_dict = scenario_obj.to_dict()
+    scenario_dict, profile = apply_difficulty_profile(scenario_dict, difficulty_key)
+    return scenario_dict, profile
+
+
+def build_generation_messages(section: Dict[str, object]) -> List[Dict[str, str]]:
+    """组装场景生成请求，供一次性调用与流式调用共用。"""
     system_prompt = section.get("environment_prompt_template")
     user_prompt = section.get("environment_user_message")
     if not system_prompt or not user_prompt:
         raise MissingKeyError("Section is missing prompt templates")
 
-    messages = [
+    return [
         {"role": "system", "content": str(system_prompt)},
         {
             "role": "user",
@@ -549,11 +558,40 @@ def generate_scenario_for_section(section: Dict[str, object], difficulty_key: st
             ),
         },
     ]
-    raw_response = complete_chat(generator_key, messages, temperature=0.8)
-    scenario = extract_json_block(raw_response)
+
+
+def finalize_generated_scenario(
+    section: Dict[str, object], scenario: Dict[str, object], difficulty_key: str
+) -> Tuple[Dict[str, object], Dict[str, str]]:
+    """对模型产出的原始场景做角色校正与难度处理。"""
     trade_role = infer_student_trade_role(section)
     scenario_obj = Scenario.from_dict(scenario)
     scenario_obj.ensure_chinese_role(trade_role)
     scenario_dict = scenario_obj.to_dict()
     scenario_dict, profile = apply_difficulty_profile(scenario_dict, difficulty_key)
     return scenario_dict, profile
+
+
+def generate_scenario_for_section(
+    section: Dict[str, object], difficulty_key: str, *, cache: bool = False
+) -> Tuple[Dict[str, object], Dict[str, str]]:
+    """cache=True 时复用相同模板的历史生成结果，仅用于教师预览，练习场景需要保持多样性。"""
+    if is_static_section(section):
+        return load_static_scenario(section, difficulty_key)
+
+    generator_key = require_key("DEEPSEEK_GENERATOR_KEY")
+    messages = build_generation_messages(section)
+    raw_response = complete_chat_blocking(
+        generator_key,
+        messages,
+        temperature=0.8,
+        cache=cache,
+        usage=UsageLabels.for_section("generator", section, difficulty_key),
+    )
+    try:
+        scenario = extract_json_block(raw_response)
+    except ValueError:
+        if cache:
+            forget_cached_response(messages, 0.8)
+        raise
+    return finalize_generated_scenario(section, scenario, difficulty_key)
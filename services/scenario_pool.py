@@ -0,0 +1,120 @@
+"""预生成场景池：按 (小节, 难度) 储备现成场景，开始练习时直接领取，后台线程负责补货。"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+
+import database
+from services.scenario_generator import (
+    DIFFICULTY_PROFILES,
+    generate_scenario_for_section,
+    get_difficulty_profile,
+    is_static_section,
+)
+from utils.validators import MissingKeyError, require_key
+
+logger = logging.getLogger(__name__)
+
+SCENARIO_POOL_SIZE = int(os.getenv("SCENARIO_POOL_SIZE", "3"))
+SCENARIO_POOL_WORKERS = int(os.getenv("SCENARIO_POOL_WORKERS", "2"))
+# 补货预留的有效期（秒），超时未完成的预留视为进程已退出，缺口重新计算
+SCENARIO_POOL_RESERVATION_TTL = int(os.getenv("SCENARIO_POOL_RESERVATION_TTL", "600"))
+
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+
+
+def template_hash(section: Dict[str, object]) -> str:
+    """场景只由环境生成模板决定，模板改动后旧库存自动失效。"""
+    payload = "\x1f".join(
+        [
+            str(section.get("environment_prompt_template") or ""),
+            str(section.get("environment_user_message") or ""),
+        ]
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_poolable(section: Dict[str, object]) -> bool:
+    if SCENARIO_POOL_SIZE <= 0:
+        return False
+    if is_static_section(section):
+        return False
+    return bool(section.get("environment_prompt_template") and section.get("environment_user_message"))
+
+
+def take_scenario(
+    section: Dict[str, object], difficulty_key: str
+) -> Optional[Tuple[Dict[str, object], Dict[str, str]]]:
+    """领取一份预生成场景；库存不足时返回 None，并在后台补足。"""
+    if not is_poolable(section):
+        return None
+    section_id = str(section["id"])
+    digest = template_hash(section)
+    scenario = database.claim_pooled_scenario(section_id, difficulty_key, digest)
+    schedule_refill(section, difficulty_key)
+    if scenario is None:
+        return None
+    return scenario, get_difficulty_profile(difficulty_key)
+
+
+def schedule_refill(section: Dict[str, object], difficulty_key: str) -> int:
+    """按缺口提交补货任务，返回本次新提交的任务数。"""
+    if not is_poolable(section):
+        return 0
+    try:
+        require_key("DEEPSEEK_GENERATOR_KEY")
+    except MissingKeyError:
+        return 0
+    section_id = str(section["id"])
+    digest = template_hash(section)
+    # 缺口在数据库中按“库存 + 未完成预留”计算，多个 worker 进程同时补货也不会超出目标
+    reservations = database.reserve_pool_refills(
+        section_id, difficulty_key, digest, SCENARIO_POOL_SIZE, SCENARIO_POOL_RESERVATION_TTL
+    )
+    if not reservations:
+        return 0
+    with _lock:
+        executor = _get_executor()
+    for reservation_id in reservations:
+        executor.submit(_refill_one, dict(section), difficulty_key, digest, reservation_id)
+    return len(reservations)
+
+
+def warm_pool(sections: Iterable[Dict[str, object]], difficulties: Optional[Iterable[str]] = None) -> int:
+    """为给定小节的各难度预先补满库存，例如在上课前调用。"""
+    keys = list(DIFFICULTY_PROFILES.keys() if difficulties is None else difficulties)
+    submitted = 0
+    for section in sections:
+        for difficulty_key in keys:
+            submitted += schedule_refill(section, difficulty_key)
+    return submitted
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ThreadPoolExecutor(
+            max_workers=max(1, SCENARIO_POOL_WORKERS), thread_name_prefix="scenario-pool"
+        )
+        _executor_pid = os.getpid()
+    return _executor
+
+
+def _refill_one(
+    section: Dict[str, object], difficulty_key: str, digest: str, reservation_id: int
+) -> None:
+    try:
+        scenario, _ = generate_scenario_for_section(section, difficulty_key)
+        database.add_pooled_scenario(
+            str(section["id"]), difficulty_key, digest, scenario, reservation_id=reservation_id
+        )
+    except Exception:  # pragma: no cover - 补货失败不影响在线请求
+        logger.exception("Failed to refill scenario pool for %s/%s", section.get("id"), difficulty_key)
+        database.release_pool_reservation(reservation_id)
@@ -0,0 +1,117 @@
+"""按会话缓存评估用逐字稿，每轮只拼接上次之后新增的消息。"""
+
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import database
+from services.document_composer import (
+    build_transcript_header,
+    format_transcript_line,
+    resolve_transcript_speaker,
+)
+
+TRANSCRIPT_CACHE_SIZE = int(os.getenv("TRANSCRIPT_CACHE_SIZE", "256"))
+
+
+@dataclass(frozen=True)
+class TranscriptSnapshot:
+    ai_name: str
+    text: str
+    last_message_id: int
+    message_count: int
+
+
+class TranscriptCache:
+    """以 LRU 方式保留最近活跃会话的逐字稿前缀。"""
+
+    def __init__(self, maxsize: int = TRANSCRIPT_CACHE_SIZE) -> None:
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, TranscriptSnapshot]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def build(self, session_id: str, scenario: Dict[str, object]) -> str:
+        return self.snapshot(session_id, scenario).text
+
+    def snapshot(
+        self,
+        session_id: str,
+        scenario: Dict[str, object],
+        upto_message_id: Optional[int] = None,
+    ) -> TranscriptSnapshot:
+        """返回逐字稿及其覆盖到的最后一条消息 ID；指定 upto_message_id 时不包含其后的消息。"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+        # 缓存已越过截止消息（重试或滞后的任务），缓存前缀会带入之后的消息，只能从头重建
+        if (
+            entry is not None
+            and upto_message_id is not None
+            and entry.last_message_id > upto_message_id
+        ):
+            entry = None
+        if entry is not None:
+            prefix_count, new_rows = database.get_messages_after(session_id, entry.last_message_id)
+            # 前缀条数不一致说明会话被重置或撤回过消息，整段重建
+            if prefix_count != entry.message_count:
+                entry = None
+        if entry is None:
+            ai_name = resolve_transcript_speaker(scenario)
+            entry = TranscriptSnapshot(
+                ai_name=ai_name,
+                text=build_transcript_header(scenario),
+                last_message_id=0,
+                message_count=0,
+            )
+            _, new_rows = database.get_messages_after(session_id, 0)
+
+        if upto_message_id is not None:
+            new_rows = [row for row in new_rows if int(row["id"]) <= upto_message_id]
+        if new_rows:
+            lines = [format_transcript_line(row, entry.ai_name) for row in new_rows]
+            entry = TranscriptSnapshot(
+                ai_name=entry.ai_name,
+                text="\n".join([entry.text, *lines]),
+                last_message_id=int(new_rows[-1]["id"]),
+                message_count=entry.message_count + len(new_rows),
+            )
+        self._store(session_id, entry)
+        return entry
+
+    def invalidate(self, session_id: str) -> None:
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _store(self, session_id: str, entry: TranscriptSnapshot) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            current: Optional[TranscriptSnapshot] = self._entries.get(session_id)
+            # 并发评估同一会话时只保留更新的版本
+            if current is not None and current.last_message_id > entry.last_message_id:
+                self._entries.move_to_end(session_id)
+                return
+            self._entries[session_id] = entry
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+transcript_cache = TranscriptCache()
+
+
+def build_session_transcript(session_id: str, scenario: Dict[str, object]) -> str:
+    return transcript_cache.build(session_id, scenario)
+
+
+def snapshot_session_transcript(
+    session_id: str, scenario: Dict[str, object], upto_message_id: Optional[int] = None
+) -> TranscriptSnapshot:
+    return transcript_cache.snapshot(session_id, scenario, upto_message_id)
@@ -0,0 +1,77 @@
+"""大模型调用的 token 记账：优先记录接口返回的 usage，缺失时使用离线估算。"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import database
+from utils.tokens import estimate_message_tokens, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class UsageLabels:
+    """一次调用的归属：用途（collab/critic/generator/rewrite/summary）及关联的会话与小节。"""
+
+    purpose: str
+    session_id: Optional[str] = None
+    chapter_id: Optional[str] = None
+    section_id: Optional[str] = None
+    difficulty: Optional[str] = None
+
+    @classmethod
+    def for_session(cls, purpose: str, session: Dict[str, object]) -> "UsageLabels":
+        return cls(
+            purpose=purpose,
+            session_id=session.get("id"),
+            chapter_id=session.get("chapter_id"),
+            section_id=session.get("section_id"),
+            difficulty=session.get("difficulty"),
+        )
+
+    @classmethod
+    def for_section(
+        cls, purpose: str, section: Dict[str, object], difficulty: Optional[str] = None
+    ) -> "UsageLabels":
+        return cls(
+            purpose=purpose,
+            chapter_id=section.get("chapter_id"),
+            section_id=section.get("id"),
+            difficulty=difficulty,
+        )
+
+
+def record_usage(
+    labels: UsageLabels,
+    *,
+    model: str,
+    messages: List[Dict[str, str]],
+    completion: str,
+    reported: object = None,
+) -> None:
+    """写入一条用量记录；记账失败只记日志，不影响业务调用。"""
+    estimated_prompt = estimate_message_tokens(messages)
+    prompt_tokens = getattr(reported, "prompt_tokens", None)
+    completion_tokens = getattr(reported, "completion_tokens", None)
+    is_estimated = prompt_tokens is None or completion_tokens is None
+    if is_estimated:
+        prompt_tokens = estimated_prompt
+        completion_tokens = estimate_tokens(completion)
+    try:
+        database.record_llm_usage(
+            purpose=labels.purpose,
+            model=model,
+            prompt_tokens=int(prompt_tokens),
+            completion_tokens=int(completion_tokens),
+            estimated_prompt_tokens=estimated_prompt,
+            is_estimated=is_estimated,
+            session_id=labels.session_id,
+            chapter_id=labels.chapter_id,
+            section_id=labels.section_id,
+            difficulty=labels.difficulty,
+        )
+    except Exception:  # pragma: no cover - 记账失败不影响主流程
+        logger.exception("Failed to record LLM usage for %s", labels.purpose)
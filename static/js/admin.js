@@ -38,6 +38,12 @@ function renderAdminStudentList() {
     li.appendChild(stats);
     adminStudentList.appendChild(li);
   });
+
+  if (state.admin.studentsPage.cursor) {
+    adminStudentList.appendChild(
+      createLoadMoreItem("students", state.admin.students.length, state.admin.studentsPage.total)
+    );
+  }
 }
 
 function renderAdminStudentDetail(detail) {
@@ -406,7 +412,7 @@ function updateBlueprintSectionOptions() {
   });
 }
 
-async function requestGeneratedScenario({ chapterId, sectionId, difficulty }) {
+async function requestGeneratedScenario({ chapterId, sectionId, difficulty, onField }) {
   if (!chapterId || !sectionId) {
     throw new Error("请先选择章节和小节");
   }
@@ -415,17 +421,80 @@ async function requestGeneratedScenario({ chapterId, sectionId, difficulty }) {
     sectionId,
     difficulty: (difficulty || "balanced").toLowerCase(),
   };
-  const response = await fetchWithAuth("/api/generator/scenario", {
-    method: "POST",
-    headers: { "Content-Type": "application/json" },
-    body: JSON.stringify(payload),
-  });
-  const data = await response.json().catch(() => ({}));
-  if (!response.ok) {
-    const message = data.error || "生成失败，请稍后重试";
-    throw new Error(message);
+  const streaming = typeof onField === "function";
+  const response = await fetchWithAuth(
+    streaming ? "/api/generator/scenario/stream" : "/api/generator/scenario",
+    {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+        Accept: streaming ? "text/event-stream" : "application/json",
+      },
+      body: JSON.stringify(payload),
+    },
+  );
+  if (!response.ok || !streaming || !response.body) {
+    const data = await response.json().catch(() => ({}));
+    if (!response.ok) {
+      const message = data.error || "生成失败，请稍后重试";
+      throw new Error(message);
+    }
+    return data;
+  }
+
+  // 逐个接收已闭合的顶层字段，先行渲染，最后以完整场景为准
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder("utf-8");
+  const partial = {};
+  let buffer = "";
+  let result = null;
+  const handleRawEvent = (rawEvent) => {
+    let eventType = "message";
+    const dataLines = [];
+    rawEvent.split("\n").forEach((line) => {
+      if (line.startsWith("event:")) {
+        eventType = line.slice(6).trim();
+      } else if (line.startsWith("data:")) {
+        dataLines.push(line.slice(5).trim());
+      }
+    });
+    let data = {};
+    try {
+      data = JSON.parse(dataLines.join("\n") || "{}");
+    } catch (error) {
+      return;
+    }
+    if (eventType === "field" && data.key) {
+      partial[data.key] = data.value;
+      onField({ ...partial }, data.key);
+    } else if (eventType === "scenario") {
+      result = data;
+    } else if (eventType === "error") {
+      throw new Error(data.error || "生成失败，请稍后重试");
+    }
+  };
+
+  while (true) {
+    const { value, done } = await reader.read();
+    buffer += done ? decoder.decode() : decoder.decode(value, { stream: true });
+    let separatorIndex = buffer.indexOf("\n\n");
+    while (separatorIndex !== -1) {
+      const rawEvent = buffer.slice(0, separatorIndex);
+      buffer = buffer.slice(separatorIndex + 2);
+      if (rawEvent.trim()) {
+        handleRawEvent(rawEvent);
+      }
+      separatorIndex = buffer.indexOf("\n\n");
+    }
+    if (done) break;
+  }
+  if (buffer.trim()) {
+    handleRawEvent(buffer.trim());
   }
-  return data;
+  if (!result) {
+    throw new Error("生成中断，请稍后重试");
+  }
+  return result;
 }
 
 function applyScenarioToAssignmentFields(scenario, difficultyKey) {
@@ -502,6 +571,14 @@ async function handleAssignmentScenarioGeneration() {
       chapterId,
       sectionId,
       difficulty: difficultyKey,
+      onField: (partial) => {
+        applyScenarioToAssignmentFields(partial, difficultyKey);
+        updateInlineStatus(
+          adminAssignmentGeneratorStatus,
+          `正在生成场景...（已完成 ${Object.keys(partial).length} 项）`,
+          "muted",
+        );
+      },
     });
     const scenario = data.scenario || {};
     const scenarioJson = JSON.stringify(scenario, null, 2);
@@ -549,6 +626,14 @@ async function handleBlueprintScenarioGeneration() {
       chapterId,
       sectionId,
       difficulty: difficultyKey,
+      onField: (partial) => {
+        applyScenarioToBlueprintFormFields(partial, difficultyKey);
+        updateInlineStatus(
+          adminBlueprintGeneratorStatus,
+          `正在生成蓝图...（已完成 ${Object.keys(partial).length} 项）`,
+          "muted",
+        );
+      },
     });
     const scenario = data.scenario || {};
     applyScenarioToBlueprintFormFields(scenario, data.difficulty || difficultyKey);
@@ -570,24 +655,24 @@ async function handleBlueprintScenarioGeneration() {
 
 function renderAssignmentStudents(options = {}) {
   if (!adminAssignmentStudents) return;
-  const existingChecked = Array.from(
-    adminAssignmentStudents.querySelectorAll("input[type='checkbox']:checked") || [],
-  ).map((input) => input.value);
-  let selectedIds = Array.isArray(options.selectedIds) ? options.selectedIds : existingChecked;
-  if ((!selectedIds || selectedIds.length === 0) && state.admin.selectedAssignmentId) {
-    const currentAssignment = findAdminAssignment(state.admin.selectedAssignmentId);
-    if (currentAssignment && Array.isArray(currentAssignment.studentIds)) {
-      selectedIds = currentAssignment.studentIds.map((value) => String(value));
-    }
+  const picker = state.admin.assignmentPicker;
+  if (Array.isArray(options.selectedIds)) {
+    picker.selectedIds = new Set(options.selectedIds.map((value) => String(value)));
   }
-  const selectedSet = new Set((selectedIds || []).map((value) => String(value)));
 
   adminAssignmentStudents.innerHTML = "";
-  const students = state.admin.students || [];
+  const students = picker.students || [];
   if (students.length === 0) {
-    adminAssignmentStudents.innerHTML = "<p>暂无学生名单，请先导入。</p>";
+    adminAssignmentStudents.innerHTML = picker.query
+      ? "<p>没有匹配的学生。</p>"
+      : "<p>暂无学生名单，请先导入。</p>";
     return;
   }
+  const summary = document.createElement("p");
+  summary.className = "px-2 pb-1 text-[11px] text-slate-500";
+  summary.dataset.pickerSummary = "true";
+  adminAssignmentStudents.appendChild(summary);
+  updateAssignmentPickerSummary();
   students.forEach((student) => {
     const label = document.createElement("label");
     label.className = "flex items-center gap-2 rounded-lg px-2 py-1 hover:bg-slate-800/60";
@@ -595,13 +680,53 @@ function renderAssignmentStudents(options = {}) {
     checkbox.type = "checkbox";
     checkbox.value = student.id;
     checkbox.className = "rounded border-slate-700 bg-slate-900 text-emerald-500 focus:ring-emerald-400";
-    checkbox.checked = selectedSet.has(String(student.id));
+    checkbox.checked = picker.selectedIds.has(String(student.id));
     label.appendChild(checkbox);
     const info = document.createElement("span");
     info.textContent = `${student.displayName || student.username}（${student.username}）`;
     label.appendChild(info);
     adminAssignmentStudents.appendChild(label);
   });
+
+  if (picker.cursor) {
+    adminAssignmentStudents.appendChild(
+      createLoadMoreItem("assignmentPicker", students.length, picker.total, "div")
+    );
+  }
+}
+
+function updateAssignmentPickerSummary() {
+  if (!adminAssignmentStudents) return;
+  const summary = adminAssignmentStudents.querySelector("[data-picker-summary]");
+  if (summary) {
+    summary.textContent = `已选择 ${state.admin.assignmentPicker.selectedIds.size} 名学生`;
+  }
+}
+
+// 勾选列表按关键字向服务端检索学生，已勾选的学生记录在 selectedIds 中，不随检索结果变化
+function loadAssignmentPickerStudents(cursor = null) {
+  if (!state.auth.user || state.auth.user.role !== "teacher") {
+    return;
+  }
+  const picker = state.admin.assignmentPicker;
+  try {
+    const response = await fetchWithAuth(
+      buildListUrl("/api/admin/students", cursor, { q: picker.query })
+    );
+    if (!response.ok) {
+      throw new Error("无法加载学生名单");
+    }
+    const data = await response.json();
+    const students = data.students || [];
+    picker.students = cursor ? picker.students.concat(students) : students;
+    updatePageState(picker, data, Boolean(cursor));
+    renderAssignmentStudents();
+  } catch (error) {
+    console.error(error);
+    if (adminAssignmentStatus) {
+      adminAssignmentStatus.textContent = error.message || "加载学生名单失败";
+    }
+  }
 }
 
 function renderAssignmentList() {
@@ -635,6 +760,16 @@ function renderAssignmentList() {
     `;
     adminAssignmentList.appendChild(li);
   });
+
+  if (state.admin.assignmentsPage.cursor) {
+    adminAssignmentList.appendChild(
+      createLoadMoreItem(
+        "assignments",
+        state.admin.assignments.length,
+        state.admin.assignmentsPage.total
+      )
+    );
+  }
 }
 
 function populateAssignmentForm(assignment) {
@@ -802,6 +937,16 @@ function renderStudentAssignments() {
     li.appendChild(wrapper);
     studentAssignmentListEl.appendChild(li);
   });
+
+  if (state.studentAssignmentsPage.cursor) {
+    studentAssignmentListEl.appendChild(
+      createLoadMoreItem(
+        "studentAssignments",
+        assignments.length,
+        state.studentAssignmentsPage.total
+      )
+    );
+  }
 }
 
 function renderAnalyticsList(container, items, formatItem, emptyText) {
@@ -1998,19 +2143,23 @@ async function saveAdminSection() {
 async function deleteAdminSection() {
 
 
-function loadAdminStudents() {
+function loadAdminStudents(cursor = null) {
   if (!state.auth.user || state.auth.user.role !== "teacher") {
     return;
   }
   try {
-    const response = await fetchWithAuth("/api/admin/students");
+    const response = await fetchWithAuth(buildListUrl("/api/admin/students", cursor));
     if (!response.ok) {
       throw new Error("无法加载学生数据");
     }
     const data = await response.json();
-    state.admin.students = data.students || [];
+    const students = data.students || [];
+    state.admin.students = cursor ? state.admin.students.concat(students) : students;
+    updatePageState(state.admin.studentsPage, data, Boolean(cursor));
     renderAdminStudentList();
-    renderAssignmentStudents();
+    if (!cursor) {
+      await loadAssignmentPickerStudents();
+    }
   } catch (error) {
     console.error(error);
     alert(error.message || "加载学生数据失败");
@@ -2108,17 +2257,24 @@ function loadAdminBlueprints() {
 
 
 
-function loadAdminAssignments() {
+function loadAdminAssignments(cursor = null) {
   if (!state.auth.user || state.auth.user.role !== "teacher") {
     return;
   }
   try {
-    const response = await fetchWithAuth("/api/assignments");
+    const response = await fetchWithAuth(buildListUrl("/api/assignments", cursor));
     if (!response.ok) {
       throw new Error("无法加载作业列表");
     }
     const data = await response.json();
-    state.admin.assignments = data.assignments || [];
+    const assignments = data.assignments || [];
+    state.admin.assignments = cursor ? state.admin.assignments.concat(assignments) : assignments;
+    updatePageState(state.admin.assignmentsPage, data, Boolean(cursor));
+    if (cursor) {
+      // 翻页只追加列表项，不重置正在编辑的作业表单
+      renderAssignmentList();
+      return;
+    }
     if (
       state.admin.selectedAssignmentId &&
       !state.admin.assignments.some((item) => item.id === state.admin.selectedAssignmentId)
@@ -2215,11 +2371,7 @@ function submitAssignment(event) {
   if (!state.auth.user || state.auth.user.role !== "teacher") {
     return;
   }
-  const students = Array.from(
-    adminAssignmentStudents ? adminAssignmentStudents.querySelectorAll("input[type='checkbox']") : []
-  )
-    .filter((input) => input.checked)
-    .map((input) => Number(input.value));
+  const students = Array.from(state.admin.assignmentPicker.selectedIds).map((value) => Number(value));
   let scenarioPayload = null;
   let scenarioSource = "";
   if (tokenEditors.assignmentScenario) {
@@ -2266,7 +2418,10 @@ function submitAssignment(event) {
     populateAssignmentForm(null);
     populateAssignmentChapterOptions();
     populateAssignmentBlueprintOptions();
-    renderAssignmentStudents();
+    if (state.admin.assignmentPicker.query) {
+      state.admin.assignmentPicker.query = "";
+      await loadAssignmentPickerStudents();
+    }
     await loadAdminAssignments();
   } catch (error) {
     console.error(error);
@@ -12,3 +12,39 @@ async function fetchWithAuth(url, options = {}) {
   return fetch(url, merged);
 }
 
+
+function buildListUrl(path, cursor, params = {}) {
+  const query = new URLSearchParams();
+  Object.entries(params).forEach(([key, value]) => {
+    if (value !== undefined && value !== null && value !== "") {
+      query.set(key, value);
+    }
+  });
+  if (cursor) {
+    query.set("cursor", cursor);
+  }
+  const text = query.toString();
+  return text ? `${path}?${text}` : path;
+}
+
+// 列表接口按游标分页，总数只在首页返回，翻页时沿用首页的值
+function updatePageState(page, data, append) {
+  page.cursor = data.nextCursor || null;
+  if (!append) {
+    page.total = typeof data.total === "number" ? data.total : null;
+  }
+}
+
+function createLoadMoreItem(listName, loadedCount, total, tagName = "li") {
+  const li = document.createElement(tagName);
+  li.className = "flex justify-center";
+  const button = document.createElement("button");
+  button.type = "button";
+  button.className =
+    "rounded-xl border border-slate-700 px-3 py-1 text-xs text-slate-300 transition hover:border-emerald-500 hover:text-white";
+  button.dataset.loadMore = listName;
+  button.textContent =
+    typeof total === "number" ? `加载更多（已显示 ${loadedCount} / ${total}）` : "加载更多";
+  li.appendChild(button);
+  return li;
+}
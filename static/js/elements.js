@@ -35,6 +35,7 @@ const adminAssignmentScenarioHost = document.getElementById(
   "admin-assignment-scenario-editor",
 );
 const adminAssignmentStudents = document.getElementById("admin-assignment-students");
+const adminAssignmentStudentSearch = document.getElementById("admin-assignment-student-search");
 const adminAssignmentGenerateBtn = document.getElementById("admin-assignment-generate");
 const adminAssignmentGeneratorStatus = document.getElementById("admin-assignment-generator-status");
 const adminBlueprintList = document.getElementById("admin-blueprint-list");
@@ -141,6 +141,10 @@ if (refreshSessionsBtn) {
 
 if (sessionHistoryList) {
   sessionHistoryList.addEventListener("click", (event) => {
+    if (event.target.closest("button[data-load-more]")) {
+      loadSessions(state.sessionsPage.cursor);
+      return;
+    }
     const button = event.target.closest("button[data-session-id]");
     if (!button) return;
     const sessionId = button.dataset.sessionId;
@@ -246,6 +250,10 @@ if (adminTabButtons) {
 
 if (adminStudentList) {
   adminStudentList.addEventListener("click", (event) => {
+    if (event.target.closest("button[data-load-more]")) {
+      loadAdminStudents(state.admin.studentsPage.cursor);
+      return;
+    }
     const button = event.target.closest("button[data-student-id]");
     if (!button) return;
     const studentId = button.dataset.studentId;
@@ -275,8 +283,48 @@ if (adminAssignmentSection) {
   });
 }
 
+if (adminAssignmentStudents) {
+  adminAssignmentStudents.addEventListener("change", (event) => {
+    const checkbox = event.target.closest("input[type='checkbox']");
+    if (!checkbox) return;
+    const selectedIds = state.admin.assignmentPicker.selectedIds;
+    if (checkbox.checked) {
+      selectedIds.add(String(checkbox.value));
+    } else {
+      selectedIds.delete(String(checkbox.value));
+    }
+    updateAssignmentPickerSummary();
+  });
+  adminAssignmentStudents.addEventListener("click", (event) => {
+    if (event.target.closest("button[data-load-more]")) {
+      loadAssignmentPickerStudents(state.admin.assignmentPicker.cursor);
+    }
+  });
+}
+
+if (adminAssignmentStudentSearch) {
+  let searchTimer = null;
+  adminAssignmentStudentSearch.addEventListener("input", () => {
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(() => {
+      state.admin.assignmentPicker.query = adminAssignmentStudentSearch.value.trim();
+      loadAssignmentPickerStudents();
+    }, 300);
+  });
+  // 搜索框位于作业表单内，回车不应提交表单
+  adminAssignmentStudentSearch.addEventListener("keydown", (event) => {
+    if (event.key === "Enter") {
+      event.preventDefault();
+    }
+  });
+}
+
 if (adminAssignmentList) {
   adminAssignmentList.addEventListener("click", (event) => {
+    if (event.target.closest("button[data-load-more]")) {
+      loadAdminAssignments(state.admin.assignmentsPage.cursor);
+      return;
+    }
     const item = event.target.closest("li[data-assignment-id]");
     if (!item) return;
     selectAdminAssignment(item.dataset.assignmentId);
@@ -294,6 +342,10 @@ if (adminAssignmentList) {
 
 if (studentAssignmentListEl) {
   studentAssignmentListEl.addEventListener("click", (event) => {
+    if (event.target.closest("button[data-load-more]")) {
+      loadStudentAssignments(state.studentAssignmentsPage.cursor);
+      return;
+    }
     const button = event.target.closest("button[data-assignment-id]");
     if (!button) return;
     startAssignmentSession(button.dataset.assignmentId);
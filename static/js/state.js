@@ -9,6 +9,7 @@ function createInitialState() {
     scenario: null,
     messages: [],
     sessions: [],
+    sessionsPage: { cursor: null, total: null },
     selectedLevel: { chapterId: null, sectionId: null },
     activeLevel: { chapterId: null, sectionId: null, difficulty: "balanced" },
     isLevelSelectionCollapsed: false,
@@ -20,6 +21,7 @@ function createInitialState() {
     },
     admin: {
       students: [],
+      studentsPage: { cursor: null, total: null },
       selectedStudentId: null,
       selectedSessionId: null,
       studentDetail: null,
@@ -29,6 +31,14 @@ function createInitialState() {
       selectedEditorSectionId: null,
       blueprints: [],
       assignments: [],
+      assignmentsPage: { cursor: null, total: null },
+      assignmentPicker: {
+        students: [],
+        cursor: null,
+        total: null,
+        query: "",
+        selectedIds: new Set(),
+      },
       selectedBlueprintId: null,
       selectedAssignmentId: null,
       theory: {
@@ -39,6 +49,7 @@ function createInitialState() {
     },
     studentInsights: null,
     studentAssignments: [],
+    studentAssignmentsPage: { cursor: null, total: null },
     levelVictories: new Set(),
   };
 }
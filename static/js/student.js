@@ -1110,18 +1110,16 @@ function markLevelVictory(chapterId, sectionId) {
   renderLevelMap();
 }
 
-function rebuildLevelVictories() {
+function rebuildLevelVictories(victories) {
   if (!state.levelVictories || !(state.levelVictories instanceof Set)) {
     state.levelVictories = new Set();
   }
   const next = new Set();
-  (state.sessions || []).forEach((session) => {
-    if (!session || !session.chapterId || !session.sectionId) {
+  (victories || []).forEach((victory) => {
+    if (!victory || !victory.chapterId || !victory.sectionId) {
       return;
     }
-    if (hasVictoryScore(session.latestEvaluation)) {
-      next.add(getLevelVictoryKey(session.chapterId, session.sectionId));
-    }
+    next.add(getLevelVictoryKey(victory.chapterId, victory.sectionId));
   });
 
   let changed = next.size !== state.levelVictories.size;
@@ -1629,6 +1627,12 @@ function renderSessionHistory() {
     li.appendChild(footer);
     sessionHistoryList.appendChild(li);
   });
+
+  if (state.sessionsPage.cursor) {
+    sessionHistoryList.appendChild(
+      createLoadMoreItem("sessions", state.sessions.length, state.sessionsPage.total)
+    );
+  }
 }
 
 
@@ -1675,25 +1679,43 @@ function loadLevels() {
 
 
 
-function loadSessions() {
+function loadSessions(cursor = null) {
   if (!state.auth.user || state.auth.user.role !== "student") {
     return;
   }
   try {
-    const response = await fetchWithAuth("/api/sessions");
+    const response = await fetchWithAuth(buildListUrl("/api/sessions", cursor));
     if (!response.ok) {
       throw new Error("无法加载历史会话");
     }
     const data = await response.json();
-    state.sessions = data.sessions || [];
-    rebuildLevelVictories();
+    const sessions = data.sessions || [];
+    state.sessions = cursor ? state.sessions.concat(sessions) : sessions;
+    updatePageState(state.sessionsPage, data, Boolean(cursor));
     renderSessionHistory();
+    if (!cursor) {
+      await loadLevelVictories();
+    }
   } catch (error) {
     console.error(error);
     alert(error.message || "加载历史会话失败");
   }
 }
 
+// 通关标记由服务端按全部会话聚合，不受历史列表分页影响
+async function loadLevelVictories() {
+  try {
+    const response = await fetchWithAuth("/api/student/victories");
+    if (!response.ok) {
+      throw new Error("无法加载通关记录");
+    }
+    const data = await response.json();
+    rebuildLevelVictories(data.victories || []);
+  } catch (error) {
+    console.error(error);
+  }
+}
+
 
 
 function loadStudentDashboardInsights() {
@@ -1749,17 +1771,19 @@ function loadStudentSession(sessionId) {
 
 
 
-function loadStudentAssignments() {
+function loadStudentAssignments(cursor = null) {
   if (!state.auth.user || state.auth.user.role !== "student") {
     return;
   }
   try {
-    const response = await fetchWithAuth("/api/student/assignments");
+    const response = await fetchWithAuth(buildListUrl("/api/student/assignments", cursor));
     if (!response.ok) {
       throw new Error("无法获取作业列表");
     }
     const data = await response.json();
-    state.studentAssignments = data.assignments || [];
+    const assignments = data.assignments || [];
+    state.studentAssignments = cursor ? state.studentAssignments.concat(assignments) : assignments;
+    updatePageState(state.studentAssignmentsPage, data, Boolean(cursor));
     renderStudentAssignments();
     updateAssignmentShortcut();
     if (studentAssignmentStatus) {
@@ -1966,6 +1990,46 @@ function resetCurrentSession() {
 
 
 
+const EVALUATION_POLL_INTERVAL_MS = 1500;
+const EVALUATION_POLL_MAX_ATTEMPTS = 80;
+
+async function pollEvaluationJob(sessionId, messageId, attempt = 0) {
+  if (!sessionId || state.sessionId !== sessionId) {
+    return;
+  }
+  if (attempt >= EVALUATION_POLL_MAX_ATTEMPTS) {
+    evaluationCommentaryEl.textContent = "评估耗时较长，请稍后刷新会话查看。";
+    return;
+  }
+  try {
+    const response = await fetchWithAuth(
+      `/api/sessions/${sessionId}/evaluation?messageId=${encodeURIComponent(messageId)}`
+    );
+    if (!response.ok) {
+      throw new Error("无法获取评估结果");
+    }
+    const data = await response.json();
+    const job = data.job || {};
+    if (state.sessionId !== sessionId) {
+      return;
+    }
+    if (job.status === "done") {
+      renderEvaluation(job.evaluation || null);
+      await loadSessions();
+      await loadStudentAssignments();
+      await loadStudentDashboardInsights();
+      return;
+    }
+    if (job.status === "failed") {
+      evaluationCommentaryEl.textContent = "评估暂时无法提供，请稍后再试。";
+      return;
+    }
+  } catch (error) {
+    console.warn(error);
+  }
+  setTimeout(() => pollEvaluationJob(sessionId, messageId, attempt + 1), EVALUATION_POLL_INTERVAL_MS);
+}
+
 function sendMessage() {
   if (!state.auth.user || state.auth.user.role !== "student") {
     alert("请使用学生账号体验对话");
@@ -1990,6 +2054,7 @@ function sendMessage() {
 
   let fullReply = "";
   let evaluationResult = null;
+  let pendingEvaluationJob = null;
   let shouldTerminate = false;
   let streamError = null;
 
@@ -2033,6 +2098,10 @@ function sendMessage() {
     } else if (eventType === "evaluation") {
       evaluationResult = payload.evaluation || null;
       renderEvaluation(evaluationResult);
+      // 并行评估模式下结果随流推送，无需再轮询
+      pendingEvaluationJob = null;
+    } else if (eventType === "evaluation_pending") {
+      pendingEvaluationJob = payload.job || null;
     } else if (eventType === "error") {
       streamError = new Error(payload.error || "对话失败");
       shouldTerminate = true;
@@ -2120,9 +2189,14 @@ function sendMessage() {
       updateMessageContent(assistantIndex, fullReply);
     }
 
-    await loadSessions();
-    await loadStudentAssignments();
-    await loadStudentDashboardInsights();
+    if (pendingEvaluationJob) {
+      evaluationCommentaryEl.textContent = "AI 正在评估本轮表现...";
+      pollEvaluationJob(state.sessionId, pendingEvaluationJob.messageId);
+    } else {
+      await loadSessions();
+      await loadStudentAssignments();
+      await loadStudentDashboardInsights();
+    }
   } catch (error) {
     console.error(error);
     state.messages.splice(assistantIndex, 1);
@@ -0,0 +1,95 @@
+"""增量解析流式输出的 JSON 对象，顶层字段一旦闭合即可取出。"""
+
+from __future__ import annotations
+
+import json
+from typing import List, Optional, Tuple
+
+
+class JsonObjectStreamParser:
+    """逐块喂入模型输出，返回新闭合的顶层 (键, 值)。
+
+    只跟踪最外层对象的结构：嵌套对象、数组与字符串整体视为一个值，
+    在其后的逗号或右花括号出现时才交给 ``json.loads`` 解析。对象之前的
+    Markdown 代码块标记等前缀会被忽略。
+    """
+
+    def __init__(self) -> None:
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._reading_key = False
+        self._key_start: Optional[int] = None
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+        self.finished = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, object]]:
+        if self.finished or not chunk:
+            return []
+        self._buffer += chunk
+        fields: List[Tuple[str, object]] = []
+        buffer = self._buffer
+        index = self._pos
+        while index < len(buffer) and not self.finished:
+            char = buffer[index]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._reading_key:
+                        self._reading_key = False
+                        self._key = self._decode(buffer[self._key_start : index + 1])
+            elif self._depth == 0:
+                if char == "{":
+                    self._depth = 1
+            elif char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._key is None and self._value_start is None:
+                    self._reading_key = True
+                    self._key_start = index
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit(buffer[self._value_start or index : index], fields)
+                    self.finished = True
+            elif self._depth == 1:
+                if char == ":" and self._key is not None and self._value_start is None:
+                    self._value_start = index + 1
+                elif char == ",":
+                    self._emit(buffer[self._value_start or index : index], fields)
+            index += 1
+        self._pos = index
+        return fields
+
+    @property
+    def text(self) -> str:
+        return self._buffer
+
+    def _emit(self, raw_value: str, fields: List[Tuple[str, object]]) -> None:
+        key = self._key
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+        if key is None or not raw_value.strip():
+            return
+        try:
+            fields.append((key, json.loads(raw_value)))
+        except ValueError:
+            # 单个字段格式异常时跳过，最终仍以完整解析结果为准
+            return
+
+    @staticmethod
+    def _decode(raw: str) -> Optional[str]:
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return None
+        return value if isinstance(value, str) else None
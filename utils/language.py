@@ -1,22 +1,36 @@
 """语言检测与文本过滤工具，确保对话输出符合英文要求。"""
 from __future__ import annotations
 
+import re
 from typing import Optional
 
+# 中日韩统一表意文字（含扩展 A 区与 B 区），正则在 C 层扫描，长文本远快于逐字符判断
+CJK_PATTERN = re.compile("[\u3400-\u4dbf\u4e00-\u9fff\U00020000-\U0002a6df]")
+
 
 def contains_cjk(text: Optional[str]) -> bool:
     """快速判断文本中是否包含中日韩字符。"""
     if not isinstance(text, str):
         return False
-    for char in text:
-        codepoint = ord(char)
-        if 0x3400 <= codepoint <= 0x4DBF:
-            return True
-        if 0x4E00 <= codepoint <= 0x9FFF:
-            return True
-        if 0x20000 <= codepoint <= 0x2A6DF:
-            return True
-    return False
+    return CJK_PATTERN.search(text) is not None
+
+
+def first_cjk_offset(text: Optional[str]) -> int:
+    """返回第一个中日韩字符的位置，不存在时返回 -1。"""
+    if not isinstance(text, str):
+        return -1
+    match = CJK_PATTERN.search(text)
+    return match.start() if match else -1
+
+
+def cjk_ratio(text: Optional[str]) -> float:
+    """中日韩字符占非空白字符的比例。"""
+    if not isinstance(text, str):
+        return 0.0
+    visible = len("".join(text.split()))
+    if visible <= 0:
+        return 0.0
+    return len(CJK_PATTERN.findall(text)) / visible
 
 
 def is_probably_english(text: Optional[str]) -> bool:
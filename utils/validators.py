@@ -4,7 +4,7 @@ from __future__ import annotations
 
 import json
 import os
-from typing import Dict, Iterable
+from typing import Dict, Iterable, Mapping
 
 
 class MissingKeyError(RuntimeError):
@@ -33,6 +33,40 @@ def as_bool(value: object, default: bool = False) -> bool:
     return default
 
 
+def page_query_args(args: Mapping[str, str]) -> Dict[str, object]:
+    """读取列表接口的 limit 与 cursor 参数，limit 非整数时抛出 ValueError。"""
+    result: Dict[str, object] = {"cursor": (args.get("cursor") or "").strip() or None}
+    raw_limit = (args.get("limit") or "").strip()
+    if raw_limit:
+        try:
+            result["limit"] = int(raw_limit)
+        except ValueError:
+            raise ValueError("limit must be an integer") from None
+    return result
+
+
+# 查询参数名到数据库列表函数关键字参数的映射
+_LIST_FILTER_ARGS = {
+    "chapterId": "chapter_id",
+    "sectionId": "section_id",
+    "difficulty": "difficulty",
+    "status": "status",
+    "from": "date_from",
+    "to": "date_to",
+}
+
+
+def list_filter_args(args: Mapping[str, str], allowed: Iterable[str]) -> Dict[str, str]:
+    """提取列表筛选参数，只保留接口支持且非空的项。"""
+    allowed_set = set(allowed)
+    result: Dict[str, str] = {}
+    for name, keyword in _LIST_FILTER_ARGS.items():
+        value = (args.get(name) or "").strip()
+        if value and name in allowed_set:
+            result[keyword] = value
+    return result
+
+
 def first_non_empty(mapping: Dict[str, object], keys: Iterable[str]) -> str:
     """返回第一个非空字符串字段，便于清洗外部输入。"""
     for key in keys: